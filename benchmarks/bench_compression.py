@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+"""
+Compress time, decompress time and ratio of every registered compressor, for pickled results.
+
+    PYTHONPATH=lib python benchmarks/bench_compression.py
+"""
+import datetime
+import os
+import pickle
+import timeit
+
+from py_auto_cache.compression import get_compressor, lz4_frame, zstandard
+
+NUMBER = 200
+
+RESULTS = [
+    ('rows (list of dicts)', [{'id': i, 'name': 'user{}'.format(i), 'email': 'user{}@example.com'.format(i),
+                               'active': i % 2 == 0, 'score': i * 1.5} for i in range(1000)]),
+    ('ints', list(range(10000))),
+    ('text', 'lorem ipsum dolor sit amet ' * 2000),
+    ('objects', [datetime.datetime(2020, 1, 1) + datetime.timedelta(days=i) for i in range(1000)]),
+    ('random bytes', os.urandom(20000)),
+]
+
+
+def main():
+    names = ['zlib'] + (['lz4'] if lz4_frame is not None else []) + (['zstd'] if zstandard is not None else [])
+    print('{:<22} {:<6} {:>14} {:>16} {:>10} {:>8}'.format('result', 'codec', 'compress (us)', 'decompress (us)',
+                                                           'bytes', 'ratio'))
+    for result_name, value in RESULTS:
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        print('{:<22} {:<6} {:>14} {:>16} {:>10} {:>8}'.format(result_name, 'none', '', '', len(data), ''))
+        for name in names:
+            compressor = get_compressor(name)
+            compressed = compressor.compress(data)
+            compress = timeit.timeit(lambda: compressor.compress(data), number=NUMBER) / NUMBER * 1e6
+            decompress = timeit.timeit(lambda: compressor.decompress(compressed), number=NUMBER) / NUMBER * 1e6
+            print('{:<22} {:<6} {:>14.1f} {:>16.1f} {:>10} {:>8.2f}'.format(
+                result_name, name, compress, decompress, len(compressed), float(len(data)) / len(compressed)))
+
+
+if __name__ == '__main__':
+    main()
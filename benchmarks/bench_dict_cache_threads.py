@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+"""
+Throughput of a DictCache shared by 1 to 32 threads, with one lock or with striped locks.
+
+Every thread runs a mix of get, set and increase on its own keys.
+
+    PYTHONPATH=lib python benchmarks/bench_dict_cache_threads.py
+"""
+import threading
+import time
+
+from py_auto_cache.caches import DictCache
+
+OPERATIONS = 20000
+
+
+def worker(cache, index, barrier):
+    keys = ['bench:{}:{}'.format(index, i) for i in range(100)]
+    barrier.wait()
+    for i in range(OPERATIONS):
+        key = keys[i % 100]
+        if i % 10 == 0:
+            cache.set(key, 'value', 60)
+        elif i % 10 == 1:
+            cache.increase(key + ':counter')
+        else:
+            cache.get(key)
+
+
+def run(shards, thread_count):
+    cache = DictCache(shards=shards)
+    barrier = threading.Barrier(thread_count + 1)
+    threads = [threading.Thread(target=worker, args=(cache, i, barrier)) for i in range(thread_count)]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    start_time = time.time()
+    for thread in threads:
+        thread.join()
+    return thread_count * OPERATIONS / (time.time() - start_time)
+
+
+def main():
+    print('{:>8} {:>18} {:>18}'.format('threads', '1 shard (ops/s)', '16 shards (ops/s)'))
+    for thread_count in (1, 2, 4, 8, 16, 32):
+        print('{:>8} {:>18.0f} {:>18.0f}'.format(thread_count, run(1, thread_count), run(16, thread_count)))
+
+
+if __name__ == '__main__':
+    main()
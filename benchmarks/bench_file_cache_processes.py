@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""
+Throughput of a FileCache root shared by 1 to 8 processes.
+
+Every process runs a mix of get, set and increase on keys shared by all of them,
+the shared counter is checked at the end so lost updates are reported.
+
+    PYTHONPATH=lib python benchmarks/bench_file_cache_processes.py
+"""
+import multiprocessing
+import shutil
+import tempfile
+import time
+
+from py_auto_cache.caches import FileCache
+
+OPERATIONS = 2000
+
+
+def worker(cache_root, barrier):
+    cache = FileCache(cache_root)
+    keys = ['bench:{}'.format(i) for i in range(100)]
+    barrier.wait()
+    for i in range(OPERATIONS):
+        key = keys[i % 100]
+        if i % 10 == 0:
+            cache.set(key, 'value', 60)
+        elif i % 10 == 1:
+            cache.increase('bench:counter')
+        else:
+            cache.get(key)
+
+
+def run(process_count):
+    cache_root = tempfile.mkdtemp()
+    try:
+        barrier = multiprocessing.Barrier(process_count + 1)
+        processes = [multiprocessing.Process(target=worker, args=(cache_root, barrier))
+                     for _ in range(process_count)]
+        for process in processes:
+            process.start()
+        barrier.wait()
+        start_time = time.time()
+        for process in processes:
+            process.join()
+        ops = process_count * OPERATIONS / (time.time() - start_time)
+        counter = int(FileCache(cache_root).get('bench:counter'))
+        return ops, counter == process_count * OPERATIONS // 10
+    finally:
+        shutil.rmtree(cache_root)
+
+
+def main():
+    print('{:>10} {:>12} {:>10}'.format('processes', 'ops/s', 'counter'))
+    for process_count in (1, 2, 4, 8):
+        ops, ok = run(process_count)
+        print('{:>10} {:>12.0f} {:>10}'.format(process_count, ops, 'ok' if ok else 'LOST'))
+
+
+if __name__ == '__main__':
+    main()
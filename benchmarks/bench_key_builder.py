@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+"""
+Cost of building the argument part of a cache key, per call: pickle.dumps([args, kwargs])
+against KeyBuilder (bound to the signature, canonically encoded).
+
+Calls with scalar arguments take the marshal path of KeyBuilder, the others are encoded in python,
+and the signatures with **kwargs are bound by inspect.Signature.bind.
+
+    PYTHONPATH=lib python benchmarks/bench_key_builder.py
+"""
+import timeit
+from collections import namedtuple
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+from py_auto_cache.keys import KeyBuilder
+
+Point = namedtuple('Point', 'x y')
+
+CALLS = 100000
+
+
+def func(user_id, page=1, size=20, query=None, **filters):
+    pass
+
+
+def plain(user_id, page=1, size=20, query=None):
+    pass
+
+
+CASES = [
+    ('a few ints', plain, (42, 3), {}),
+    ('ints and keywords', plain, (42,), {'size': 50, 'query': 'name'}),
+    ('a list of strings', plain, (42, 1, 20, ['alpha', 'beta', 'gamma', 'delta']), {}),
+    ('a dict', plain, (42,), {'query': {'name': 'alpha', 'age': 30, 'tags': ['a', 'b']}}),
+    ('**kwargs', func, (42,), {'status': 'active', 'country': 'fr'}),
+    ('an object', plain, (Point(1, 2),), {}),
+]
+
+
+def main():
+    print('{:<20} {:>14} {:>14}'.format('arguments', 'pickle (us)', 'builder (us)'))
+    for name, function, args, kwargs in CASES:
+        builder = KeyBuilder(function)
+        pickle_time = timeit.timeit(lambda: pickle.dumps([args, kwargs]), number=CALLS)
+        builder_time = timeit.timeit(lambda: builder.build(args, kwargs), number=CALLS)
+        print('{:<20} {:>14.2f} {:>14.2f}'.format(name, pickle_time / CALLS * 1e6, builder_time / CALLS * 1e6))
+
+
+if __name__ == '__main__':
+    main()
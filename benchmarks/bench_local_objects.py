@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+"""
+Time of a hit on a large result: deserialized every time, kept deserialized by local_objects,
+and stored as a live object by DictCache(objects=True), shared or deep copied.
+
+    PYTHONPATH=lib python benchmarks/bench_local_objects.py
+"""
+import timeit
+
+from py_auto_cache.auto_cache import AutoCache
+from py_auto_cache.caches import DictCache
+
+NUMBER = 500
+
+CACHES = [
+    ('pickle every hit', AutoCache('bench_plain', 3600, DictCache())),
+    ('local_objects', AutoCache('bench_local', 3600, DictCache(), local_objects=100)),
+    ('objects', AutoCache('bench_objects', 3600, DictCache(objects=True))),
+    ('objects, copy_objects', AutoCache('bench_object_copies', 3600, DictCache(objects=True, copy_objects=True))),
+]
+
+
+def rows(count):
+    return [{'id': i, 'name': 'user{}'.format(i), 'email': 'user{}@example.com'.format(i),
+             'active': i % 2 == 0, 'score': i * 1.5} for i in range(count)]
+
+
+def main():
+    print('{:<22} {:>12}'.format('cache', 'hit (us)'))
+    for name, auto_cache in CACHES:
+        cached_rows = auto_cache.decorator(rows)
+        cached_rows(1000)
+        cached_rows(1000)
+        hit = timeit.timeit(lambda: cached_rows(1000), number=NUMBER) / NUMBER * 1e6
+        print('{:<22} {:>12.1f}'.format(name, hit))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+"""
+Encode time, decode time and payload size of every registered serializer, for representative results.
+
+A serializer which can't encode a result (eg: json with tuples or marshal with objects) shows n/a.
+
+    PYTHONPATH=lib python benchmarks/bench_serializers.py
+"""
+import datetime
+import timeit
+
+from py_auto_cache.serializers import get_serializer, msgpack
+
+NUMBER = 200
+
+RESULTS = [
+    ('rows (list of dicts)', [{'id': i, 'name': 'user{}'.format(i), 'email': 'user{}@example.com'.format(i),
+                               'active': i % 2 == 0, 'score': i * 1.5} for i in range(1000)]),
+    ('ints', list(range(10000))),
+    ('nested dict', dict(('key{}'.format(i), {'values': list(range(10)), 'label': 'x' * 20})
+                         for i in range(500))),
+    ('text', 'lorem ipsum dolor sit amet ' * 2000),
+    ('objects', [datetime.datetime(2020, 1, 1) + datetime.timedelta(days=i) for i in range(1000)]),
+]
+
+
+def main():
+    names = ['pickle', 'marshal', 'json'] + (['msgpack'] if msgpack is not None else [])
+    print('{:<22} {:<8} {:>12} {:>12} {:>10}'.format('result', 'codec', 'encode (us)', 'decode (us)', 'bytes'))
+    for result_name, value in RESULTS:
+        for name in names:
+            serializer = get_serializer(name)
+            try:
+                data = serializer.dumps(value)
+                if serializer.loads(data) != value:
+                    raise ValueError('not the same value')
+            except (TypeError, ValueError):
+                print('{:<22} {:<8} {:>12} {:>12} {:>10}'.format(result_name, name, 'n/a', 'n/a', 'n/a'))
+                continue
+            encode = timeit.timeit(lambda: serializer.dumps(value), number=NUMBER) / NUMBER * 1e6
+            decode = timeit.timeit(lambda: serializer.loads(data), number=NUMBER) / NUMBER * 1e6
+            print('{:<22} {:<8} {:>12.1f} {:>12.1f} {:>10}'.format(result_name, name, encode, decode, len(data)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,387 @@
+# -*- coding: utf-8 -*-
+"""
+Cache the results of coroutine functions decorated by AutoCache
+"""
+import asyncio
+import random
+import sys
+import time
+import uuid
+from functools import partial
+from logging import getLogger
+
+from .entry import Entry
+from .error import CacheMiss, ClientError, DoNotCacheException
+from .util import transcode
+
+logger = getLogger('py_auto_cache')
+
+
+class AsyncSingleFlight(object):
+    """
+    The asyncio counterpart of SingleFlight.
+
+    The first caller of a key becomes the leader and awaits the coroutine,
+    the callers arriving while it is running wait for the leader and share
+    its result (or its exception) instead of awaiting the coroutine again.
+    """
+
+    def __init__(self):
+        super(AsyncSingleFlight, self).__init__()
+        self._calls = {}
+
+    async def do(self, key, func, timeout=None):
+        """
+        Await func() once for all the concurrent callers of key in the running loop
+
+        :param key: any hashable object identifying the call
+        :param callable func: function without arguments returning an awaitable
+        :param float timeout: how long (in seconds) a waiter waits for the leader.
+                              None means wait forever. If the leader doesn't finish in time,
+                              or if it is cancelled, the waiter awaits func() by itself.
+        :return: a tuple of (value, shared), shared is True if the value came from another caller
+        :rtype: tuple
+        """
+        loop = asyncio.get_event_loop()
+        call_key = (loop, key)
+        future = self._calls.get(call_key)
+        if future is None:
+            future = self._calls[call_key] = loop.create_future()
+            try:
+                value = await func()
+            except asyncio.CancelledError:
+                future.cancel()
+                raise
+            except BaseException as e:
+                future.set_exception(e)
+                # mark the exception as retrieved, a leader without waiters must not be logged
+                future.exception()
+                raise
+            else:
+                future.set_result(value)
+            finally:
+                del self._calls[call_key]
+            return value, False
+
+        try:
+            return (await asyncio.wait_for(asyncio.shield(future), timeout)), True
+        except asyncio.TimeoutError:
+            pass
+        except asyncio.CancelledError:
+            if not future.cancelled():
+                raise
+        return (await func()), False
+
+    def in_flight(self):
+        """
+        Returns how many keys are being awaited right now
+
+        :rtype: int
+        """
+        return len(self._calls)
+
+
+class AsyncCaller(object):
+    """
+    Run the coroutine functions decorated by an AutoCache.
+
+    It follows the same steps as the blocking path of AutoCache (single flight,
+    lease, stale-while-revalidate, early recomputation), but talks to the cache
+    through the AsyncCache returned by Cache.to_async, so a hit never blocks the loop.
+    Stale entries are refreshed by tasks of the running loop instead of the refresh threads.
+    """
+
+    def __init__(self, auto_cache, max_refreshing=1000):
+        """
+        :param AutoCache auto_cache: the cache decorating the functions
+        :param int max_refreshing: how many stale entries can be refreshed at the same time,
+                                   refreshes are dropped after that
+        """
+        super(AsyncCaller, self).__init__()
+        self._auto_cache = auto_cache
+        self._max_refreshing = max_refreshing
+        self._cache = None
+        self._single_flight = AsyncSingleFlight()
+        # keep the refresh tasks referenced until they are done, the loop only keeps weak references
+        self._refreshing = {}
+
+    @property
+    def cache(self):
+        """
+        The AsyncCache of the cache wrapped by the AutoCache
+
+        :rtype: py_auto_cache.async_cache.AsyncCache
+        """
+        if self._cache is None:
+            self._cache = self._auto_cache._wrapped_cache.to_async()
+        return self._cache
+
+    def wrap(self, func):
+        """
+        Returns the coroutine function caching the results of func
+
+        :param func: a coroutine function already prepared by AutoCache.decorator
+        """
+
+        async def wrapper(*args, **kwargs):
+            force = kwargs.pop('update_auto_cache', False)
+            await self._load_generations(func)
+            try:
+                if force:
+                    raise CacheMiss(func, args, kwargs)  # pretend we there was a cache miss
+                return await self._read_cache(func, args, kwargs)
+            except CacheMiss as e:
+                if func.__single_flight__:
+                    return await self._update_cache_once(e.func, e.args, e.kwargs, force, e.built_key)
+                return await self._fill_cache(e.func, e.args, e.kwargs, force, e.built_key)
+
+        return wrapper
+
+    async def call_many(self, func, arg_list, *, update_auto_cache=False, concurrency=None):
+        """
+        Awaits the decorated function over many arguments, see AutoCache._call_many
+
+        The missed calls are awaited concurrently. The options are keyword only, like the ones of
+        the many function of a decorated function.
+
+        :param func: a coroutine function already prepared by AutoCache.decorator
+        :param list arg_list: the positional arguments of every call
+        :param bool update_auto_cache: await all the calls
+        :param int concurrency: how many calls are awaited at the same time, None means all of them
+        :return: the result of every call, in order
+        :rtype: list
+        """
+        auto_cache = self._auto_cache
+        await self._load_generations(func)
+        calls, keys, savings = auto_cache._many_keys(func, arg_list)
+        if update_auto_cache or not keys:
+            raw_values = [None] * len(keys)
+        else:
+            raw_values = await self.cache.multi_get([auto_cache._add_cache_namespace_to_key(key) for key in keys])
+        results, missing = auto_cache._read_many(
+            func, calls, keys, raw_values,
+            lambda i: self._submit_refresh(keys[i], func, calls[i], {}, (keys[i], savings[i])))
+        if not update_auto_cache:
+            hits = sum(1 for value_string in raw_values if value_string is not None)
+            if hits:
+                await self._count(auto_cache._hits_key, hits)
+            if len(keys) > hits:
+                await self._count(auto_cache._misses_key, len(keys) - hits)
+
+        missing_keys = list(missing)
+        semaphore = asyncio.Semaphore(concurrency) if concurrency else None
+
+        async def timed_call(args):
+            try:
+                if semaphore is None:
+                    return await _timed_await(func, args), None
+                async with semaphore:
+                    return await _timed_await(func, args), None
+            except Exception:
+                return None, sys.exc_info()
+
+        outcomes = await asyncio.gather(*[timed_call(calls[missing[key][0]]) for key in missing_keys])
+        mapping, time_costs, error = auto_cache._write_many(func, missing_keys, missing, outcomes, results)
+        if mapping:
+            saved, key_args = auto_cache._describe_many(func, calls, missing, mapping, savings)
+            await self.cache.multi_set(auto_cache._raw_mapping(mapping, time_costs, key_args),
+                                       auto_cache._default_expiry)
+            if saved:
+                await self._count(auto_cache._key_bytes_saved_key, saved)
+        if error is not None:
+            raise error[1].with_traceback(error[2])
+        return results
+
+    async def _load_generations(self, func):
+        """
+        Read the expired generations of the namespace and of the function through the AsyncCache,
+        so building the cache keys doesn't block the loop, see CacheWrapper._read_generations
+        """
+        auto_cache = self._auto_cache
+        expired = auto_cache._expired_generations([auto_cache._generation_key, func.__generation_key__])
+        if expired:
+            auto_cache._store_generations(expired, await self.cache.multi_get(expired))
+
+    async def _count(self, key, amount=1):
+        """
+        Increase a monitoring counter in the memory of the AutoCache, see AutoCache._count
+
+        The due counts are flushed through the AsyncCache, so the loop is not blocked.
+        """
+        counters = self._auto_cache._counters
+        if not counters.add(key, amount):
+            return
+        counts = list(counters.take().items())
+        results = await asyncio.gather(*[self.cache.increase(key, amount) for key, amount in counts],
+                                       return_exceptions=True)
+        failed = dict(count for count, result in zip(counts, results) if isinstance(result, ClientError))
+        if failed:
+            # they are flushed again next time
+            counters.restore(failed)
+            logger.warning('Failed to flush the counters of %s', self._auto_cache._namespace)
+        for result in results:
+            if isinstance(result, Exception) and not isinstance(result, ClientError):
+                raise result
+
+    async def _set(self, key, value, time_cost, key_args=None):
+        """
+        Writes the value and its time cost, like AutoCache.set
+        """
+        auto_cache = self._auto_cache
+        expire_seconds = auto_cache._default_expiry
+        pipe = self.cache.pipeline()
+        pipe.set(auto_cache._add_monitoring_namespace_to_key(auto_cache.time_cost_suffix, key),
+                 time_cost, expire_seconds)
+        pipe.set(auto_cache._add_cache_namespace_to_key(key), value, expire_seconds)
+        if key_args is not None:
+            pipe.set(auto_cache._add_monitoring_namespace_to_key(auto_cache.key_args_suffix, key),
+                     key_args, expire_seconds)
+        await pipe.execute()
+
+    async def _update_cache(self, func, args, kwargs, built_key=None):
+        """
+        Awaits the given function with given args and caches the result, see AutoCache._update_cache
+        """
+        try:
+            start_time = time.time()
+            value = await func(*args, **kwargs)  # evaluate the function
+            end_time = time.time()
+            time_cost = end_time - start_time
+            entry = self._auto_cache._create_entry(func, value, time_cost, end_time)
+            if built_key is None:
+                await self._load_generations(func)
+                built_key = self._auto_cache._build_cache_key(func, args, kwargs)
+            key, saved = built_key
+            reprs = self._auto_cache._describe_calls(func, [(args, kwargs)])
+            await self._set(key, entry.dumps(), time_cost, reprs and reprs[0])
+            if saved:
+                await self._count(self._auto_cache._key_bytes_saved_key, saved)
+        except DoNotCacheException as e:
+            return e.return_value
+        return value
+
+    async def _update_cache_once(self, func, args, kwargs, force=False, built_key=None):
+        """
+        Same as _fill_cache, but concurrent calls with the same cache key
+        only await the function once, the others share its result.
+        """
+        built_key = built_key or self._auto_cache._build_cache_key(func, args, kwargs)
+        value, shared = await self._single_flight.do(built_key[0],
+                                                     partial(self._fill_cache, func, args, kwargs, force, built_key),
+                                                     func.__wait_timeout__)
+        if shared:
+            await self._count(self._auto_cache._coalesced_key)
+        return value
+
+    async def _fill_cache(self, func, args, kwargs, force=False, built_key=None):
+        """
+        Awaits the given function and caches the result after a miss, see AutoCache._fill_cache
+        """
+        if force or func.__lease_timeout__ is None:
+            return await self._update_cache(func, args, kwargs, built_key)
+        return await self._update_cache_with_lease(func, args, kwargs, built_key)
+
+    async def _update_cache_with_lease(self, func, args, kwargs, built_key=None):
+        """
+        Awaits the given function only if we get the lease of its cache key,
+        see AutoCache._update_cache_with_lease
+        """
+        auto_cache = self._auto_cache
+        if built_key is None:
+            await self._load_generations(func)
+            built_key = auto_cache._build_cache_key(func, args, kwargs)
+        key = built_key[0]
+        raw_key = auto_cache._add_cache_namespace_to_key(key)
+        lease_key = auto_cache._add_monitoring_namespace_to_key(auto_cache.lease_suffix, key)
+        lease_timeout = func.__lease_timeout__
+        token = uuid.uuid4().hex
+        deadline = time.time() + lease_timeout
+        interval, max_interval = auto_cache.lease_poll_interval
+        while True:
+            if await self.cache.set(lease_key, token, lease_timeout, only_if_new=True):
+                try:
+                    return await self._update_cache(func, args, kwargs, built_key)
+                finally:
+                    await self._release_lease(lease_key, token)
+
+            await asyncio.sleep(random.uniform(interval / 2, interval))
+            value_string = await self.cache.get(raw_key)
+            entry = None if value_string is None else Entry.loads(value_string)
+            if entry is not None:
+                await self._count(auto_cache._coalesced_key)
+                return auto_cache._load_entry(entry)
+            if time.time() >= deadline:
+                return await self._update_cache(func, args, kwargs, built_key)
+            interval = min(interval * 2, max_interval)
+
+    async def _release_lease(self, lease_key, token):
+        """
+        Deletes the lease if it is still held by us
+        """
+        if transcode(await self.cache.get(lease_key) or '') == token:
+            await self.cache.delete([lease_key])
+
+    async def _refresh_cache(self, func, args, kwargs, built_key):
+        """
+        Awaits the given function in background to replace a stale result, see AutoCache._refresh_cache
+        """
+        auto_cache = self._auto_cache
+        try:
+            lease_timeout = func.__lease_timeout__
+            if lease_timeout is None:
+                await self._update_cache(func, args, kwargs, built_key)
+                return
+            lease_key = auto_cache._add_monitoring_namespace_to_key(auto_cache.lease_suffix, built_key[0])
+            token = uuid.uuid4().hex
+            if not await self.cache.set(lease_key, token, lease_timeout, only_if_new=True):
+                return
+            try:
+                await self._update_cache(func, args, kwargs, built_key)
+            finally:
+                await self._release_lease(lease_key, token)
+        except Exception:
+            logger.exception('Failed to refresh %r', func)
+
+    def _submit_refresh(self, key, func, args, kwargs, built_key):
+        """
+        Starts a refresh task of the key, unless it is already being refreshed
+        or too many keys are being refreshed.
+        """
+        if key in self._refreshing or len(self._refreshing) >= self._max_refreshing:
+            return False
+        task = asyncio.ensure_future(self._refresh_cache(func, args, kwargs, built_key))
+        self._refreshing[key] = task
+        task.add_done_callback(lambda _: self._refreshing.pop(key, None))
+        return True
+
+    async def _read_cache(self, func, args, kwargs):
+        """
+        Strictly tries to get an already cached result, see AutoCache._read_cache
+        """
+        auto_cache = self._auto_cache
+        built_key = auto_cache._build_cache_key(func, args, kwargs)
+        key = built_key[0]
+        value_string = await self.cache.get(auto_cache._add_cache_namespace_to_key(key))
+        entry = None if value_string is None else Entry.loads(value_string)
+        if entry is None:
+            await self._count(auto_cache._misses_key)
+            raise CacheMiss(func, args, kwargs, built_key)  # pretend we there was a cache miss
+        await self._count(auto_cache._hits_key)
+        if entry.is_stale():
+            self._submit_refresh(key, func, args, kwargs, built_key)
+        elif func.__early_recompute__ is not None and entry.should_recompute(func.__early_recompute__):
+            return await self._update_cache_once(func, args, kwargs, True, built_key)
+        return auto_cache._load_entry(entry, key)
+
+
+async def _timed_await(func, args):
+    """
+    Awaits func(*args) for AsyncCaller.call_many, see auto_cache._timed_call
+    """
+    start_time = time.time()
+    try:
+        value = await func(*args)
+    except DoNotCacheException as e:
+        return e.return_value, None, None
+    end_time = time.time()
+    return value, end_time - start_time, end_time
@@ -0,0 +1,257 @@
+# -*- coding: utf-8 -*-
+"""
+Asynchronous cache clients for asyncio
+"""
+import abc
+import asyncio
+import inspect
+from functools import partial
+from itertools import islice
+
+import six
+
+from .cache import Cache, Pipeline, _calculate_size
+from .error import ClientError
+from .util import StringTypes, wrap_client_exception
+
+
+def wrap_async_client_exception(src_exception_cls, dst_exception_cls=ClientError):
+    """
+    The coroutine version of wrap_client_exception, it wraps async generator functions as well
+
+    :param tuple|Exception src_exception_cls: The exceptions which you want to catch
+    :param Exception dst_exception_cls: Base exception class which you want to inherit from
+    :return: wrapper
+    """
+
+    @wrap_client_exception(src_exception_cls, dst_exception_cls)
+    def reraise(exception):
+        raise exception
+
+    def wrapper(func):
+        if inspect.isasyncgenfunction(func):
+            async def new_generator(*args, **kwargs):
+                try:
+                    async for item in func(*args, **kwargs):
+                        yield item
+                except src_exception_cls as e:
+                    reraise(e)
+
+            return new_generator
+
+        async def new_func(*args, **kwargs):
+            try:
+                return await func(*args, **kwargs)
+            except src_exception_cls as e:
+                reraise(e)
+
+        return new_func
+
+    return wrapper
+
+
+@six.add_metaclass(abc.ABCMeta)
+class AsyncCache(object):
+    """
+    The asyncio counterpart of Cache.
+
+    It has the same methods with the same meaning, but all of them are coroutines.
+    """
+
+    # how many keys are looked up, and cleared, at a time, see Cache.scan_batch
+    scan_batch = Cache.scan_batch
+
+    @abc.abstractmethod
+    async def get(self, key):
+        """
+        Get value for the given key, see Cache.get
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def set(self, key, value, expire_seconds=None, only_if_new=False, only_if_old=False):
+        """
+        Set value for the given key, see Cache.set
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def delete(self, keys):
+        """
+        Delete the given keys, see Cache.delete
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def get_keys(self, pattern='*'):
+        """
+        Get all keys that match the given pattern, see Cache.get_keys
+        """
+        raise NotImplementedError
+
+    async def iter_keys(self, pattern='*', batch=None):
+        """
+        Iterate the keys that match the given pattern, see Cache.iter_keys
+
+            async for key in cache.iter_keys('user:*'):
+                ...
+
+        :rtype: async iterator of str
+        """
+        for key in await self.get_keys(pattern):
+            yield key
+
+    async def increase(self, key, amount=1):
+        """
+        Increase value by amount, see Cache.increase
+        """
+        value = await self.get(key)
+        if value is None:
+            increased_value = str(amount)
+        elif isinstance(value, StringTypes) and value.isdigit():
+            increased_value = str(int(value) + amount)
+        else:
+            raise ValueError('Value({}) of key({}) is not an integer'.format(repr(value), repr(key)))
+        await self.set(key, increased_value)
+
+        return increased_value
+
+    async def multi_get(self, keys):
+        """
+        Get values using the given keys, see Cache.multi_get
+        """
+        return list(await asyncio.gather(*[self.get(key) for key in keys]))
+
+    async def multi_set(self, mapping, expire_seconds=None):
+        """
+        Set many values at once, see Cache.multi_set
+        """
+        pipe = self.pipeline()
+        for key, value in mapping.items():
+            pipe.set(key, value, expire_seconds)
+        return all(await pipe.execute())
+
+    async def multi_delete(self, keys):
+        """
+        Delete many keys at once, see Cache.multi_delete
+        """
+        pipe = self.pipeline()
+        for key in keys:
+            pipe.delete([key])
+        return [bool(count) for count in await pipe.execute()]
+
+    async def clear(self, pattern='*'):
+        """
+        Clear keys by the given pattern, see Cache.clear
+
+        The keys are deleted scan_batch at a time, as iter_keys finds them.
+        """
+        count = 0
+        keys = []
+        async for key in self.iter_keys(pattern, self.scan_batch):
+            keys.append(key)
+            if len(keys) >= self.scan_batch:
+                count += await self.delete(keys)
+                keys = []
+        if keys:
+            count += await self.delete(keys)
+        return count
+
+    async def memory_size(self, keys):
+        """
+        Returns the number of bytes being consumed in the cache by given keys, see Cache.memory_size
+        """
+        if keys:
+            values = await self.multi_get(keys)
+        else:
+            values = []
+
+        return _calculate_size(keys) + _calculate_size(values)
+
+    def pipeline(self):
+        """
+        Returns a Pipeline collecting writes, see Cache.pipeline
+
+            pipe = cache.pipeline()
+            pipe.set('a', '1')
+            pipe.increase('b')
+            results = await pipe.execute()
+
+        :rtype: Pipeline
+        """
+        return Pipeline(self)
+
+    async def _execute_pipeline(self, commands):
+        """
+        Execute the writes collected by a Pipeline, see Cache._execute_pipeline
+        """
+        return [await getattr(self, name)(*args) for name, args in commands]
+
+
+class ThreadedCache(AsyncCache):
+    """
+    Run a blocking Cache in threads, so it never blocks the event loop.
+
+    It is the way to use DictCache, FileCache and Dispatcher from coroutines.
+    """
+
+    def __init__(self, wrapped_cache, executor=None):
+        """
+        :param Cache wrapped_cache: the blocking cache to run
+        :param concurrent.futures.Executor executor: where to run it, None means the default executor of the loop
+        """
+        super(ThreadedCache, self).__init__()
+        assert isinstance(wrapped_cache, Cache), 'wrapped_cache must be instance of Cache'
+        self._wrapped_cache = wrapped_cache
+        self._executor = executor
+
+    async def _run(self, func, *args):
+        return await asyncio.get_event_loop().run_in_executor(self._executor, partial(func, *args))
+
+    async def get(self, key):
+        return await self._run(self._wrapped_cache.get, key)
+
+    async def set(self, key, value, expire_seconds=None, only_if_new=False, only_if_old=False):
+        return await self._run(self._wrapped_cache.set, key, value, expire_seconds, only_if_new, only_if_old)
+
+    async def delete(self, keys):
+        return await self._run(self._wrapped_cache.delete, keys)
+
+    async def get_keys(self, pattern='*'):
+        return await self._run(self._wrapped_cache.get_keys, pattern)
+
+    async def iter_keys(self, pattern='*', batch=None):
+        # the keys are taken from the iterator of the wrapped cache a batch at a time, in a thread
+        batch = batch or self.scan_batch
+        keys = self._wrapped_cache.iter_keys(pattern, batch)
+        while True:
+            chunk = await self._run(_take, keys, batch)
+            if not chunk:
+                return
+            for key in chunk:
+                yield key
+
+    async def increase(self, key, amount=1):
+        return await self._run(self._wrapped_cache.increase, key, amount)
+
+    async def multi_get(self, keys):
+        return await self._run(self._wrapped_cache.multi_get, keys)
+
+    async def multi_set(self, mapping, expire_seconds=None):
+        return await self._run(self._wrapped_cache.multi_set, mapping, expire_seconds)
+
+    async def multi_delete(self, keys):
+        return await self._run(self._wrapped_cache.multi_delete, keys)
+
+    async def clear(self, pattern='*'):
+        return await self._run(self._wrapped_cache.clear, pattern)
+
+    async def memory_size(self, keys):
+        return await self._run(self._wrapped_cache.memory_size, keys)
+
+    async def _execute_pipeline(self, commands):
+        return await self._run(self._wrapped_cache._execute_pipeline, commands)
+
+
+def _take(iterator, size):
+    return list(islice(iterator, size))
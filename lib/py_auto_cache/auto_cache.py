@@ -1,14 +1,36 @@
 # -*- coding: utf-8 -*-
+import hashlib
+import importlib
 import inspect
+import random
+import sys
+import threading
 import time
+import uuid
 from functools import partial
 
+import six
+
 try:
     import cPickle as pickle
 except ImportError:
     import pickle
 from .cache_wrapper import CacheWrapper
+from .caches import DictCache
+from .compression import get_compressor, decompress
+from .entry import Entry, NO_COMPRESSION, OBJECT_CODEC, VERSION
+from .keys import KeyBuilder, encode
+from .serializers import get_serializer, loads
 from .error import CacheMiss, DoNotCacheException
+from .refresh_pool import RefreshPool
+from .single_flight import SingleFlight
+from .util import chunks, cpu_clock, transcode
+
+try:
+    from .async_auto_cache import AsyncCaller
+except SyntaxError:
+    # asyncio is not supported by this python
+    AsyncCaller = None
 
 __all__ = [
     'get_auto_cache',
@@ -30,9 +52,51 @@ class AutoCache(CacheWrapper):
     Gives us a convenient way to use a decorator to cache any function-call.
 
     It is a subclass of Cache, which implements the namespaced caching."""
+    # the values are entries (see Entry), the workers of another entry format use other keys
+    cache_prefix = 'cache.v{}'.format(VERSION)
     time_cost_suffix = 'time_cost'
-
-    def __init__(self, namespace='default', default_expiry=None, wrapped_cache=None):
+    coalesced_suffix = 'coalesced'
+    lease_suffix = 'lease'
+    key_args_suffix = 'key_args'
+    key_bytes_saved_suffix = 'key_bytes_saved'
+
+    # how long (in seconds) a worker sleeps between two polls while another worker holds the lease,
+    # it starts from the first one and doubles until the second one
+    lease_poll_interval = (0.01, 0.2)
+
+    # how many threads refresh stale entries in background, and how many refreshes can wait for them
+    refresh_workers = 4
+    refresh_queue_size = 1000
+
+    # if True, the arguments are kept in the cache keys as a digest of key_digest_size bytes
+    # instead of their pickle, so the keys stay short whatever the arguments, see _get_cache_key.
+    # Arguments shorter than the hex digest are kept as they are.
+    hash_keys = False
+    key_digest_size = 16
+    # if True with hash_keys, the repr of the arguments of every written key is kept aside, see key_args
+    keep_key_args = False
+    # if True, the arguments are bound to the signature of the function and encoded canonically
+    # instead of pickled, so f(1, b=2) and f(1, 2) share their key, see KeyBuilder
+    normalize_keys = False
+    # how the results of the decorated functions are serialized: 'pickle', 'marshal', 'json', 'msgpack'
+    # or any registered serializer, see serializers. A function can choose its own, see decorator
+    serializer = 'pickle'
+    # how the serialized results of at least compression_threshold bytes are compressed: 'zlib', 'lz4', 'zstd'
+    # or any registered compressor, see compression. None stores them as they are.
+    # A result is stored as it is if compressing doesn't make it smaller
+    compression = None
+    compression_threshold = 1024
+    # if more than 0, up to local_objects results read are kept deserialized in this process, by their key
+    # and the etag of their entry, so a hit reading the same entry again skips its deserialization.
+    # The results are shared by the callers, which must not change them. Leave it to 0 if they do:
+    # deserializing gives every caller its own copy, cheaper than a deep copy.
+    # A wrapped cache storing objects needs none of it, see DictCache(objects=True)
+    local_objects = 0
+
+    def __init__(self, namespace='default', default_expiry=None, wrapped_cache=None,
+                 refresh_workers=None, refresh_queue_size=None, hash_keys=None, keep_key_args=None,
+                 normalize_keys=None, serializer=None, compression=None, compression_threshold=None,
+                 local_objects=None):
         """
         Sets up our cache with the given namespace.
 
@@ -45,6 +109,17 @@ class AutoCache(CacheWrapper):
                                     you can get some default implements in py_auto_cache.caches.*
                                     if you have other requirement,
                                     you can have your own implementation by inherit from Cache.
+        :param int refresh_workers: how many threads refresh stale entries, see decorator(soft_expiry)
+        :param int refresh_queue_size: how many stale entries can wait for a refresh thread,
+                                       refreshes are dropped when the queue is full
+        :param bool hash_keys: keep a digest of the arguments in the cache keys, see hash_keys
+        :param bool keep_key_args: keep the repr of the arguments of the hashed keys, see key_args
+        :param bool normalize_keys: build the keys from the arguments bound to the signature, see normalize_keys
+        :param serializer: the serializer of the results, its name or a Serializer, see serializer
+        :param compression: the compressor of the results, its name or a Compressor, False for none,
+                            see compression
+        :param int compression_threshold: the smallest serialized result (in bytes) to compress
+        :param int local_objects: how many deserialized results are kept in this process, see local_objects
         """
         super(AutoCache, self).__init__(
             namespace=namespace,
@@ -52,12 +127,42 @@ class AutoCache(CacheWrapper):
             wrapped_cache=wrapped_cache,
         )
         self._time_cost_keys_pattern = self._add_monitoring_namespace_to_key(self.time_cost_suffix, '*')
+        self._coalesced_key = self._add_monitoring_namespace_to_key(self.coalesced_suffix, '*')
+        self._key_bytes_saved_key = self._add_monitoring_namespace_to_key(self.key_bytes_saved_suffix, '*')
+        self._hash_keys = self.hash_keys if hash_keys is None else hash_keys
+        self._keep_key_args = self._hash_keys and (self.keep_key_args if keep_key_args is None else keep_key_args)
+        # the bytes saved by hash_keys on the last key built by the thread, see _build_cache_key
+        self._key_savings = threading.local()
+        self._normalize_keys = self.normalize_keys if normalize_keys is None else normalize_keys
+        self._serializer = get_serializer(self.serializer if serializer is None else serializer)
+        compression = self.compression if compression is None else compression
+        self._compressor = get_compressor(compression) if compression else None
+        self._compression_threshold = self.compression_threshold if compression_threshold is None \
+            else compression_threshold
+        # results are kept alive as they are by a cache storing objects, there is nothing to deserialize
+        self._stores_objects = self._wrapped_cache.stores_objects
+        local_objects = self.local_objects if local_objects is None else local_objects
+        self._local_objects = None
+        if local_objects and not self._stores_objects:
+            self._local_objects = DictCache(max_entries=local_objects, objects=True)
+
+        # single_flight makes concurrent misses of the same key in this process
+        # wait for one execution instead of executing the function again and again
+        self._single_flight = SingleFlight()
+        refresh_queue_size = self.refresh_queue_size if refresh_queue_size is None else refresh_queue_size
+        self._refresh_pool = RefreshPool(
+            self.refresh_workers if refresh_workers is None else refresh_workers,
+            refresh_queue_size,
+        )
+        # async_caller runs the decorated coroutine functions
+        self._async_caller = None if AsyncCaller is None else AsyncCaller(self, refresh_queue_size)
 
         # wrappers_map is used to keep track of what real functions were mapped
         # to what wrappers in the decorator
         self._wrappers_map = {}
 
-    def decorator(self, func=None, key=None):
+    def decorator(self, func=None, key=None, single_flight=True, wait_timeout=None, lease_timeout=None,
+                  soft_expiry=None, early_recompute=None, serializer=None):
         """
         A function decorator to wrap any other function in boilerplate code.
 
@@ -75,26 +180,92 @@ class AutoCache(CacheWrapper):
            function_name(..., update_auto_cache=True)
         to force it to evaluate the underlying function, and to update the
         cache again regardless of what is already in the cache.
+
+        A coroutine function (async def) is decorated by a coroutine function,
+        which awaits it and reads/writes the cache without blocking the event loop.
+
+        To call the function over many arguments, use:
+           function_name.many([(1, 2), (3, 4), ...])
+        which reads all the results with one multi_get, executes only the misses
+        and writes their results back with one multi_set, see _call_many.
+        Its options are keyword only: update_auto_cache, and executor (concurrency for
+        a coroutine function), so a call is never read differently by the other version.
+
+        To drop all the cached results of the function at once, use:
+           function_name.invalidate()
+        see invalidate_function.
+
+        :param callable key: build the cache key from the arguments instead of pickling all of them
+        :param bool single_flight: if True, concurrent misses of the same key in this process
+                                   will wait for one execution and share its result
+        :param float wait_timeout: how long (in seconds) a coalesced call waits for the executing one,
+                                   it executes the function by itself after that. None means wait forever.
+        :param float lease_timeout: if given, a miss must take a lease (living lease_timeout seconds)
+                                    in the wrapped cache before executing the function,
+                                    so only one worker of all the processes sharing this cache executes it.
+                                    The others poll the cache until the value comes, or until the lease
+                                    times out and they execute the function by themselves.
+        :param float soft_expiry: if given, a result older than soft_expiry seconds is stale:
+                                  it is still returned at once, and a refresh of it is queued to the
+                                  background refresh threads. The result is gone after default_expiry
+                                  seconds as usual, so soft_expiry should be less than default_expiry.
+        :param float early_recompute: if given, a reader may recompute a result before it expires,
+                                      with a probability growing as the result gets closer to its expiry
+                                      and with how long it took to compute (see Entry.should_recompute).
+                                      The value is the beta factor, 1.0 is a good start,
+                                      bigger values recompute earlier.
+        :param serializer: the serializer of the results of this function, the one of the AutoCache by default.
+                           Changing it needs no flush, every entry is read by the serializer which wrote it
         """
         if func is None:
-            return partial(self.decorator, key=key)
+            return partial(self.decorator, key=key, single_flight=single_flight, wait_timeout=wait_timeout,
+                           lease_timeout=lease_timeout, soft_expiry=soft_expiry, early_recompute=early_recompute,
+                           serializer=serializer)
         func.__bind_key__ = key
+        func.__single_flight__ = single_flight
+        func.__wait_timeout__ = wait_timeout
+        func.__lease_timeout__ = lease_timeout
+        func.__soft_expiry__ = soft_expiry
+        func.__early_recompute__ = early_recompute
+        func.__serializer__ = self._serializer if serializer is None else get_serializer(serializer)
         func.__full_cache_prefix__ = '{mn}{sep}{func}{sep}'.format(
             sep=self.sep,
             mn=inspect.getmodule(func).__name__,
             func=func.__name__,
         )
+        func.__generation_key__ = self._add_monitoring_namespace_to_key(self.generation_suffix,
+                                                                        func.__full_cache_prefix__)
+        func.__key_builder__ = KeyBuilder(func) if self._normalize_keys else None
 
         def wrapper(*args, **kwargs):
             # We allow users to force the wrapper to ignore any pre-existing
             # cache entry if they pass in the arg update_auto_cache=True as an
             # argument
+            force = kwargs.pop('update_auto_cache', False)
             try:
-                if kwargs.pop('update_auto_cache', False):
+                if force:
                     raise CacheMiss(func, args, kwargs)  # pretend we there was a cache miss
                 return self._read_cache(func, args, kwargs)
             except CacheMiss as e:
-                return self._update_cache(e.func, e.args, e.kwargs)
+                if func.__single_flight__:
+                    return self._update_cache_once(e.func, e.args, e.kwargs, force, e.built_key)
+                return self._fill_cache(e.func, e.args, e.kwargs, force, e.built_key)
+
+        def many(arg_list, **options):
+            # keyword only like the options of the coroutine version, see AsyncCaller.call_many
+            update_auto_cache = options.pop('update_auto_cache', False)
+            executor = options.pop('executor', None)
+            if options:
+                raise TypeError('many() got unexpected keyword arguments: {}'.format(', '.join(sorted(options))))
+            return self._call_many(func, arg_list, executor, update_auto_cache)
+
+        wrapper.many = many
+
+        if _is_coroutine_function(func):
+            wrapper = self._async_caller.wrap(func)
+            wrapper.many = partial(self._async_caller.call_many, func)
+
+        wrapper.invalidate = partial(self.invalidate_function, func)
 
         # When this decorator is applied to a function, we keep track of it so
         # we can access the original function later.
@@ -102,7 +273,8 @@ class AutoCache(CacheWrapper):
         self._wrappers_map[wrapper] = func
         return wrapper
 
-    def set(self, key, value, expire_seconds=None, only_if_new=False, only_if_old=False, time_cost=0):
+    def set(self, key, value, expire_seconds=None, only_if_new=False, only_if_old=False, time_cost=0,
+            key_args=None):
         """
         Set value in the cache corresponding to the given key.
 
@@ -118,12 +290,87 @@ class AutoCache(CacheWrapper):
         :param bool only_if_old: the set only happens if the key
                                  DOES exist in the cache
         :param float time_cost: how long when you calculate this value
+        :param str key_args: what the key stands for, kept aside for debugging, see key_args
+        """
+        if expire_seconds is None:
+            expire_seconds = self._default_expiry
+        # all the keys are written in one round trip, and together if the cache supports it
+        with self._wrapped_cache.pipeline() as pipe:
+            pipe.set(self._add_monitoring_namespace_to_key(self.time_cost_suffix, key),
+                     time_cost, expire_seconds, only_if_new, only_if_old)
+            pipe.set(self._add_cache_namespace_to_key(key), value, expire_seconds, only_if_new, only_if_old)
+            if key_args is not None:
+                pipe.set(self._add_monitoring_namespace_to_key(self.key_args_suffix, key),
+                         key_args, expire_seconds, only_if_new, only_if_old)
+        return pipe.results[1]
+
+    def multi_set(self, mapping, expire_seconds=None, time_costs=None, key_args=None):
+        """
+        Set many values in the cache at once, with their time costs like set
+
+        :param dict mapping: the value of every key
+        :param float expire_seconds: set an expire flag for all the keys
+        :param dict time_costs: how long the value of every key took to be calculated, 0 by default
+        :param dict key_args: what some keys stand for, see set
+        :return: True if all the values are set
+        :rtype: bool
+        """
+        if expire_seconds is None:
+            expire_seconds = self._default_expiry
+        return self._wrapped_cache.multi_set(self._raw_mapping(mapping, time_costs, key_args), expire_seconds)
+
+    def _raw_mapping(self, mapping, time_costs=None, key_args=None):
+        """
+        Returns the values, the time costs and the key args of the given keys, by their keys in the wrapped cache
+        """
+        time_costs = time_costs or {}
+        raw_mapping = {}
+        for key, value in mapping.items():
+            raw_mapping[self._add_monitoring_namespace_to_key(self.time_cost_suffix, key)] = time_costs.get(key, 0)
+            raw_mapping[self._add_cache_namespace_to_key(key)] = value
+        for key, args in (key_args or {}).items():
+            raw_mapping[self._add_monitoring_namespace_to_key(self.key_args_suffix, key)] = args
+        return raw_mapping
+
+    def key_args(self, key):
+        """
+        Returns the repr of the arguments a hashed key stands for, if keep_key_args is on
+
+        :param basestring key: a key given by get_keys
+        :return: like "[(1, 2), {'c': 3}]", None if it is not kept
+        :rtype: str
         """
+        value = self._wrapped_cache.get(self._add_monitoring_namespace_to_key(self.key_args_suffix, key))
+        return None if value is None else transcode(value)
 
-        self._wrapped_cache.set(self._add_monitoring_namespace_to_key(self.time_cost_suffix, key),
-                                time_cost, expire_seconds, only_if_new, only_if_old)
+    def key_bytes_saved(self):
+        """
+        Returns how many bytes the keys written in this namespace are shorter for hash_keys
 
-        return super(AutoCache, self).set(key, value, expire_seconds, only_if_new, only_if_old)
+        Every write counts, a key written twice is counted twice.
+
+        :rtype: int
+        """
+        return self._read_counter(self._key_bytes_saved_key)
+
+    def coalesced(self):
+        """
+        Returns how many decorated calls shared the result of another call instead of executing by themselves
+
+        :return: the number of coalesced calls
+        :rtype: int
+        """
+        return self._read_counter(self._coalesced_key)
+
+    def refresh_stats(self):
+        """
+        Returns the counters of the background refresh of stale entries in this process
+
+        See RefreshPool.stats for the details.
+
+        :rtype: dict
+        """
+        return self._refresh_pool.stats()
 
     def time_cost_average(self):
         """
@@ -132,12 +379,29 @@ class AutoCache(CacheWrapper):
         :return: average time cost
         :rtype: float
         """
-        raw_keys = self._monitoring_keys_with_namespace(self.time_cost_suffix)
-        if raw_keys:
-            raw_values = self._wrapped_cache.multi_get(raw_keys)
-        else:
-            raw_values = []
-        return _average([float(value) for value in raw_values if value is not None])
+        total = 0.0
+        count = 0
+        batch = self._wrapped_cache.scan_batch
+        for raw_keys in chunks(self._monitoring_keys_with_namespace(self.time_cost_suffix, batch=batch), batch):
+            for value in self._wrapped_cache.multi_get(raw_keys):
+                if value is not None:
+                    total += float(value)
+                    count += 1
+        return total / count if count else 0
+
+    def invalidate_function(self, func):
+        """
+        Make all the cached results of a decorated function unreachable at once, without touching them
+
+        Like invalidate does for the namespace, it increases the generation of the function,
+        which is part of its cache keys.
+
+        :param func: the decorated function, or the function it wraps
+        :return: the new generation of the function
+        :rtype: int
+        """
+        func = self._wrappers_map.get(func, func)
+        return self._increase_generation(func.__generation_key__)
 
     def _get_source_func(self, wrapper):
         """
@@ -155,7 +419,8 @@ class AutoCache(CacheWrapper):
 
         This is the function that's internally used to compute the key that's
         used to identify our cache location.  By default, it's combining the
-        function name and a pickled version of the arguments, but you can
+        function name and a pickled version of the arguments (or their canonical
+        encoding with normalize_keys, or their digest with hash_keys), but you can
         override it in a sub-class if you can build a more efficient, but
         still unique, version.
 
@@ -168,16 +433,121 @@ class AutoCache(CacheWrapper):
 
         :rtype: basestring
         """
+        encoded = self._encode_key_params(func, args, kwargs)
+        text = '{}'.format(encoded)
+        # the generation of the namespace is needed right after, both are read in one go
+        generation = self._read_generations([self._generation_key, func.__generation_key__])[1]
+        prefix = self._get_function_prefix(func, generation)
+        # arguments shorter than the digest are kept, their length tells them from any digest
+        if not self._hash_keys or len(text) < 2 * self.key_digest_size:
+            return '{}{}'.format(prefix, text)
+        self._key_savings.value = len(text) - 2 * self.key_digest_size
+        return '{}{}'.format(prefix, _digest(encoded, self.key_digest_size))
+
+    def _build_cache_key(self, func, args, kwargs):
+        """
+        Returns the cache key of a call from _get_cache_key, and how many bytes hash_keys saves on it
+
+        The key is built once per call, a miss passes it down to the write of the value,
+        the lease and the key args instead of building it again.
+
+        :rtype: tuple
+        """
+        self._key_savings.value = 0
+        key = self._get_cache_key(func, args, kwargs)
+        return key, self._key_savings.value
+
+    def _get_key_params(self, func, args, kwargs):
+        """
+        Returns what identifies the call in its cache key
+        """
         if callable(func.__bind_key__):
-            params = func.__bind_key__(*args, **kwargs)
-        else:
-            params = [args, kwargs]
-        return '{full_prefix}{args}'.format(
-            full_prefix=func.__full_cache_prefix__,
-            args=pickle.dumps(params),
-        )
+            return func.__bind_key__(*args, **kwargs)
+        return [args, kwargs]
+
+    def _encode_key_params(self, func, args, kwargs):
+        """
+        Returns the argument part of the cache key, before hash_keys
+        """
+        if func.__key_builder__ is None:
+            return pickle.dumps(self._get_key_params(func, args, kwargs))
+        if callable(func.__bind_key__):
+            return encode(func.__bind_key__(*args, **kwargs))
+        return func.__key_builder__.build(args, kwargs)
+
+    def _describe_calls(self, func, calls):
+        """
+        Returns the repr of the arguments of the given calls if keep_key_args is on, None otherwise
 
-    def _update_cache(self, func, args, kwargs):
+        :param list calls: (args, kwargs) of every call
+        :rtype: list
+        """
+        if not self._keep_key_args:
+            return None
+        return [repr(self._get_key_params(func, args, kwargs)) for args, kwargs in calls]
+
+    def _get_function_prefix(self, func, generation):
+        """
+        module:function: -> module:function~2: for the generation 2 of the function
+        """
+        if not generation:
+            return func.__full_cache_prefix__
+        return '{}~{}{}'.format(func.__full_cache_prefix__[:-len(self.sep)], generation, self.sep)
+
+    def _create_entry(self, func, value, time_cost, end_time):
+        """
+        Serialize a result of the function into an entry, tagged with its serializer and its compressor
+        """
+        if self._stores_objects:
+            return Entry.create(value, func.__soft_expiry__, self._default_expiry, time_cost, end_time, OBJECT_CODEC)
+        serializer = func.__serializer__
+        payload = serializer.dumps(value)
+        compression = NO_COMPRESSION
+        if self._compressor is not None:
+            raw_size = len(payload)
+            seconds = 0
+            if raw_size >= self._compression_threshold:
+                start = cpu_clock()
+                compressed = self._compressor.compress(payload)
+                seconds = cpu_clock() - start
+                if len(compressed) < raw_size:
+                    payload, compression = compressed, self._compressor.tag
+            self._count_compression(raw_size, len(payload), seconds)
+        return Entry.create(payload, func.__soft_expiry__, self._default_expiry, time_cost, end_time,
+                            serializer.tag, compression)
+
+    def _load_entry(self, entry, key=None):
+        """
+        Returns the result stored in an entry, by the compressor and the serializer which wrote it
+
+        :param str key: the key of the entry, to keep its result deserialized, see local_objects
+        """
+        if entry.codec == OBJECT_CODEC:
+            return entry.payload
+        if key is None or self._local_objects is None:
+            return self._decode_entry(entry)
+        etag = entry.etag()
+        if etag is None:
+            return self._decode_entry(entry)
+        kept = self._local_objects.get(key)
+        if kept is not None and kept[0] == etag:
+            return kept[1]
+        value = self._decode_entry(entry)
+        self._local_objects.set(key, (etag, value))
+        return value
+
+    def _decode_entry(self, entry):
+        """
+        Decompress and deserialize the payload of an entry
+        """
+        payload = entry.payload
+        if entry.compression != NO_COMPRESSION:
+            start = cpu_clock()
+            payload = decompress(entry.compression, payload)
+            self._count_decompression(cpu_clock() - start)
+        return loads(entry.codec, payload)
+
+    def _update_cache(self, func, args, kwargs, built_key=None):
         """
         Executes the given function with given args and caches the result.
 
@@ -185,35 +555,272 @@ class AutoCache(CacheWrapper):
         the function even if the cache already has a value for it.
 
         It returns the result of the function evaluation.
+        built_key is the cache key of the call if it has been built already, see _build_cache_key.
         """
 
         try:
             start_time = time.time()
             value = func(*args, **kwargs)  # evaluate the function
             end_time = time.time()
+            time_cost = end_time - start_time
+            entry = self._create_entry(func, value, time_cost, end_time)
+            key, saved = built_key or self._build_cache_key(func, args, kwargs)
+            reprs = self._describe_calls(func, [(args, kwargs)])
             self.set(
-                self._get_cache_key(func, args, kwargs),
-                pickle.dumps(value),
+                key,
+                entry.dumps(),
                 self._default_expiry,
-                time_cost=end_time - start_time
+                time_cost=time_cost,
+                key_args=reprs and reprs[0]
             )  # cache the result
+            if saved:
+                self._count(self._key_bytes_saved_key, saved)
         except DoNotCacheException as e:
             # if the called function raised DoNotCacheException, then return
             # the value without caching
             return e.return_value
         return value
 
+    def _call_many(self, func, arg_list, executor=None, force=False):
+        """
+        Calls the decorated function over many arguments, with one read and one write of the cache
+
+        Single flight and leases are not used, every missed call is executed once
+        (calls with the same arguments are executed once as well).
+        If some calls raise, the results of the others are still cached, then the first error is raised.
+
+        :param list arg_list: the positional arguments of every call,
+                              an item which is not a tuple is the only argument of its call
+        :param concurrent.futures.Executor executor: execute the missed calls in it, eg: a ThreadPoolExecutor.
+                                                     A ProcessPoolExecutor needs the decorated function
+                                                     to be importable from its module (so not defined inside
+                                                     another function), and its arguments and results
+                                                     to be picklable. None means one by one here.
+        :param bool force: execute all the calls, like update_auto_cache=True
+        :return: the result of every call, in order
+        :rtype: list
+        """
+        if _is_process_pool(executor) and not _SourceFunction.is_importable(func):
+            raise ValueError('{} is defined inside a function, a ProcessPoolExecutor cannot import it'.format(
+                _qualname(func)))
+        calls, keys, savings = self._many_keys(func, arg_list)
+        if force or not keys:
+            raw_values = [None] * len(keys)
+        else:
+            raw_values = self._wrapped_cache.multi_get([self._add_cache_namespace_to_key(key) for key in keys])
+        results, missing = self._read_many(
+            func, calls, keys, raw_values,
+            lambda i: self._refresh_pool.submit(keys[i], partial(self._refresh_cache, func, calls[i], {},
+                                                                 (keys[i], savings[i]))))
+        if not force:
+            hits = sum(1 for value_string in raw_values if value_string is not None)
+            if hits:
+                self._count(self._hits_key, hits)
+            if len(keys) > hits:
+                self._count(self._misses_key, len(keys) - hits)
+
+        missing_keys = list(missing)
+        if executor is None:
+            outcomes = []
+            for key in missing_keys:
+                try:
+                    outcomes.append((_timed_call(func, calls[missing[key][0]]), None))
+                except Exception:
+                    outcomes.append((None, sys.exc_info()))
+        else:
+            source = _SourceFunction(func)
+            futures = [executor.submit(_timed_call, source, calls[missing[key][0]]) for key in missing_keys]
+            outcomes = []
+            for future in futures:
+                try:
+                    outcomes.append((future.result(), None))
+                except Exception:
+                    outcomes.append((None, sys.exc_info()))
+
+        mapping, time_costs, error = self._write_many(func, missing_keys, missing, outcomes, results)
+        if mapping:
+            saved, key_args = self._describe_many(func, calls, missing, mapping, savings)
+            self.multi_set(mapping, self._default_expiry, time_costs, key_args)
+            if saved:
+                self._count(self._key_bytes_saved_key, saved)
+        if error is not None:
+            six.reraise(*error)
+        return results
+
+    def _many_keys(self, func, arg_list):
+        """
+        Returns the positional arguments, the cache key and the bytes saved by hash_keys of every call of _call_many
+        """
+        calls = [args if isinstance(args, tuple) else (args,) for args in arg_list]
+        built_keys = [self._build_cache_key(func, args, {}) for args in calls]
+        return calls, [key for key, _ in built_keys], [saved for _, saved in built_keys]
+
+    def _describe_many(self, func, calls, missing, mapping, savings):
+        """
+        Returns the bytes saved on the keys written by _call_many, and their key args by key, see _describe_calls
+        """
+        keys = list(mapping)
+        saved = sum(savings[missing[key][0]] for key in keys)
+        reprs = self._describe_calls(func, [(calls[missing[key][0]], {}) for key in keys])
+        return saved, None if reprs is None else dict(zip(keys, reprs))
+
+    def _read_many(self, func, calls, keys, raw_values, submit_refresh):
+        """
+        Loads the values read by _call_many, like _read_cache does for one
+
+        submit_refresh is called with the position of every stale call.
+
+        :return: the results (None for the misses), and the positions of every missed key
+        :rtype: tuple
+        """
+        results = [None] * len(keys)
+        missing = {}
+        for i, (key, value_string) in enumerate(zip(keys, raw_values)):
+            entry = None if value_string is None else Entry.loads(value_string)
+            if entry is not None:
+                if entry.is_stale():
+                    submit_refresh(i)
+                if entry.is_stale() or func.__early_recompute__ is None or \
+                        not entry.should_recompute(func.__early_recompute__):
+                    results[i] = self._load_entry(entry, key)
+                    continue
+            missing.setdefault(key, []).append(i)
+        return results, missing
+
+    def _write_many(self, func, missing_keys, missing, outcomes, results):
+        """
+        Puts the results of the missed calls in place, and returns the entries to write
+
+        :param list outcomes: ((value, time_cost, end_time), exc_info) of every missed key
+        :return: the entries and the time costs by key, and the first error
+        :rtype: tuple
+        """
+        mapping = {}
+        time_costs = {}
+        error = None
+        for key, (outcome, exc_info) in zip(missing_keys, outcomes):
+            if exc_info is not None:
+                error = error or exc_info
+                continue
+            value, time_cost, end_time = outcome
+            for i in missing[key]:
+                results[i] = value
+            if time_cost is not None:
+                entry = self._create_entry(func, value, time_cost, end_time)
+                mapping[key] = entry.dumps()
+                time_costs[key] = time_cost
+        return mapping, time_costs, error
+
+    def _update_cache_once(self, func, args, kwargs, force=False, built_key=None):
+        """
+        Same as _fill_cache, but concurrent calls with the same cache key
+        only execute the function once, the others share its result.
+        """
+        built_key = built_key or self._build_cache_key(func, args, kwargs)
+        value, shared = self._single_flight.do(built_key[0],
+                                               partial(self._fill_cache, func, args, kwargs, force, built_key),
+                                               func.__wait_timeout__)
+        if shared:
+            self._count(self._coalesced_key)
+        return value
+
+    def _fill_cache(self, func, args, kwargs, force=False, built_key=None):
+        """
+        Executes the given function and caches the result after a miss.
+
+        If the function is decorated with a lease_timeout, the execution is guarded
+        by a lease in the wrapped cache. A forced update never waits for the lease.
+        """
+        if force or func.__lease_timeout__ is None:
+            return self._update_cache(func, args, kwargs, built_key)
+        return self._update_cache_with_lease(func, args, kwargs, built_key)
+
+    def _update_cache_with_lease(self, func, args, kwargs, built_key=None):
+        """
+        Executes the given function only if we get the lease of its cache key.
+
+        The lease is a monitoring key set with only_if_new, so only one worker of all the processes
+        sharing the wrapped cache gets it. Other workers back off and poll the cache for the value
+        written by the lease holder. If the lease is released without a value (eg: the holder failed),
+        the next poll tries to take it again. If nobody writes the value in lease_timeout seconds,
+        the worker executes the function by itself.
+        """
+        built_key = built_key or self._build_cache_key(func, args, kwargs)
+        key = built_key[0]
+        raw_key = self._add_cache_namespace_to_key(key)
+        lease_key = self._add_monitoring_namespace_to_key(self.lease_suffix, key)
+        lease_timeout = func.__lease_timeout__
+        token = uuid.uuid4().hex
+        deadline = time.time() + lease_timeout
+        interval, max_interval = self.lease_poll_interval
+        while True:
+            if self._wrapped_cache.set(lease_key, token, lease_timeout, only_if_new=True):
+                try:
+                    return self._update_cache(func, args, kwargs, built_key)
+                finally:
+                    self._release_lease(lease_key, token)
+
+            # add some jitter to keep workers from polling at the same time
+            time.sleep(random.uniform(interval / 2, interval))
+            value_string = self._wrapped_cache.get(raw_key)
+            entry = None if value_string is None else Entry.loads(value_string)
+            if entry is not None:
+                self._count(self._coalesced_key)
+                return self._load_entry(entry)
+            if time.time() >= deadline:
+                return self._update_cache(func, args, kwargs, built_key)
+            interval = min(interval * 2, max_interval)
+
+    def _refresh_cache(self, func, args, kwargs, built_key=None):
+        """
+        Executes the given function in background to replace a stale result.
+
+        If the function is decorated with a lease_timeout, it only refreshes when it gets the lease,
+        so other processes that found the same stale result don't refresh it again.
+        """
+        lease_timeout = func.__lease_timeout__
+        if lease_timeout is None:
+            self._update_cache(func, args, kwargs, built_key)
+            return
+        built_key = built_key or self._build_cache_key(func, args, kwargs)
+        lease_key = self._add_monitoring_namespace_to_key(self.lease_suffix, built_key[0])
+        token = uuid.uuid4().hex
+        if not self._wrapped_cache.set(lease_key, token, lease_timeout, only_if_new=True):
+            return
+        try:
+            self._update_cache(func, args, kwargs, built_key)
+        finally:
+            self._release_lease(lease_key, token)
+
+    def _release_lease(self, lease_key, token):
+        """
+        Deletes the lease if it is still held by us.
+
+        The lease may have timed out and been taken by another worker,
+        we must not release the lease of that worker.
+        """
+        if transcode(self._wrapped_cache.get(lease_key) or '') == token:
+            self._wrapped_cache.delete([lease_key])
+
     def _read_cache(self, func, args, kwargs):
         """
         Strictly tries to get an already cached result.
 
-        It returns None if the function call is not in the cache.
+        It raises CacheMiss if the function call is not in the cache.
+        A stale result is returned as well, after queueing a refresh of it.
+        A result chosen for early recomputation is recomputed and returned at once.
         """
-        key = self._get_cache_key(func, args, kwargs)
+        built_key = self._build_cache_key(func, args, kwargs)
+        key = built_key[0]
         value_string = self.get(key)
-        if value_string is None:
-            raise CacheMiss(func, args, kwargs)  # pretend we there was a cache miss
-        return pickle.loads(value_string)
+        entry = None if value_string is None else Entry.loads(value_string)
+        if entry is None:
+            raise CacheMiss(func, args, kwargs, built_key)  # pretend we there was a cache miss
+        if entry.is_stale():
+            self._refresh_pool.submit(key, partial(self._refresh_cache, func, args, kwargs, built_key))
+        elif func.__early_recompute__ is not None and entry.should_recompute(func.__early_recompute__):
+            return self._update_cache_once(func, args, kwargs, True, built_key)
+        return self._load_entry(entry, key)
 
 
 def get_auto_cache(namespace='py_auto_cache', default_expiry=None, wrapped_cache=None):
@@ -260,5 +867,90 @@ def auto_cache_decorator(namespace='py_auto_cache',
     return get_auto_cache(namespace, default_expiry, wrapped_cache).decorator
 
 
-def _average(iterable):
-    return (float(sum(iterable)) / len(iterable)) if iterable else 0
+def _digest(data, size):
+    """
+    Returns the hex digest of size bytes of the given bytes, by blake2b if this python has it
+    """
+    if isinstance(data, six.text_type):
+        data = data.encode('utf-8')
+    if hasattr(hashlib, 'blake2b'):
+        return hashlib.blake2b(data, digest_size=size).hexdigest()
+    return hashlib.sha256(data).hexdigest()[:size * 2]
+
+
+class _SourceFunction(object):
+    """
+    The undecorated function of a decorated one, which a process pool can send to its workers
+
+    The function can't be pickled by reference, its module attribute is the decorator wrapper.
+    It is pickled as its module and its name instead, and a worker finds it back behind the wrapper.
+    """
+
+    def __init__(self, func):
+        self._func = func
+
+    def __call__(self, *args):
+        return self._func(*args)
+
+    def __reduce__(self):
+        if not self.is_importable(self._func):
+            raise pickle.PicklingError('{} is defined inside a function, it cannot be imported by another '
+                                       'process'.format(_qualname(self._func)))
+        return _load_source_function, (self._func.__module__, _qualname(self._func))
+
+    @staticmethod
+    def is_importable(func):
+        """
+        Returns False if the function is defined inside another function, _load_source_function can't find it
+        """
+        return '<locals>' not in _qualname(func)
+
+
+def _qualname(func):
+    """
+    Returns the qualified name of a function, its name on the pythons without qualified names
+    """
+    return getattr(func, '__qualname__', func.__name__)
+
+
+def _is_process_pool(executor):
+    """
+    Returns True if the executor runs the calls in other processes
+    """
+    try:
+        from concurrent.futures import ProcessPoolExecutor
+    except ImportError:
+        # the futures backport is not installed, the executor is something else
+        return False
+    return isinstance(executor, ProcessPoolExecutor)
+
+
+def _load_source_function(module_name, qualname):
+    """
+    Returns the undecorated function of the decorated function module_name.qualname, see _SourceFunction
+    """
+    target = importlib.import_module(module_name)
+    for name in qualname.split('.'):
+        target = getattr(target, name)
+    return getattr(target, '__source_func__', target)
+
+
+def _timed_call(func, args):
+    """
+    Executes func(*args) for AutoCache._call_many, it is a module function so process pools can pickle it,
+    with func as a _SourceFunction
+
+    :return: (value, time cost, end time), the time cost is None if the value must not be cached
+    :rtype: tuple
+    """
+    start_time = time.time()
+    try:
+        value = func(*args)
+    except DoNotCacheException as e:
+        return e.return_value, None, None
+    end_time = time.time()
+    return value, end_time - start_time, end_time
+
+
+def _is_coroutine_function(func):
+    return AsyncCaller is not None and inspect.iscoroutinefunction(func)
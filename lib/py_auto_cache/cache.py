@@ -2,7 +2,7 @@
 import abc
 import six
 from .error import ClientError
-from .util import StringTypes, wrap_client_exception
+from .util import StringTypes, chunks, wrap_client_exception
 
 
 engine_error_wrapper = wrap_client_exception(ValueError, ClientError)
@@ -15,6 +15,13 @@ class Cache(object):
     different cache types. eg memcached, redis, and even in RAM dicts.
     """
 
+    # how many keys iter_keys looks up, and clear deletes, at a time
+    scan_batch = 1000
+
+    # True if the values are kept as they are given instead of as strings,
+    # AutoCache then stores its results without serializing them, see DictCache(objects=True)
+    stores_objects = False
+
     @abc.abstractmethod
     def get(self, key):
         """
@@ -70,6 +77,20 @@ class Cache(object):
         """
         raise NotImplementedError
 
+    def iter_keys(self, pattern='*', batch=None):
+        """
+        Iterate the keys that match the given pattern
+
+        Unlike get_keys, the keys may be found a batch at a time, so a large cache is never
+        held in memory at once nor blocks its server for long. By default it iterates get_keys.
+        A key set or deleted during the iteration may be given or not.
+
+        :param str|unicode pattern: contains * ? [abc]
+        :param int batch: how many keys to look up at a time, scan_batch by default
+        :rtype: iterator of str
+        """
+        return iter(self.get_keys(pattern))
+
     @engine_error_wrapper
     def increase(self, key, amount=1):
         """
@@ -104,6 +125,33 @@ class Cache(object):
         """
         return [self.get(key) for key in keys]
 
+    def multi_set(self, mapping, expire_seconds=None):
+        """
+        Set many values at once
+
+        :param dict mapping: the value of every key
+        :param float expire_seconds: how long all the keys live, None means forever
+        :return: True if all the values are set
+        :rtype: bool
+        """
+        with self.pipeline() as pipe:
+            for key, value in mapping.items():
+                pipe.set(key, value, expire_seconds)
+        return all(pipe.results)
+
+    def multi_delete(self, keys):
+        """
+        Delete many keys at once, and tell which ones existed
+
+        :param list[str|unicode] keys: all the keys you need to delete
+        :return: for every key, True if it has been deleted
+        :rtype: list[bool]
+        """
+        with self.pipeline() as pipe:
+            for key in keys:
+                pipe.delete([key])
+        return [bool(count) for count in pipe.results]
+
     def clear(self, pattern='*'):
         """
         Clear keys by the given pattern
@@ -114,7 +162,10 @@ class Cache(object):
         :return: how many keys are deleted successful
         :rtype: int
         """
-        return self.delete(self.get_keys(pattern))
+        count = 0
+        for keys in chunks(self.iter_keys(pattern, self.scan_batch), self.scan_batch):
+            count += self.delete(keys)
+        return count
 
     def memory_size(self, keys):
         """
@@ -132,6 +183,113 @@ class Cache(object):
 
         return _calculate_size(keys) + _calculate_size(values)
 
+    def pipeline(self):
+        """
+        Returns a Pipeline collecting writes, which are executed together at the end of the with block
+
+            with cache.pipeline() as pipe:
+                pipe.set('a', '1')
+                pipe.increase('b')
+            print(pipe.results)
+
+        By default the writes are just executed one by one,
+        a cache can execute them in one round trip or under one lock by overriding _execute_pipeline.
+
+        :rtype: Pipeline
+        """
+        return Pipeline(self)
+
+    def _execute_pipeline(self, commands):
+        """
+        Execute the writes collected by a Pipeline
+
+        :param list[tuple] commands: (method name, args) of every write
+        :return: the result of every write
+        :rtype: list
+        """
+        return [getattr(self, name)(*args) for name, args in commands]
+
+    def to_async(self):
+        """
+        Returns an AsyncCache working on the same data as this cache, for asyncio code.
+
+        By default it runs this cache in threads, so it never blocks the event loop.
+        Override it if your client has a native asyncio version.
+
+        :rtype: py_auto_cache.async_cache.AsyncCache
+        """
+        from .async_cache import ThreadedCache
+        return ThreadedCache(self)
+
+
+def _pipeline_keys(commands):
+    """
+    Returns all the keys written by the commands of a Pipeline
+    """
+    keys = []
+    for name, args in commands:
+        if name == 'delete':
+            keys.extend(args[0])
+        else:
+            keys.append(args[0])
+    return keys
+
+
+class Pipeline(object):
+    """
+    Writes to be executed together by a cache, see Cache.pipeline
+
+    The pipeline of an AsyncCache is executed by awaiting execute() instead of a with block.
+    """
+
+    def __init__(self, cache):
+        super(Pipeline, self).__init__()
+        self._cache = cache
+        self._commands = []
+        self.results = None
+
+    def set(self, key, value, expire_seconds=None, only_if_new=False, only_if_old=False):
+        """
+        Queue a Cache.set
+        """
+        self._commands.append(('set', (key, value, expire_seconds, only_if_new, only_if_old)))
+        return self
+
+    def delete(self, keys):
+        """
+        Queue a Cache.delete
+        """
+        self._commands.append(('delete', (keys,)))
+        return self
+
+    def increase(self, key, amount=1):
+        """
+        Queue a Cache.increase
+        """
+        self._commands.append(('increase', (key, amount)))
+        return self
+
+    def execute(self):
+        """
+        Execute the queued writes
+
+        :return: the result of every write, in order
+        :rtype: list
+        """
+        commands, self._commands = self._commands, []
+        self.results = self._cache._execute_pipeline(commands)
+        return self.results
+
+    def __len__(self):
+        return len(self._commands)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.execute()
+
 
 def _calculate_size(something):
     return sum(len(item) for item in something if isinstance(item, StringTypes))
@@ -1,10 +1,12 @@
 # -*- coding: utf-8 -*-
+import time
 from logging import getLogger, StreamHandler
-from .error import HostError
+from .error import ClientError, HostError
 from .cache import Cache
+from .counters import BufferedCounters, flush_at_exit
 
 from .caches import DictCache as DefaultCache
-from .util import transcode
+from .util import chunks, transcode
 
 logger = getLogger('py_auto_cache')
 logger.addHandler(StreamHandler())
@@ -28,6 +30,24 @@ class CacheWrapper(object):
     hits_suffix = 'hits'
     misses_suffix = 'misses'
 
+    # hits and misses are counted in memory, and written to the cache
+    # after this many seconds or this many counts, whichever comes first
+    counter_flush_interval = 1.0
+    counter_flush_threshold = 100
+
+    # the generation of the namespace is folded into the cache keys, see invalidate.
+    # It is read from the cache at most every generation_ttl seconds,
+    # so other processes see an invalidation after this delay at most
+    generation_suffix = 'generation'
+    generation_ttl = 1.0
+
+    # the sizes of the values before and after compression, and the time (in microseconds)
+    # spent compressing and decompressing them, counted by the subclasses compressing values
+    raw_bytes_suffix = 'raw_bytes'
+    stored_bytes_suffix = 'stored_bytes'
+    compress_time_suffix = 'compress_us'
+    decompress_time_suffix = 'decompress_us'
+
     def __init__(self, namespace='default', default_expiry=None, wrapped_cache=None):
         """
         Sets up our cache with the given namespace.
@@ -57,6 +77,17 @@ class CacheWrapper(object):
 
         self._misses_key = self._add_monitoring_namespace_to_key(self.misses_suffix, '*')
         self._hits_key = self._add_monitoring_namespace_to_key(self.hits_suffix, '*')
+        self._generation_key = self._add_monitoring_namespace_to_key(self.generation_suffix, '*')
+        self._raw_bytes_key = self._add_monitoring_namespace_to_key(self.raw_bytes_suffix, '*')
+        self._stored_bytes_key = self._add_monitoring_namespace_to_key(self.stored_bytes_suffix, '*')
+        self._compress_time_key = self._add_monitoring_namespace_to_key(self.compress_time_suffix, '*')
+        self._decompress_time_key = self._add_monitoring_namespace_to_key(self.decompress_time_suffix, '*')
+
+        # generation key -> (generation, time to read it again)
+        self._generations = {}
+
+        self._counters = BufferedCounters(self.counter_flush_interval, self.counter_flush_threshold)
+        flush_at_exit(self)
 
     def get(self, key):
         """
@@ -70,9 +101,9 @@ class CacheWrapper(object):
         key = self._add_cache_namespace_to_key(key)
         value = self._wrapped_cache.get(key)
         if value is None:
-            self._wrapped_cache.increase(self._misses_key)
+            self._count(self._misses_key)
         else:
-            self._wrapped_cache.increase(self._hits_key)
+            self._count(self._hits_key)
         return value
 
     def set(self, key, value, expire_seconds=None, only_if_new=False, only_if_old=False):
@@ -95,6 +126,19 @@ class CacheWrapper(object):
                                        self._default_expiry if expire_seconds is None else expire_seconds,
                                        only_if_new, only_if_old)
 
+    def multi_set(self, mapping, expire_seconds=None):
+        """
+        Set many values in the cache at once
+
+        :param dict mapping: the value of every key
+        :param float expire_seconds: set an expire flag for all the keys
+        :return: True if all the values are set
+        :rtype: bool
+        """
+        return self._wrapped_cache.multi_set(
+            dict((self._add_cache_namespace_to_key(key), value) for key, value in mapping.items()),
+            self._default_expiry if expire_seconds is None else expire_seconds)
+
     def hits(self):
         """
         Returns how many times you hit cache successfully by using CacheWrapper.get
@@ -102,7 +146,7 @@ class CacheWrapper(object):
         :return: the number of hit times
         :rtype: int
         """
-        return int(self._wrapped_cache.get(self._hits_key) or 0)
+        return self._read_counter(self._hits_key)
 
     def misses(self):
         """
@@ -111,7 +155,40 @@ class CacheWrapper(object):
         :return: the number of misses times
         :rtype: int
         """
-        return int(self._wrapped_cache.get(self._misses_key) or 0)
+        return self._read_counter(self._misses_key)
+
+    def flush_counters(self):
+        """
+        Write the counts kept in memory to the cache
+
+        It is called by the counting itself from time to time, see counter_flush_interval,
+        call it if other processes need to read the latest counts.
+        If the cache fails, the counts are kept for the next flush and the error is raised.
+        """
+        counts = self._counters.take()
+        try:
+            for key, amount in list(counts.items()):
+                self._wrapped_cache.increase(key, amount)
+                del counts[key]
+        except ClientError:
+            self._counters.restore(counts)
+            raise
+
+    def _count(self, key, amount=1):
+        """
+        Increase a monitoring counter in memory, it is flushed to the cache later
+        """
+        if self._counters.add(key, amount):
+            try:
+                self.flush_counters()
+            except ClientError:
+                logger.warning('Failed to flush the counters of %s', self._namespace, exc_info=True)
+
+    def _read_counter(self, key):
+        """
+        Returns the count in the cache plus the count of this process not flushed yet
+        """
+        return int(self._wrapped_cache.get(key) or 0) + self._counters.pending(key)
 
     def hit_rate(self):
         """
@@ -129,6 +206,45 @@ class CacheWrapper(object):
             return 0
         return float(hits) / (hits + misses)
 
+    def compression_stats(self):
+        """
+        Returns how well the values written in this namespace are compressed, and what it costs
+
+        ratio is raw_bytes / stored_bytes, of all the values written while compression was on,
+        so it includes the values under the threshold which are stored as they are.
+
+        :return: like {'raw_bytes': 1000, 'stored_bytes': 250, 'ratio': 4.0,
+                       'compress_seconds': 0.01, 'decompress_seconds': 0.002}
+        :rtype: dict
+        """
+        raw_bytes = self._read_counter(self._raw_bytes_key)
+        stored_bytes = self._read_counter(self._stored_bytes_key)
+        return {
+            'raw_bytes': raw_bytes,
+            'stored_bytes': stored_bytes,
+            'ratio': float(raw_bytes) / stored_bytes if stored_bytes else 0,
+            'compress_seconds': self._read_counter(self._compress_time_key) / 1e6,
+            'decompress_seconds': self._read_counter(self._decompress_time_key) / 1e6,
+        }
+
+    def _count_compression(self, raw_size, stored_size, seconds):
+        """
+        Count a value written with compression on, see compression_stats
+
+        The counts are only added in memory and flushed with the next hit or miss,
+        so it never waits for the cache and is safe in an event loop.
+        """
+        self._counters.add(self._raw_bytes_key, raw_size)
+        self._counters.add(self._stored_bytes_key, stored_size)
+        if seconds:
+            self._counters.add(self._compress_time_key, int(seconds * 1e6))
+
+    def _count_decompression(self, seconds):
+        """
+        Count the time spent decompressing a value read, like _count_compression
+        """
+        self._counters.add(self._decompress_time_key, int(seconds * 1e6))
+
     def memory_size(self):
         """
         Returns the number of bytes being consumed in the cache by data in this namespace.
@@ -137,8 +253,9 @@ class CacheWrapper(object):
         :return: the number of bytes
         :rtype: int
         """
-        raw_keys = self._cache_keys_with_namespace()
-        return self._wrapped_cache.memory_size(raw_keys)
+        batch = self._wrapped_cache.scan_batch
+        return sum(self._wrapped_cache.memory_size(raw_keys)
+                   for raw_keys in chunks(self._cache_keys_with_namespace(), batch))
 
     def get_keys(self, pattern='*'):
         """
@@ -157,8 +274,19 @@ class CacheWrapper(object):
                                    the namespace will be implicitly added.
         :return: a list of matched keys without namespace prefix.
         """
-        return [self._remove_cache_namespace_from_key(name)
-                for name in self._cache_keys_with_namespace(pattern)]
+        return list(self.iter_keys(pattern))
+
+    def iter_keys(self, pattern='*', batch=None):
+        """
+        Iterate the keys like get_keys, but they are found a batch at a time, see Cache.iter_keys
+
+        :param basestring pattern: a pattern string,
+                                   the namespace will be implicitly added.
+        :param int batch: how many keys to look up at a time
+        :return: an iterator of matched keys without namespace prefix.
+        """
+        for name in self._cache_keys_with_namespace(pattern, batch):
+            yield self._remove_cache_namespace_from_key(name)
 
     def delete(self, *keys):
         """
@@ -172,27 +300,95 @@ class CacheWrapper(object):
         raw_keys = [self._add_cache_namespace_to_key(key) for key in keys]
         self._wrapped_cache.delete(raw_keys)
 
+    def multi_delete(self, keys):
+        """
+        Delete many keys at once, and tell which ones existed
+
+        :param list keys: a list of keys (not patterns)
+        :return: for every key, True if it has been deleted
+        :rtype: list[bool]
+        """
+        return self._wrapped_cache.multi_delete([self._add_cache_namespace_to_key(key) for key in keys])
+
     def clear(self):
         """
         Clear all the keys from all the servers in this namespace.
 
         This will match keys from all the server, then delete them.
+        The keys of the former generations are deleted as well, see invalidate.
+        """
+        self._wrapped_cache.clear('{}*'.format(self._get_full_prefix(self.cache_prefix)[:-len(self.sep)]))
+
+    def invalidate(self):
+        """
+        Make all the keys in this namespace unreachable at once, without touching them
+
+        It increases the generation of the namespace, which is part of every cache key,
+        the keys of the former generation are left to their expiry (or to the eviction of the cache).
+        Other processes see it within generation_ttl seconds.
+        The generation is kept in the cache without expiry, if the cache evicts it anyway,
+        the keys of the first generation become reachable again until they expire.
+
+        :return: the new generation
+        :rtype: int
+        """
+        return self._increase_generation(self._generation_key)
+
+    def _increase_generation(self, key):
+        generation = int(self._wrapped_cache.increase(key))
+        self._generations[key] = (generation, time.time() + self.generation_ttl)
+        return generation
+
+    def _read_generations(self, keys):
+        """
+        Returns the generations of the given generation keys
+
+        They are kept in memory, the expired ones are read again in one round trip.
+
+        :rtype: list[int]
         """
-        self._wrapped_cache.clear(self._add_cache_namespace_to_key('*'))
+        expired = self._expired_generations(keys)
+        if expired:
+            self._store_generations(expired, self._wrapped_cache.multi_get(expired))
+        generations = self._generations
+        return [generations[key][0] for key in keys]
+
+    def _expired_generations(self, keys):
+        """
+        Returns the generation keys to read from the cache again
+        """
+        now = time.time()
+        generations = self._generations
+        return [key for key in keys if key not in generations or generations[key][1] <= now]
+
+    def _store_generations(self, keys, values):
+        """
+        Keep the generations read from the cache, a missing generation is 0
+        """
+        expire_at = time.time() + self.generation_ttl
+        for key, value in zip(keys, values):
+            self._generations[key] = (int(value or 0), expire_at)
+
+    def _namespace_generation(self):
+        return self._read_generations([self._generation_key])[0]
 
-    def _get_full_prefix(self, prefix):
+    def _get_full_prefix(self, prefix, generation=0):
         """
         'monitoring' -> py_auto_cache:namespace:'monitoring':
+        ('cache', 2) -> py_auto_cache:namespace:'cache'~2:
 
         :param prefix: short prefix like 'monitoring'
+        :param generation: the generation of the namespace, 0 adds nothing
         :return: full prefix like py_auto_cache:namespace:'monitoring':
         """
-        if prefix not in self._namespace_prefix:
-            self._namespace_prefix[prefix] = '{global_ns}{sep}{ns}{sep}{prefix}{sep}'.format(sep=self.sep,
-                                                                                             global_ns=self.global_ns,
-                                                                                             prefix=prefix,
-                                                                                             ns=self._namespace)
-        return self._namespace_prefix[prefix]
+        if (prefix, generation) not in self._namespace_prefix:
+            self._namespace_prefix[prefix, generation] = '{global_ns}{sep}{ns}{sep}{prefix}{generation}{sep}'.format(
+                sep=self.sep,
+                global_ns=self.global_ns,
+                prefix=prefix,
+                generation='~{}'.format(generation) if generation else '',
+                ns=self._namespace)
+        return self._namespace_prefix[prefix, generation]
 
     def _get_full_suffix(self, suffix):
         """
@@ -205,31 +401,33 @@ class CacheWrapper(object):
             self._namespace_suffix[suffix] = '{sep}{suffix}'.format(sep=self.sep, suffix=suffix)
         return self._namespace_suffix[suffix]
 
-    def _add_namespace_to_key(self, key, prefix=None, suffix=None):
+    def _add_namespace_to_key(self, key, prefix=None, suffix=None, generation=0):
         """
         ('key', 'monitoring', 'hits') -> py_auto_cache:namespace:'monitoring':'key':'hits'
 
         :param key: original key like 'key'
         :param prefix: short prefix like 'monitoring'
         :param suffix: short suffix like 'hits'
+        :param generation: the generation of the namespace
         :return: key with namespace like py_auto_cache:namespace:'monitoring':'key':'hits'
         """
-        return '{prefix}{key}{suffix}'.format(prefix=self._get_full_prefix(prefix), key=key,
+        return '{prefix}{key}{suffix}'.format(prefix=self._get_full_prefix(prefix, generation), key=key,
                                               suffix=self._get_full_suffix(suffix))
 
-    def _remove_namespace_from_key(self, key, prefix=None, suffix=None):
+    def _remove_namespace_from_key(self, key, prefix=None, suffix=None, generation=0):
         """
         py_auto_cache:namespace:'monitoring':'key':'hits' -> 'key'
 
         :param key: key with namespace like py_auto_cache:namespace:'monitoring':'key':'hits'
         :param prefix: short prefix like 'monitoring'
         :param suffix: short suffix like 'hits'
+        :param generation: the generation of the namespace
         :return: original key like 'key'
         """
-        return _remove_suffix(_remove_prefix(key, self._get_full_prefix(prefix)),
+        return _remove_suffix(_remove_prefix(key, self._get_full_prefix(prefix, generation)),
                               self._get_full_suffix(suffix))
 
-    def _keys_with_namespace(self, pattern='*', prefix=None, suffix=None):
+    def _keys_with_namespace(self, pattern='*', prefix=None, suffix=None, batch=None, generation=0):
         """
         ('*', 'monitoring', 'hits') -> [py_auto_cache:namespace:'monitoring':'key1':'hits',
                                         py_auto_cache:namespace:'monitoring':'key2':'hits',
@@ -239,13 +437,15 @@ class CacheWrapper(object):
         :param pattern: pattern string like '*'
         :param prefix: short prefix like 'monitoring'
         :param suffix: short suffix like 'hits'
-        :return: a list of matched keys with namespace like [py_auto_cache:namespace:'monitoring':'key1':'hits',
-                                                             py_auto_cache:namespace:'monitoring':'key2':'hits',
-                                                             py_auto_cache:namespace:'monitoring':'key3':'hits',
-                                                             ...]
+        :param batch: how many keys to look up at a time
+        :param generation: the generation of the namespace
+        :return: an iterator of matched keys with namespace like [py_auto_cache:namespace:'monitoring':'key1':'hits',
+                                                                  py_auto_cache:namespace:'monitoring':'key2':'hits',
+                                                                  py_auto_cache:namespace:'monitoring':'key3':'hits',
+                                                                  ...]
 
         """
-        return self._wrapped_cache.get_keys(self._add_namespace_to_key(pattern, prefix, suffix))
+        return self._wrapped_cache.iter_keys(self._add_namespace_to_key(pattern, prefix, suffix, generation), batch)
 
     def _add_cache_namespace_to_key(self, key):
         """
@@ -254,7 +454,7 @@ class CacheWrapper(object):
         :param key: original cache key like 'key'
         :return: cache key with namespace like py_auto_cache:namespace:'cache':'key':None
         """
-        return self._add_namespace_to_key(key, self.cache_prefix)
+        return self._add_namespace_to_key(key, self.cache_prefix, generation=self._namespace_generation())
 
     def _remove_cache_namespace_from_key(self, key):
         """
@@ -263,9 +463,9 @@ class CacheWrapper(object):
         :param key: cache key with namespace like py_auto_cache:namespace:'cache':'key':None
         :return: original cache key like 'key'
         """
-        return self._remove_namespace_from_key(key, self.cache_prefix)
+        return self._remove_namespace_from_key(key, self.cache_prefix, generation=self._namespace_generation())
 
-    def _cache_keys_with_namespace(self, pattern='*'):
+    def _cache_keys_with_namespace(self, pattern='*', batch=None):
         """
         '*' -> [py_auto_cache:namespace:'cache':'key1':None,
                 py_auto_cache:namespace:'cache':'key2':None,
@@ -273,12 +473,14 @@ class CacheWrapper(object):
                 ...]
 
         :param pattern: pattern string like '*'
-        :return: a list of matched keys with cache namespace like [py_auto_cache:namespace:'cache':'key1':None,
-                                                                   py_auto_cache:namespace:'cache':'key2':None,
-                                                                   py_auto_cache:namespace:'cache':'key3':None,
-                                                                   ...]
+        :param batch: how many keys to look up at a time
+        :return: an iterator of matched keys with cache namespace like [py_auto_cache:namespace:'cache':'key1':None,
+                                                                        py_auto_cache:namespace:'cache':'key2':None,
+                                                                        py_auto_cache:namespace:'cache':'key3':None,
+                                                                        ...]
         """
-        return self._keys_with_namespace(pattern, self.cache_prefix)
+        return self._keys_with_namespace(pattern, self.cache_prefix, batch=batch,
+                                         generation=self._namespace_generation())
 
     def _add_monitoring_namespace_to_key(self, suffix, key):
         """
@@ -300,7 +502,7 @@ class CacheWrapper(object):
         """
         return self._remove_namespace_from_key(key, self.monitoring_prefix, suffix)
 
-    def _monitoring_keys_with_namespace(self, suffix, pattern='*'):
+    def _monitoring_keys_with_namespace(self, suffix, pattern='*', batch=None):
         """
         ('hits', '*') -> [py_auto_cache:namespace:'monitoring':'key1':'hits',
                           py_auto_cache:namespace:'monitoring':'key1':'hits',,
@@ -308,13 +510,14 @@ class CacheWrapper(object):
                           ...]
 
         :param pattern: pattern string like '*'
-        :return: a list of matched keys with monitoring namespace like
+        :param batch: how many keys to look up at a time
+        :return: an iterator of matched keys with monitoring namespace like
                  [py_auto_cache:namespace:'monitoring':'key1':'hits',
                   py_auto_cache:namespace:'monitoring':'key1':'hits',,
                   py_auto_cache:namespace:'monitoring':'key1':'hits',,
                   ...]
         """
-        return self._keys_with_namespace(pattern, self.monitoring_prefix, suffix)
+        return self._keys_with_namespace(pattern, self.monitoring_prefix, suffix, batch)
 
 
 def _remove_prefix(key, prefix):
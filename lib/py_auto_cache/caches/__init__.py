@@ -14,3 +14,31 @@ try:
     from .dispatcher import Dispatcher
 except ImportError:
     Dispatcher = None
+try:
+    from .async_redis_cache import AsyncRedisCache
+except (ImportError, SyntaxError):
+    AsyncRedisCache = None
+try:
+    from .file_cache import FileCache
+except ImportError:
+    FileCache = None
+try:
+    from .log_file_cache import LogFileCache
+except ImportError:
+    LogFileCache = None
+try:
+    from .sqlite_cache import SqliteCache
+except ImportError:
+    SqliteCache = None
+try:
+    from .shared_memory_cache import SharedMemoryCache
+except ImportError:
+    SharedMemoryCache = None
+try:
+    from .tiered_cache import TieredCache
+except ImportError:
+    TieredCache = None
+try:
+    from .redis_invalidator import RedisInvalidator
+except ImportError:
+    RedisInvalidator = None
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+from redis.asyncio import StrictRedis
+from redis import RedisError
+from ..async_cache import AsyncCache, wrap_async_client_exception
+from .redis_cache import RedisClientError, merge_results, queue_commands
+
+async_redis_error_wrapper = wrap_async_client_exception(RedisError, RedisClientError)
+
+
+class AsyncRedisCache(AsyncCache):
+    """
+    Implement redis cache for asyncio, see RedisCache
+    """
+
+    def __init__(self, host='localhost', port=6379, timeout=None):
+        super(AsyncRedisCache, self).__init__()
+
+        self._redis = StrictRedis(host=host, port=port, socket_timeout=timeout, socket_connect_timeout=timeout)
+
+    @async_redis_error_wrapper
+    async def get(self, key):
+        return await self._redis.get(key)
+
+    @async_redis_error_wrapper
+    async def set(self, key, value, expire_seconds=None, only_if_new=False, only_if_old=False):
+        expire_milliseconds = None
+        if expire_seconds is not None:
+            expire_milliseconds = int(expire_seconds * 1000)
+
+        return await self._redis.set(key, value, px=expire_milliseconds, nx=only_if_new, xx=only_if_old)
+
+    @async_redis_error_wrapper
+    async def delete(self, keys):
+        if len(keys) > 0:
+            return await self._redis.delete(*keys)
+        return 0
+
+    @async_redis_error_wrapper
+    async def get_keys(self, pattern='*'):
+        return [key async for key in self._redis.scan_iter(pattern, self.scan_batch)]
+
+    @async_redis_error_wrapper
+    async def iter_keys(self, pattern='*', batch=None):
+        async for key in self._redis.scan_iter(pattern, batch or self.scan_batch):
+            yield key
+
+    @async_redis_error_wrapper
+    async def increase(self, key, amount=1):
+        return await self._redis.incr(key, amount)
+
+    @async_redis_error_wrapper
+    async def multi_get(self, keys):
+        if len(keys) > 0:
+            return await self._redis.mget(keys)
+        return []
+
+    @async_redis_error_wrapper
+    async def multi_set(self, mapping, expire_seconds=None):
+        if len(mapping) == 0:
+            return True
+        pipe = self._redis.pipeline(transaction=True)
+        pipe.mset(mapping)
+        if expire_seconds is not None:
+            expire_milliseconds = int(expire_seconds * 1000)
+            for key in mapping:
+                pipe.pexpire(key, expire_milliseconds)
+        return (await pipe.execute())[0]
+
+    @async_redis_error_wrapper
+    async def multi_delete(self, keys):
+        if len(keys) == 0:
+            return []
+        pipe = self._redis.pipeline(transaction=False)
+        for key in keys:
+            pipe.delete(key)
+        return [bool(count) for count in await pipe.execute()]
+
+    @async_redis_error_wrapper
+    async def clear(self, pattern='*'):
+        count = 0
+        keys = []
+        async for key in self._redis.scan_iter(pattern, self.scan_batch):
+            keys.append(key)
+            if len(keys) >= self.scan_batch:
+                count += await self._redis.unlink(*keys)
+                keys = []
+        if keys:
+            count += await self._redis.unlink(*keys)
+        return count
+
+    @async_redis_error_wrapper
+    async def _execute_pipeline(self, commands):
+        pipe = self._redis.pipeline(transaction=True)
+        queued = queue_commands(pipe, commands)
+        if not queued:
+            return [0] * len(commands)
+        return merge_results(commands, queued, await pipe.execute())
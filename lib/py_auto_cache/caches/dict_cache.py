@@ -2,11 +2,17 @@
 """
 Created by yanghg at 18-5-7 下午5:41
 """
+import copy
 import time
 import fnmatch
-from ..cache import Cache
+import heapq
+import itertools
+import threading
+import weakref
+from ..cache import Cache, _pipeline_keys
+from .eviction import policies
 from ..error import ClientError
-from ..util import wrap_client_exception, transcode
+from ..util import StringTypes, wrap_client_exception, transcode
 
 
 class DictClientError(ClientError):
@@ -24,71 +30,404 @@ class ParameterError(DictClientError):
 dict_error_wrapper = wrap_client_exception((IndexError, KeyError, ValueError), DictClientError)
 
 
+class Record(object):
+    """
+    A value kept by DictCache, with its expiry time (None means never)
+    """
+    __slots__ = ('value', 'expire_at')
+
+    def __init__(self, value, expire_at=None):
+        self.value = value
+        self.expire_at = expire_at
+
+    def is_expired(self, now):
+        return self.expire_at is not None and now >= self.expire_at
+
+
+class _Shard(object):
+    """
+    A part of DictCache: the entries whose keys hash to it, with their own lock,
+    eviction policy, expiry index and bounds.
+    """
+
+    def __init__(self, max_entries, max_bytes, eviction, sweep_batch, entry_size):
+        super(_Shard, self).__init__()
+        self.lock = threading.RLock()
+        self.dict = {}
+
+        self._max_entries = max_entries
+        self._max_bytes = max_bytes
+        self._sweep_batch = sweep_batch
+        self._entry_size = entry_size
+        self.bytes = 0
+        self.evictions = 0
+        self.expirations = 0
+        # an unbounded cache never evicts, don't pay for tracking the usage
+        bounded = max_entries is not None or max_bytes is not None
+        self._policy = policies[eviction]() if bounded else None
+
+        # the expiry index: a heap of (expire_at, sequence, key, record).
+        # overwritten or deleted records stay in it until they reach the top.
+        self._expiry_heap = []
+        self._sequence = itertools.count()
+
+    def get(self, key, now):
+        record = self.dict.get(key)
+        if record is None:
+            return None
+        if record.is_expired(now):
+            self.remove(key)
+            return None
+        if self._policy is not None:
+            self._policy.touch(key)
+        return record.value
+
+    def store(self, key, record):
+        self.sweep(self._sweep_batch)
+        size = self._entry_size(key, record)
+        old_record = self.dict.get(key)
+        if old_record is None:
+            # make room before adding the key, or a new key is the first victim of lfu
+            self._evict(1, size)
+        else:
+            self.bytes -= self._entry_size(key, old_record)
+        self.dict[key] = record
+        self.bytes += size
+        if record.expire_at is not None:
+            heapq.heappush(self._expiry_heap, (record.expire_at, next(self._sequence), key, record))
+        if self._policy is not None:
+            self._policy.add(key)
+            self._evict()
+
+    def remove(self, key):
+        record = self.dict.pop(key, None)
+        if record is None:
+            return False
+        self.bytes -= self._entry_size(key, record)
+        if self._policy is not None:
+            self._policy.remove(key)
+        return True
+
+    def _evict(self, extra_entries=0, extra_bytes=0):
+        """
+        Evict entries until extra entries and extra bytes can be added within the bounds
+        """
+        if self._policy is None:
+            return
+        while self.dict and (
+                (self._max_entries is not None and len(self.dict) + extra_entries > self._max_entries) or
+                (self._max_bytes is not None and self.bytes + extra_bytes > self._max_bytes)):
+            self.remove(self._policy.victim())
+            self.evictions += 1
+
+    def sweep(self, limit=None):
+        """
+        Remove expired entries from the top of the expiry index
+
+        :param int limit: remove at most limit entries, None means all the expired ones
+        :return: how many entries are removed
+        """
+        heap = self._expiry_heap
+        now = time.time()
+        count = 0
+        while heap and heap[0][0] <= now and (limit is None or count < limit):
+            _, _, key, record = heapq.heappop(heap)
+            # skip the record if it has been overwritten or deleted
+            if self.dict.get(key) is record:
+                self.remove(key)
+                self.expirations += 1
+                count += 1
+        if len(heap) > 2 * len(self.dict) + self._sweep_batch:
+            # too many overwritten records, rebuild the index from the live ones
+            self._expiry_heap = [item for item in heap if self.dict.get(item[2]) is item[3]]
+            heapq.heapify(self._expiry_heap)
+        return count
+
+
 class DictCache(Cache):
     """
     Implement a local cache server by python dict
+
+    It can be bounded by the number of entries and/or by the bytes of keys and values,
+    the entries chosen by the eviction policy are removed to stay within the bounds.
+
+    Expired entries are removed even if they are never read again: their expiry times
+    are kept in a heap, and every set removes a few of the expired ones from its top.
+    A background thread can sweep them as well.
+
+    Every operation on a key is atomic, including conditional sets and increase.
+    Keys are spread over shards by their hash, each shard has its own lock,
+    so threads working on different shards don't wait for each other.
+    Bounds are split evenly between the shards, and each shard evicts its own entries:
+    so the eviction order is exact over all the entries with one shard only, which is
+    why a bounded cache has one shard unless told otherwise.
+
+    With objects=True, values are kept as they are given instead of as strings, so AutoCache
+    stores its results as live objects and never serializes them. The objects are shared
+    with the callers unless copy_objects is True: then they are deep copied in and out,
+    so a caller changing what it got or set never changes what is cached.
     """
 
-    def __init__(self):
+    # how many expired entries a set removes at most
+    sweep_batch = 16
+    # how many shards an unbounded cache has by default
+    default_shards = 8
+
+    def __init__(self, max_entries=None, max_bytes=None, eviction='lru', sweep_interval=None, shards=None,
+                 objects=False, copy_objects=False):
+        """
+        :param int max_entries: how many entries can be kept, None means no limit
+        :param int max_bytes: how many bytes of keys and values can be kept, None means no limit
+        :param str eviction: which entry to evict first, one of:
+                             'lru' (least recently used) or 'lfu' (least frequently used)
+        :param float sweep_interval: if given, a daemon thread removes all the expired entries
+                                     every sweep_interval seconds
+        :param int shards: how many shards (and locks) the entries are spread over,
+                           use more shards for a cache shared by many threads.
+                           None means default_shards for an unbounded cache, and 1 for a bounded one.
+                           There are never more shards than max_entries
+        :param bool objects: keep the values as they are, without turning them into strings.
+                             Live objects have no size in bytes, so max_bytes can't bound them
+        :param bool copy_objects: with objects, give and keep deep copies of the values
+                                  instead of sharing them, which must not be changed then.
+                                  A deep copy of a large value may cost more than unpickling it
+        """
         super(DictCache, self).__init__()
-        self._dict = {}
+        if eviction not in policies:
+            raise ParameterError('eviction must be one of {}'.format(sorted(policies)))
+        if shards is None:
+            shards = 1 if max_entries is not None or max_bytes is not None else self.default_shards
+        if shards < 1:
+            raise ParameterError('shards must be at least 1')
+        if max_entries:
+            # every shard can keep an entry at least
+            shards = min(shards, max_entries)
+        if objects and max_bytes is not None:
+            raise ParameterError('max_bytes can not bound objects, use max_entries')
+
+        self._max_entries = max_entries
+        self._max_bytes = max_bytes
+        self.stores_objects = objects
+        self._copy_objects = objects and copy_objects
+        entry_size = _object_entry_size if objects else _entry_size
+        self._shards = [_Shard(_split(max_entries, shards, i), _split(max_bytes, shards, i), eviction,
+                               self.sweep_batch, entry_size)
+                        for i in range(shards)]
+        if sweep_interval is not None:
+            _start_sweeper(self, sweep_interval)
+
+    def _get_shard(self, key):
+        return self._shards[self._shard_index(key)]
+
+    def _shard_index(self, key):
+        return hash(key) % len(self._shards)
+
+    def sweep(self):
+        """
+        Remove all the expired entries now
+
+        :return: how many entries are removed
+        :rtype: int
+        """
+        count = 0
+        for shard in self._shards:
+            with shard.lock:
+                count += shard.sweep()
+        return count
+
+    def stats(self):
+        """
+        Returns the usage of this cache
+
+        - entries, bytes: how much is used by entries which are not expired
+        - max_entries, max_bytes: the bounds, None means no limit
+        - evictions: how many entries have been evicted to stay within the bounds
+        - expirations: how many expired entries have been removed without being read
+
+        :rtype: dict
+        """
+        stats = {
+            'entries': 0,
+            'bytes': 0,
+            'max_entries': self._max_entries,
+            'max_bytes': self._max_bytes,
+            'evictions': 0,
+            'expirations': 0,
+        }
+        for shard in self._shards:
+            with shard.lock:
+                shard.sweep()
+                stats['entries'] += len(shard.dict)
+                stats['bytes'] += shard.bytes
+                stats['evictions'] += shard.evictions
+                stats['expirations'] += shard.expirations
+        return stats
 
     @dict_error_wrapper
     def get(self, key):
         key = transcode(key)
-        value_tuple = self._dict.get(key)
-        if value_tuple is None:
-            return None
-        if value_tuple[2] is not None and time.time() - value_tuple[1] > value_tuple[2]:
-            del self._dict[key]
-            return None
-        return value_tuple[0]
+        shard = self._get_shard(key)
+        with shard.lock:
+            value = shard.get(key, time.time())
+        if self._copy_objects and value is not None:
+            value = copy.deepcopy(value)
+        return value
+
+    def _to_record_value(self, value):
+        if self.stores_objects:
+            return copy.deepcopy(value) if self._copy_objects else value
+        if not isinstance(value, bytes):
+            # keep binary values (eg: pickled ones) as they are
+            value = transcode(value)
+        return value
 
     @dict_error_wrapper
     def set(self, key, value, expire_seconds=None, only_if_new=False, only_if_old=False):
         key = transcode(key)
-        value = transcode(value)
+        value = self._to_record_value(value)
         if only_if_new and only_if_old:
             raise ParameterError('You can only give one of only_if_new or only_if_old')
 
-        _set_flag = True
-        _key_in_cache = self.get(key) is not None
-        if only_if_new and _key_in_cache:
-            _set_flag = False
-        if only_if_old and not _key_in_cache:
-            _set_flag = False
+        shard = self._get_shard(key)
+        with shard.lock:
+            now = time.time()
+            _set_flag = True
+            if only_if_new or only_if_old:
+                _key_in_cache = shard.get(key, now) is not None
+                if only_if_new and _key_in_cache:
+                    _set_flag = False
+                if only_if_old and not _key_in_cache:
+                    _set_flag = False
 
-        if _set_flag:
-            self._dict[key] = (value, time.time(), expire_seconds)
-            return True
-        return False
+            if _set_flag:
+                shard.store(key, Record(value, None if expire_seconds is None else now + expire_seconds))
+                return True
+            return False
 
     @dict_error_wrapper
     def delete(self, keys):
         count = 0
         for key in keys:
             key = transcode(key)
-            if key in self._dict:
-                del self._dict[key]
-                count += 1
+            shard = self._get_shard(key)
+            with shard.lock:
+                if shard.remove(key):
+                    count += 1
         return count
 
     @dict_error_wrapper
     def get_keys(self, pattern='*'):
+        return list(self.iter_keys(pattern))
+
+    @dict_error_wrapper
+    def iter_keys(self, pattern='*', batch=None):
+        # a shard at a time, only the keys of one shard are copied
         pattern = transcode(pattern)
-        return [key for key in self._dict.keys() if fnmatch.fnmatch(key, pattern)]
+        for shard in self._shards:
+            now = time.time()
+            with shard.lock:
+                keys = [key for key, record in shard.dict.items() if not record.is_expired(now)]
+            for key in keys:
+                if fnmatch.fnmatch(key, pattern):
+                    yield key
 
     @dict_error_wrapper
     def increase(self, key, amount=1):
         key = transcode(key)
-        return super(DictCache, self).increase(key, amount)
+        # the lock is reentrant, hold it through the get and the set of Cache.increase
+        with self._get_shard(key).lock:
+            return super(DictCache, self).increase(key, amount)
 
     @dict_error_wrapper
     def multi_get(self, keys):
         keys = [transcode(key) for key in keys]
         return super(DictCache, self).multi_get(keys)
 
+    @dict_error_wrapper
+    def multi_set(self, mapping, expire_seconds=None):
+        items = [(transcode(key), self._to_record_value(value)) for key, value in mapping.items()]
+        # every shard is locked once for all its keys
+        for index, positions in self._group_by_shard([key for key, _ in items]).items():
+            shard = self._shards[index]
+            with shard.lock:
+                expire_at = None if expire_seconds is None else time.time() + expire_seconds
+                for i in positions:
+                    key, value = items[i]
+                    shard.store(key, Record(value, expire_at))
+        return True
+
+    @dict_error_wrapper
+    def multi_delete(self, keys):
+        keys = [transcode(key) for key in keys]
+        results = [False] * len(keys)
+        for index, positions in self._group_by_shard(keys).items():
+            shard = self._shards[index]
+            with shard.lock:
+                for i in positions:
+                    results[i] = shard.remove(keys[i])
+        return results
+
+    def _group_by_shard(self, keys):
+        """
+        Returns the positions of the given keys in every shard
+        """
+        shards = {}
+        for i, key in enumerate(keys):
+            shards.setdefault(self._shard_index(key), []).append(i)
+        return shards
+
+    @dict_error_wrapper
+    def _execute_pipeline(self, commands):
+        # hold the locks of all the shards written, always in the same order so pipelines never deadlock
+        indexes = sorted(set(self._shard_index(transcode(key)) for key in _pipeline_keys(commands)))
+        locks = [self._shards[index].lock for index in indexes]
+        for lock in locks:
+            lock.acquire()
+        try:
+            return super(DictCache, self)._execute_pipeline(commands)
+        finally:
+            for lock in reversed(locks):
+                lock.release()
+
     @dict_error_wrapper
     def clear(self, pattern='*'):
         pattern = transcode(pattern)
         return super(DictCache, self).clear(pattern)
+
+
+def _split(limit, shards, index):
+    """
+    Returns the part of limit of the shard index, the first shards take the remainder so they sum up to limit
+    """
+    if limit is None:
+        return None
+    return limit // shards + (1 if index < limit % shards else 0)
+
+
+def _entry_size(key, record):
+    return len(key) + len(record.value)
+
+
+def _object_entry_size(key, record):
+    # only the strings have a size, like Cache.memory_size counts them
+    return len(key) + (len(record.value) if isinstance(record.value, StringTypes) else 0)
+
+
+def _start_sweeper(cache, interval):
+    """
+    Start a daemon thread calling cache.sweep every interval seconds, until the cache is collected
+    """
+    cache_ref = weakref.ref(cache)
+
+    def sweep_forever():
+        while True:
+            time.sleep(interval)
+            cache = cache_ref()
+            if cache is None:
+                return
+            cache.sweep()
+            del cache
+
+    thread = threading.Thread(target=sweep_forever, name='py_auto_cache-sweeper')
+    thread.daemon = True
+    thread.start()
@@ -57,12 +57,22 @@ class Dispatcher(Cache):
     def get_keys(self, pattern='*'):
         return self._dispatched_caches[0].get_keys(pattern)
 
+    def iter_keys(self, pattern='*', batch=None):
+        return self._dispatched_caches[0].iter_keys(pattern, batch)
+
     def increase(self, key, amount=1):
         return self._dispatched_caches[0].increase(key, amount)
 
     def multi_get(self, keys):
         return self._dispatched_caches[0].multi_get(keys)
 
+    def multi_set(self, mapping, expire_seconds=None):
+        return self._dispatched_caches[0].multi_set(mapping, expire_seconds)
+
+    def multi_delete(self, keys):
+        results = [dispatched_cache.multi_delete(keys) for dispatched_cache in self._dispatched_caches]
+        return results[0]
+
     def clear(self, pattern='*'):
         deleted_count = 0
         for dispatched_cache in self._dispatched_caches:
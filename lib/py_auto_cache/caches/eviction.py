@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+"""
+Eviction policies of bounded local caches
+
+A policy only tracks keys, every operation is O(1):
+    add(key)     a key is written
+    touch(key)   a key is read
+    remove(key)  a key is deleted or expired
+    victim()     the key to evict next
+"""
+from collections import OrderedDict
+
+
+def _move_to_end(ordered_dict, key):
+    try:
+        ordered_dict.move_to_end(key)
+    except AttributeError:
+        # python 2 has no move_to_end
+        ordered_dict[key] = ordered_dict.pop(key)
+
+
+class LRUPolicy(object):
+    """
+    Evict the least recently used key
+    """
+
+    def __init__(self):
+        super(LRUPolicy, self).__init__()
+        self._order = OrderedDict()
+
+    def add(self, key):
+        if key in self._order:
+            _move_to_end(self._order, key)
+        else:
+            self._order[key] = None
+
+    def touch(self, key):
+        if key in self._order:
+            _move_to_end(self._order, key)
+
+    def remove(self, key):
+        self._order.pop(key, None)
+
+    def victim(self):
+        return next(iter(self._order))
+
+    def __len__(self):
+        return len(self._order)
+
+
+class LFUPolicy(object):
+    """
+    Evict the least frequently used key, the least recently used one among the same frequency.
+
+    Keys are kept in buckets by their frequency, and the buckets in a linked list ordered by frequency,
+    so reading a key only moves it to the next bucket and the least frequent bucket is always the first.
+    """
+
+    def __init__(self):
+        super(LFUPolicy, self).__init__()
+        self._frequencies = {}
+        self._buckets = {}
+        # frequency -> the next lower / higher frequency having a bucket, None at the ends
+        self._lower = {}
+        self._higher = {}
+        self._lowest = None
+
+    def _link(self, frequency, lower):
+        """
+        Add the bucket of frequency right after the bucket of lower, None means first
+        """
+        higher = self._lowest if lower is None else self._higher[lower]
+        self._buckets[frequency] = OrderedDict()
+        self._lower[frequency] = lower
+        self._higher[frequency] = higher
+        if lower is None:
+            self._lowest = frequency
+        else:
+            self._higher[lower] = frequency
+        if higher is not None:
+            self._lower[higher] = frequency
+
+    def _unlink(self, key, frequency):
+        bucket = self._buckets[frequency]
+        del bucket[key]
+        if bucket:
+            return
+        del self._buckets[frequency]
+        lower = self._lower.pop(frequency)
+        higher = self._higher.pop(frequency)
+        if lower is None:
+            self._lowest = higher
+        else:
+            self._higher[lower] = higher
+        if higher is not None:
+            self._lower[higher] = lower
+
+    def add(self, key):
+        if key in self._frequencies:
+            self.touch(key)
+            return
+        self._frequencies[key] = 1
+        if 1 not in self._buckets:
+            self._link(1, None)
+        self._buckets[1][key] = None
+
+    def touch(self, key):
+        frequency = self._frequencies.get(key)
+        if frequency is None:
+            return
+        if frequency + 1 not in self._buckets:
+            self._link(frequency + 1, frequency)
+        self._buckets[frequency + 1][key] = None
+        self._frequencies[key] = frequency + 1
+        self._unlink(key, frequency)
+
+    def remove(self, key):
+        frequency = self._frequencies.pop(key, None)
+        if frequency is not None:
+            self._unlink(key, frequency)
+
+    def victim(self):
+        return next(iter(self._buckets[self._lowest]))
+
+    def __len__(self):
+        return len(self._frequencies)
+
+
+policies = {
+    'lru': LRUPolicy,
+    'lfu': LFUPolicy,
+}
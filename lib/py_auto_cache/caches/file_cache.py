@@ -5,13 +5,21 @@ Created by yanghg at 18-11-19 下午5:05
 import json
 import os
 import hashlib
+import re
 import time
 import fnmatch
 import tempfile
-from ..cache import Cache
+import threading
+from contextlib import contextmanager
+from ..cache import Cache, _pipeline_keys
 from ..error import ClientError
 from ..util import wrap_client_exception, transcode
 
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
 
 class FileClientError(ClientError):
     """
@@ -29,48 +37,336 @@ file_error_wrapper = wrap_client_exception((IndexError, KeyError, ValueError, IO
 
 
 def get_md5(key):
+    if not isinstance(key, bytes):
+        key = key.encode('utf-8')
     md5 = hashlib.md5()
     md5.update(key)
     return md5.hexdigest()
 
 
+def _makedirs(path):
+    if not os.path.isdir(path):
+        try:
+            os.makedirs(path)
+        except OSError:
+            # another process may create it at the same time
+            if not os.path.isdir(path):
+                raise
+
+
+def _replace(src, dst):
+    try:
+        os.replace(src, dst)
+    except AttributeError:
+        # python 2 has no os.replace, os.rename overwrites dst on posix
+        os.rename(src, dst)
+
+
+# a bucket of the flat layout, directly in the cache root, see FileCache._migrate_flat_buckets
+_flat_bucket_re = re.compile(r'^[0-9a-f]{32}$')
+
+
+def _is_expired(value_tuple):
+    return value_tuple[2] is not None and time.time() - value_tuple[1] > value_tuple[2]
+
+
 class FileCache(Cache):
     """
     Implement a local cache server by python file
+
+    Keys are stored in bucket files named by the md5 of the key, under two levels
+    of directories named by its first four hex digits (eg: ab/cd/abcd...), so no directory
+    holds too many files. A bucket is rewritten to a temporary file renamed over the bucket,
+    readers never see a half written one. Read-modify-write operations hold an fcntl lock of
+    the directory of the bucket (eg: ab/cd.lock), so many processes can share a cache root.
+    The buckets of the former flat layout (in the cache root itself) are moved to their
+    directory when a FileCache opens the cache root.
+
+    Besides the buckets, a key index keeps the size and the expiry time of every key,
+    so get_keys, clear and memory_size never open the buckets. The index is a journal
+    of json lines appended on every write, deletion and expiry, which is shared by all the
+    processes using the same cache root: every process reads the lines appended since its
+    last read, and the journal is rewritten with only the live keys when it grows too long.
     """
 
     cache_root = os.path.join(tempfile.gettempdir(), 'cache')
+    lock_suffix = '.lock'
+    index_name = '.index'
+    # rewrite the index journal when it has this many lines more than twice the live keys
+    index_slack = 1000
 
     def __init__(self, cache_root=None):
         super(FileCache, self).__init__()
         self._cache_root = self.cache_root if cache_root is None else cache_root
 
+        # the index read from the journal: key -> (size, expire at)
+        self._index_mutex = threading.RLock()
+        self._index = {}
+        self._index_inode = None
+        self._index_offset = 0
+        self._index_lines = 0
+        self._index_appends = 0
+
+        # the locks held by the current thread, see _lock
+        self._held_locks = threading.local()
+        self._migrate_flat_buckets()
+
+    def _index_path(self):
+        return os.path.join(self._cache_root, self.index_name)
+
+    def _apply_index(self, line):
+        record = json.loads(line)
+        if record[0] == '+':
+            self._index[record[1]] = (record[2], record[3])
+        else:
+            self._index.pop(record[1], None)
+        self._index_lines += 1
+
+    def _refresh_index(self):
+        """
+        Read the lines appended to the journal since the last read,
+        or read it again if it has been rewritten.
+        """
+        path = self._index_path()
+        if not os.path.isfile(path):
+            self._build_index()
+        with open(path, 'rb') as f:
+            stat = os.fstat(f.fileno())
+            if stat.st_ino != self._index_inode or stat.st_size < self._index_offset:
+                self._index = {}
+                self._index_inode = stat.st_ino
+                self._index_offset = 0
+                self._index_lines = 0
+            if stat.st_size == self._index_offset:
+                return
+            f.seek(self._index_offset)
+            data = f.read()
+        # the last line may be being appended
+        end = data.rfind(b'\n') + 1
+        for line in data[:end].splitlines():
+            self._apply_index(line.decode('utf-8'))
+        self._index_offset += end
+
+    def _build_index(self):
+        """
+        Build the journal by reading all the buckets, for a cache root written without index
+        """
+        path = self._index_path()
+        with self._lock(path):
+            if os.path.isfile(path):
+                return
+            lines = []
+            for fp in self._iter_buckets():
+                for key, value_tuple in self._read(fp).items():
+                    lines.append(_index_line(key, _index_entry(value_tuple)))
+            self._replace_index(lines)
+
+    def _replace_index(self, lines):
+        path = self._index_path()
+        temp_path = '{}.{}.tmp'.format(path, os.getpid())
+        with open(temp_path, 'w') as f:
+            f.writelines(lines)
+        _replace(temp_path, path)
+
+    def _log_index(self, items):
+        """
+        Append a line for every written (or deleted if value_tuple is None) key to the journal.
+
+        It must be called while holding the lock of the bucket of the keys,
+        so the lines of a key are in the same order as its writes.
+
+        :param list[tuple] items: (key, value_tuple) of every key
+        """
+        path = self._index_path()
+        if not os.path.isfile(path):
+            self._build_index()
+        with self._lock(path):
+            with open(path, 'a') as f:
+                f.write(''.join(_index_line(key, None if value_tuple is None else _index_entry(value_tuple))
+                                for key, value_tuple in items))
+        appends = self._index_appends
+        self._index_appends += len(items)
+        if appends // self.index_slack != self._index_appends // self.index_slack:
+            self.compact_index()
+
+    def compact_index(self):
+        """
+        Rewrite the index journal with only the live keys, if it is too long
+
+        :return: True if the journal is rewritten
+        :rtype: bool
+        """
+        if not os.path.isfile(self._index_path()):
+            return False
+        with self._index_mutex, self._lock(self._index_path()):
+            self._refresh_index()
+            if self._index_lines <= 2 * len(self._index) + self.index_slack:
+                return False
+            now = time.time()
+            self._replace_index([_index_line(key, entry) for key, entry in self._index.items()
+                                 if entry[1] is None or now < entry[1]])
+            return True
+
+    def _indexed_keys(self):
+        """
+        Returns the live keys with their sizes
+
+        :rtype: dict
+        """
+        now = time.time()
+        with self._index_mutex:
+            self._refresh_index()
+            return dict((key, size) for key, (size, expire_at) in self._index.items()
+                        if expire_at is None or now < expire_at)
+
     def _get_fp(self, key):
-        return os.path.join(self._cache_root, get_md5(key))
+        return self._bucket_path(get_md5(key))
+
+    def _bucket_path(self, md5):
+        return os.path.join(self._cache_root, md5[:2], md5[2:4], md5)
+
+    def _iter_buckets(self):
+        for dir_path, _, file_names in os.walk(self._cache_root):
+            for fn in file_names:
+                if dir_path == self._cache_root:
+                    # the root holds the index, and the buckets not migrated yet
+                    if _flat_bucket_re.match(fn):
+                        yield os.path.join(dir_path, fn)
+                elif not fn.endswith(self.lock_suffix) and not fn.endswith('.tmp'):
+                    yield os.path.join(dir_path, fn)
+
+    def _migrate_flat_buckets(self):
+        """
+        Move the buckets written in the cache root by the former flat layout to their directory
+
+        Their keys are merged into the bucket of the new layout, whose keys are newer and win.
+        Every moved key is logged again to the index, so the index matches the buckets after the move.
+        """
+        if not os.path.isdir(self._cache_root):
+            return
+        for fn in os.listdir(self._cache_root):
+            flat_fp = os.path.join(self._cache_root, fn)
+            if fn.endswith(self.lock_suffix) and _flat_bucket_re.match(fn[:-len(self.lock_suffix)]):
+                # the lock of a flat bucket
+                _remove(flat_fp)
+                continue
+            if not _flat_bucket_re.match(fn):
+                continue
+            fp = self._bucket_path(fn)
+            with self._lock(fp):
+                # another process may have moved it already
+                if not os.path.isfile(flat_fp):
+                    continue
+                merged = self._read(flat_fp)
+                merged.update(self._read(fp))
+                if merged:
+                    self._write_many(fp, list(merged.items()))
+                _remove(flat_fp)
 
     def _read(self, fp):
         if not os.path.isfile(fp):
             return {}
         with open(fp) as f:
-            return json.load(f, 'ascii')
+            return json.load(f)
+
+    def _lock_path(self, fp):
+        """
+        Returns the lock file of a bucket, shared by the buckets of its directory (eg: ab/cd.lock),
+        the files of the cache root (like the index) have their own lock
+        """
+        dir_path = os.path.dirname(fp)
+        if dir_path == self._cache_root:
+            return fp + self.lock_suffix
+        return dir_path + self.lock_suffix
+
+    @contextmanager
+    def _lock(self, fp):
+        """
+        Hold an exclusive advisory lock of the given bucket file.
+
+        It makes read-modify-write operations of one bucket atomic between threads
+        and processes sharing the cache root. It does nothing if fcntl is not available.
+        It is reentrant: a thread already holding the lock (of any bucket of the directory) just goes on.
+        """
+        with self._hold(self._lock_path(fp)):
+            yield
+
+    @contextmanager
+    def _hold(self, lock_path):
+        held = getattr(self._held_locks, 'paths', None)
+        if held is None:
+            held = self._held_locks.paths = set()
+        if fcntl is None or lock_path in held:
+            yield
+            return
+        _makedirs(os.path.dirname(lock_path))
+        with open(lock_path, 'a') as f:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            held.add(lock_path)
+            try:
+                yield
+            finally:
+                held.discard(lock_path)
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    @contextmanager
+    def _lock_all(self, fps):
+        """
+        Hold the locks of all the given bucket files, in the order of their lock files so nobody deadlocks
+        """
+        with self._hold_all(sorted(set(self._lock_path(fp) for fp in fps))):
+            yield
+
+    @contextmanager
+    def _hold_all(self, lock_paths):
+        if not lock_paths:
+            yield
+            return
+        with self._hold(lock_paths[0]):
+            with self._hold_all(lock_paths[1:]):
+                yield
 
     def _write(self, key, value, fp):
+        return self._write_many(fp, [(key, value)])[0]
+
+    def _write_many(self, fp, items):
+        """
+        Write keys of the same bucket file, the file is rewritten once
+
+        :param list[tuple] items: (key, value_tuple) of every key, value_tuple None means deleting the key
+        :return: for every key, whether it is written (or deleted)
+        :rtype: list[bool]
+        """
         if os.path.isfile(fp):
             jd = self._read(fp)
         else:
-            if not os.path.isdir(self._cache_root):
-                os.makedirs(self._cache_root)
+            _makedirs(os.path.dirname(fp))
             jd = {}
-        if value is None:
-            if key in jd:
-                del jd[key]
+        results = []
+        for key, value in items:
+            if value is None:
+                results.append(jd.pop(key, None) is not None)
             else:
-                return False
-        else:
-            jd[key] = value
-        with open(fp, 'w') as f:
-            json.dump(jd, f, encoding='ascii')
-        return True
+                jd[key] = value
+                results.append(True)
+        changed = [item for item, result in zip(items, results) if result]
+        if not changed:
+            return results
+        temp_fp = '{}.{}.{}.tmp'.format(fp, os.getpid(), threading.current_thread().ident)
+        with open(temp_fp, 'w') as f:
+            json.dump(jd, f)
+        _replace(temp_fp, fp)
+        self._log_index(changed)
+        return results
+
+    def _group_by_bucket(self, keys):
+        """
+        Returns the positions of the given keys in every bucket file
+        """
+        buckets = {}
+        for i, key in enumerate(keys):
+            buckets.setdefault(self._get_fp(key), []).append(i)
+        return buckets
 
     @file_error_wrapper
     def get(self, key):
@@ -80,8 +376,12 @@ class FileCache(Cache):
         value_tuple = jd.get(key, None)
         if value_tuple is None:
             return None
-        if value_tuple[2] is not None and time.time() - value_tuple[1] > value_tuple[2]:
-            self._write(key, None, fp)
+        if _is_expired(value_tuple):
+            with self._lock(fp):
+                # it may have been set again after we read it
+                value_tuple = self._read(fp).get(key, None)
+                if value_tuple is not None and _is_expired(value_tuple):
+                    self._write(key, None, fp)
             return None
         return transcode(value_tuple[0])
 
@@ -93,54 +393,110 @@ class FileCache(Cache):
         if only_if_new and only_if_old:
             raise ParameterError('You can only give one of only_if_new or only_if_old')
 
-        _set_flag = True
-        _key_in_cache = self.get(key) is not None
-        if only_if_new and _key_in_cache:
-            _set_flag = False
-        if only_if_old and not _key_in_cache:
-            _set_flag = False
+        with self._lock(fp):
+            _set_flag = True
+            if only_if_new or only_if_old:
+                value_tuple = self._read(fp).get(key, None)
+                _key_in_cache = value_tuple is not None and not _is_expired(value_tuple)
+                if only_if_new and _key_in_cache:
+                    _set_flag = False
+                if only_if_old and not _key_in_cache:
+                    _set_flag = False
 
-        if _set_flag:
-            self._write(key, (value, time.time(), expire_seconds), fp)
-            return True
-        return False
+            if _set_flag:
+                self._write(key, (value, time.time(), expire_seconds), fp)
+                return True
+            return False
 
     @file_error_wrapper
     def delete(self, keys):
-        count = 0
-        for key in keys:
-            key = transcode(key)
-            fp = self._get_fp(key)
-            if self._write(key, None, fp):
-                count += 1
-        return count
+        return sum(self.multi_delete(keys))
+
+    @file_error_wrapper
+    def multi_set(self, mapping, expire_seconds=None):
+        items = [(transcode(key), transcode(value)) for key, value in mapping.items()]
+        for fp, positions in self._group_by_bucket([key for key, _ in items]).items():
+            with self._lock(fp):
+                now = time.time()
+                self._write_many(fp, [(items[i][0], (items[i][1], now, expire_seconds)) for i in positions])
+        return True
+
+    @file_error_wrapper
+    def multi_delete(self, keys):
+        keys = [transcode(key) for key in keys]
+        results = [False] * len(keys)
+        for fp, positions in self._group_by_bucket(keys).items():
+            with self._lock(fp):
+                for i, result in zip(positions, self._write_many(fp, [(keys[i], None) for i in positions])):
+                    results[i] = result
+        return results
 
     @file_error_wrapper
     def get_keys(self, pattern='*'):
+        return list(self.iter_keys(pattern))
+
+    @file_error_wrapper
+    def iter_keys(self, pattern='*', batch=None):
+        # the keys come from the index, no bucket is opened
         pattern = transcode(pattern)
-        keys = []
         if not os.path.isdir(self._cache_root):
-            return keys
-        for fn in os.listdir(self._cache_root):
-            fp = os.path.join(self._cache_root, fn)
-            with open(fp) as f:
-                for key in json.load(f):
-                    if fnmatch.fnmatch(key, pattern):
-                        keys.append(key)
-
-        return keys
+            return
+        for key in self._indexed_keys():
+            if fnmatch.fnmatch(key, pattern):
+                yield key
 
     @file_error_wrapper
     def increase(self, key, amount=1):
         key = transcode(key)
-        return super(FileCache, self).increase(key, amount)
+        # the lock is reentrant, hold it through the get and the set of Cache.increase
+        with self._lock(self._get_fp(key)):
+            return super(FileCache, self).increase(key, amount)
 
     @file_error_wrapper
     def multi_get(self, keys):
         keys = [transcode(key) for key in keys]
         return super(FileCache, self).multi_get(keys)
 
+    @file_error_wrapper
+    def _execute_pipeline(self, commands):
+        fps = [self._get_fp(transcode(key)) for key in _pipeline_keys(commands)]
+        with self._lock_all(fps):
+            return super(FileCache, self)._execute_pipeline(commands)
+
     @file_error_wrapper
     def clear(self, pattern='*'):
         pattern = transcode(pattern)
         return super(FileCache, self).clear(pattern)
+
+    @file_error_wrapper
+    def memory_size(self, keys):
+        if not os.path.isdir(self._cache_root):
+            return 0
+        sizes = self._indexed_keys()
+        return sum(len(key) + sizes[key] for key in (transcode(key) for key in keys) if key in sizes)
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        # another process may have removed it
+        if os.path.exists(path):
+            raise
+
+
+def _index_entry(value_tuple):
+    """
+    (value, stored at, expire seconds) of a bucket -> (size, expire at) of the index
+    """
+    value, stored_at, expire_seconds = value_tuple
+    return len(value), None if expire_seconds is None else stored_at + expire_seconds
+
+
+def _index_line(key, entry):
+    """
+    A line of the index journal, entry is None for a deleted key
+    """
+    if entry is None:
+        return json.dumps(['-', key]) + '\n'
+    return json.dumps(['+', key, entry[0], entry[1]]) + '\n'
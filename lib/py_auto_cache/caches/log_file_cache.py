@@ -0,0 +1,450 @@
+# -*- coding: utf-8 -*-
+"""
+A log-structured local cache on disk
+"""
+import fnmatch
+import os
+import struct
+import tempfile
+import threading
+import time
+import zlib
+from logging import getLogger
+from ..cache import Cache
+from ..error import ClientError
+from ..util import wrap_client_exception, transcode
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = getLogger('py_auto_cache')
+
+
+class LogFileClientError(ClientError):
+    """
+    Base class for all errors come from log file client
+    """
+
+
+class ParameterError(LogFileClientError):
+    """
+    Be raised if the parameter is invalid
+    """
+
+
+class LockedError(LogFileClientError):
+    """
+    Be raised if the cache root is already opened by another process
+    """
+
+
+log_file_error_wrapper = wrap_client_exception((IndexError, KeyError, ValueError, IOError, OSError),
+                                               LogFileClientError)
+
+# crc32, key length, value length, expire at (0 means never), flags
+_record_header = struct.Struct('>IIIdB')
+
+_FLAG_DELETED = 1
+_FLAG_TEXT = 2
+
+_segment_suffix = '.log'
+
+
+class LogFileCache(Cache):
+    """
+    Implement a local cache server by append-only segment files
+
+    Every set or delete appends one record to the active segment file, nothing is rewritten.
+    The location of the last record of every key is kept in an in-memory index,
+    which is rebuilt by scanning the segments when the cache is opened.
+    A get is one index lookup and one read of the value.
+
+    When the active segment is larger than segment_size, a new one is started.
+    Records overwritten, deleted or expired are garbage in the old segments,
+    a background thread copies the live records of the segments with too much garbage
+    to the active segment and removes them.
+
+    Values are stored as bytes, text values are given back as text.
+
+    Only one process can open a cache root at the same time,
+    the index lives in the memory of that process.
+    """
+
+    cache_root = os.path.join(tempfile.gettempdir(), 'log_cache')
+    segment_size = 64 * 1024 * 1024
+    # a segment is compacted when this ratio of its bytes is garbage
+    compact_ratio = 0.5
+
+    def __init__(self, cache_root=None, segment_size=None, compact_ratio=None, fsync=False):
+        """
+        :param str cache_root: the directory of the segment files
+        :param int segment_size: start a new segment file after this many bytes
+        :param float compact_ratio: compact a segment when this ratio of its bytes is garbage
+        :param bool fsync: if True, every write is flushed to the disk before returning
+        """
+        super(LogFileCache, self).__init__()
+        self._cache_root = self.cache_root if cache_root is None else cache_root
+        self._segment_size = self.segment_size if segment_size is None else segment_size
+        self._compact_ratio = self.compact_ratio if compact_ratio is None else compact_ratio
+        self._fsync = fsync
+
+        self._lock = threading.RLock()
+        # key -> (segment id, offset, record size, expire at)
+        self._index = {}
+        # segment id -> [file object, size, garbage size]
+        self._segments = {}
+        self._active_id = None
+        self._compacting = threading.Event()
+        self._compactor = None
+        # only one compaction at a time
+        self._compact_lock = threading.Lock()
+
+        if not os.path.isdir(self._cache_root):
+            os.makedirs(self._cache_root)
+        self._lock_file = self._acquire_root()
+        self._load()
+
+    def _acquire_root(self):
+        if fcntl is None:
+            return None
+        lock_file = open(os.path.join(self._cache_root, 'LOCK'), 'a')
+        try:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except (IOError, OSError):
+            lock_file.close()
+            raise LockedError('{} is opened by another process'.format(self._cache_root))
+        return lock_file
+
+    def _segment_path(self, segment_id):
+        return os.path.join(self._cache_root, '{:010d}{}'.format(segment_id, _segment_suffix))
+
+    def _load(self):
+        """
+        Rebuild the index by scanning all the segments from the oldest one
+        """
+        segment_ids = sorted(int(fn[:-len(_segment_suffix)]) for fn in os.listdir(self._cache_root)
+                             if fn.endswith(_segment_suffix))
+        now = time.time()
+        for segment_id in segment_ids:
+            f = open(self._segment_path(segment_id), 'r+b')
+            segment = self._segments[segment_id] = [f, 0, 0]
+            for offset, size, key, expire_at, flags, _ in _scan(f):
+                self._forget(key)
+                if flags & _FLAG_DELETED:
+                    segment[2] += size
+                else:
+                    self._index[key] = (segment_id, offset, size, expire_at)
+                segment[1] = offset + size
+            # cut a record half written by a crash
+            f.truncate(segment[1])
+        for key, location in list(self._index.items()):
+            if location[3] is not None and now >= location[3]:
+                self._forget(key)
+        if segment_ids:
+            self._active_id = segment_ids[-1]
+        else:
+            self._new_segment()
+
+    def _new_segment(self):
+        self._active_id = 1 if self._active_id is None else self._active_id + 1
+        self._segments[self._active_id] = [open(self._segment_path(self._active_id), 'w+b'), 0, 0]
+
+    def _forget(self, key):
+        """
+        Remove the key from the index, its last record becomes garbage
+        """
+        location = self._index.pop(key, None)
+        if location is not None:
+            segment = self._segments.get(location[0])
+            if segment is not None:
+                segment[2] += location[2]
+
+    def _append(self, key, value, expire_at, flags):
+        """
+        Append a record to the active segment
+
+        :return: the location of the record in the index
+        """
+        key_bytes = key.encode('utf-8')
+        body = _record_header.pack(0, len(key_bytes), len(value), expire_at or 0, flags)[4:] + key_bytes + value
+        record = struct.pack('>I', zlib.crc32(body) & 0xffffffff) + body
+
+        segment = self._segments[self._active_id]
+        if segment[1] and segment[1] + len(record) > self._segment_size:
+            self._new_segment()
+            segment = self._segments[self._active_id]
+        f = segment[0]
+        f.seek(segment[1])
+        f.write(record)
+        f.flush()
+        if self._fsync:
+            os.fsync(f.fileno())
+        offset = segment[1]
+        segment[1] += len(record)
+        return self._active_id, offset, len(record), expire_at
+
+    def _read_value(self, location):
+        segment_id, offset, size, _ = location
+        f = self._segments[segment_id][0]
+        f.seek(offset)
+        data = f.read(size)
+        _, key_length, value_length, _, flags = _record_header.unpack_from(data)
+        value = data[_record_header.size + key_length:]
+        if flags & _FLAG_TEXT:
+            return value.decode('utf-8')
+        return value
+
+    def _get_location(self, key, now):
+        location = self._index.get(key)
+        if location is None:
+            return None
+        if location[3] is not None and now >= location[3]:
+            self._forget(key)
+            self._schedule_compaction(location[0])
+            return None
+        return location
+
+    @log_file_error_wrapper
+    def get(self, key):
+        key = transcode(key)
+        with self._lock:
+            location = self._get_location(key, time.time())
+            if location is None:
+                return None
+            return self._read_value(location)
+
+    @log_file_error_wrapper
+    def set(self, key, value, expire_seconds=None, only_if_new=False, only_if_old=False):
+        key = transcode(key)
+        if only_if_new and only_if_old:
+            raise ParameterError('You can only give one of only_if_new or only_if_old')
+        flags = 0
+        if not isinstance(value, bytes):
+            value = transcode(value).encode('utf-8')
+            flags |= _FLAG_TEXT
+
+        with self._lock:
+            now = time.time()
+            _set_flag = True
+            if only_if_new or only_if_old:
+                _key_in_cache = self._get_location(key, now) is not None
+                if only_if_new and _key_in_cache:
+                    _set_flag = False
+                if only_if_old and not _key_in_cache:
+                    _set_flag = False
+
+            if _set_flag:
+                location = self._append(key, value, None if expire_seconds is None else now + expire_seconds, flags)
+                old_location = self._index.get(key)
+                self._forget(key)
+                self._index[key] = location
+                if old_location is not None:
+                    self._schedule_compaction(old_location[0])
+                return True
+            return False
+
+    @log_file_error_wrapper
+    def delete(self, keys):
+        count = 0
+        with self._lock:
+            for key in keys:
+                key = transcode(key)
+                location = self._get_location(key, time.time())
+                if location is None:
+                    continue
+                tombstone = self._append(key, b'', None, _FLAG_DELETED)
+                self._forget(key)
+                # the tombstone is only needed until the deleted record is compacted
+                self._segments[tombstone[0]][2] += tombstone[2]
+                self._schedule_compaction(location[0])
+                count += 1
+        return count
+
+    @log_file_error_wrapper
+    def get_keys(self, pattern='*'):
+        pattern = transcode(pattern)
+        now = time.time()
+        with self._lock:
+            keys = [key for key, location in self._index.items() if location[3] is None or now < location[3]]
+        return [key for key in keys if fnmatch.fnmatch(key, pattern)]
+
+    @log_file_error_wrapper
+    def increase(self, key, amount=1):
+        key = transcode(key)
+        with self._lock:
+            return super(LogFileCache, self).increase(key, amount)
+
+    @log_file_error_wrapper
+    def multi_get(self, keys):
+        keys = [transcode(key) for key in keys]
+        return super(LogFileCache, self).multi_get(keys)
+
+    @log_file_error_wrapper
+    def clear(self, pattern='*'):
+        pattern = transcode(pattern)
+        return super(LogFileCache, self).clear(pattern)
+
+    @log_file_error_wrapper
+    def _execute_pipeline(self, commands):
+        with self._lock:
+            return super(LogFileCache, self)._execute_pipeline(commands)
+
+    def stats(self):
+        """
+        Returns the usage of the segments
+
+        - entries: how many keys are in the index
+        - segments: how many segment files there are
+        - bytes, garbage_bytes: the size of all the segments, and how much of it is garbage
+
+        :rtype: dict
+        """
+        with self._lock:
+            return {
+                'entries': len(self._index),
+                'segments': len(self._segments),
+                'bytes': sum(segment[1] for segment in self._segments.values()),
+                'garbage_bytes': sum(segment[2] for segment in self._segments.values()),
+            }
+
+    def _needs_compaction(self, segment_id):
+        segment = self._segments.get(segment_id)
+        return (segment is not None and segment_id != self._active_id and
+                segment[2] >= segment[1] * self._compact_ratio)
+
+    def _schedule_compaction(self, segment_id):
+        if not self._needs_compaction(segment_id):
+            return
+        if self._compactor is None:
+            self._compactor = threading.Thread(target=self._compact_forever, name='py_auto_cache-compactor')
+            self._compactor.daemon = True
+            self._compactor.start()
+        self._compacting.set()
+
+    def _compact_forever(self):
+        while True:
+            self._compacting.wait()
+            self._compacting.clear()
+            try:
+                self.compact()
+            except Exception:
+                # the next write scheduling a compaction will try again
+                logger.exception('Failed to compact %s', self._cache_root)
+
+    def compact(self, batch=256):
+        """
+        Copy the live records of the segments with too much garbage to the active segment,
+        then remove those segments.
+
+        Sealed segments are never written, so they are scanned without holding the lock,
+        the lock is only held to move a batch of records.
+
+        :param int batch: how many records are moved while holding the lock
+        :return: how many segments are removed
+        :rtype: int
+        """
+        with self._compact_lock:
+            return self._compact(batch)
+
+    def _compact(self, batch):
+        with self._lock:
+            segment_ids = sorted(segment_id for segment_id in self._segments if self._needs_compaction(segment_id))
+        for segment_id in segment_ids:
+            path = self._segment_path(segment_id)
+            shadowed = self._shadowed_keys(segment_id)
+            with open(path, 'rb') as f:
+                records = []
+                for record in _scan(f):
+                    records.append(record)
+                    if len(records) >= batch:
+                        self._move(segment_id, records, shadowed)
+                        records = []
+                self._move(segment_id, records, shadowed)
+            with self._lock:
+                self._segments.pop(segment_id)[0].close()
+                os.remove(path)
+        return len(segment_ids)
+
+    def _shadowed_keys(self, segment_id):
+        """
+        Returns the keys of a segment which older segments still have records of
+
+        Sealed segments are never written and only the compaction removes them,
+        so they are scanned without holding the lock. Only the keys of the given segment are kept
+        in memory, the oldest segment has no older segments to scan.
+
+        :rtype: set
+        """
+        with self._lock:
+            older_ids = sorted(older_id for older_id in self._segments if older_id < segment_id)
+        if not older_ids:
+            return set()
+        with open(self._segment_path(segment_id), 'rb') as f:
+            keys = set(record[2] for record in _scan(f))
+        shadowed = set()
+        for older_id in older_ids:
+            with open(self._segment_path(older_id), 'rb') as f:
+                shadowed.update(record[2] for record in _scan(f) if record[2] in keys)
+        return shadowed
+
+    def _move(self, segment_id, records, shadowed):
+        """
+        Append the live records of a segment being compacted to the active segment.
+
+        A deleted or expired key may still have older records in older segments,
+        which would come back when the index is rebuilt without the record of this segment.
+        So a tombstone is appended for it if an older segment still has a record of it (see _shadowed_keys),
+        otherwise its records (tombstones included) are dropped.
+        """
+        with self._lock:
+            now = time.time()
+            tombstones = set()
+            for offset, size, key, expire_at, flags, value in records:
+                location = self._index.get(key)
+                if location is not None and location[3] is not None and now >= location[3]:
+                    self._forget(key)
+                    location = None
+                if location is None:
+                    if key not in tombstones and key in shadowed:
+                        tombstone = self._append(key, b'', None, _FLAG_DELETED)
+                        self._segments[tombstone[0]][2] += tombstone[2]
+                        tombstones.add(key)
+                elif location[0] == segment_id and location[1] == offset:
+                    self._index[key] = self._append(key, value, expire_at, flags)
+
+    def close(self):
+        """
+        Close the segment files and release the cache root for other processes
+        """
+        with self._lock:
+            for segment in self._segments.values():
+                segment[0].close()
+            self._segments = {}
+            self._index = {}
+            if self._lock_file is not None:
+                self._lock_file.close()
+                self._lock_file = None
+
+
+def _scan(f):
+    """
+    Iterate over the records of a segment file, stops at the first broken record
+
+    :return: iterator of (offset, size, key, expire at, flags, value)
+    """
+    f.seek(0)
+    offset = 0
+    while True:
+        header = f.read(_record_header.size)
+        if len(header) < _record_header.size:
+            return
+        crc, key_length, value_length, expire_at, flags = _record_header.unpack(header)
+        data = f.read(key_length + value_length)
+        if len(data) < key_length + value_length or \
+                zlib.crc32(header[4:] + data) & 0xffffffff != crc:
+            return
+        size = _record_header.size + key_length + value_length
+        yield offset, size, data[:key_length].decode('utf-8'), expire_at or None, flags, data[key_length:]
+        offset += size
@@ -2,7 +2,7 @@
 from redis import StrictRedis, RedisError
 from ..cache import Cache
 from ..error import ClientError
-from ..util import wrap_client_exception
+from ..util import chunks, wrap_client_exception
 
 
 class RedisClientError(ClientError):
@@ -17,13 +17,23 @@ redis_error_wrapper = wrap_client_exception(RedisError, RedisClientError)
 class RedisCache(Cache):
     """
     Implement redis cache
+
+    Keys are found by SCAN instead of KEYS, and cleared by UNLINK a batch at a time,
+    so a large keyspace never blocks the server.
     """
 
     def __init__(self, host='localhost', port=6379, timeout=None):
         super(RedisCache, self).__init__()
 
+        self._host = host
+        self._port = port
+        self._timeout = timeout
         self._redis = StrictRedis(host, port, socket_timeout=timeout, socket_connect_timeout=timeout)
 
+    def to_async(self):
+        from .async_redis_cache import AsyncRedisCache
+        return AsyncRedisCache(self._host, self._port, self._timeout)
+
     @redis_error_wrapper
     def get(self, key):
         return self._redis.get(key)
@@ -44,7 +54,12 @@ class RedisCache(Cache):
 
     @redis_error_wrapper
     def get_keys(self, pattern='*'):
-        return self._redis.keys(pattern)
+        return list(self._redis.scan_iter(pattern, self.scan_batch))
+
+    @redis_error_wrapper
+    def iter_keys(self, pattern='*', batch=None):
+        for key in self._redis.scan_iter(pattern, self.scan_batch if batch is None else batch):
+            yield key
 
     @redis_error_wrapper
     def increase(self, key, amount=1):
@@ -56,6 +71,78 @@ class RedisCache(Cache):
             return self._redis.mget(keys)
         return []
 
+    @redis_error_wrapper
+    def multi_set(self, mapping, expire_seconds=None):
+        if len(mapping) == 0:
+            return True
+        # MSET has no expiry, the keys are expired by PEXPIRE in the same transaction
+        pipe = self._redis.pipeline(transaction=True)
+        pipe.mset(mapping)
+        if expire_seconds is not None:
+            expire_milliseconds = int(expire_seconds * 1000)
+            for key in mapping:
+                pipe.pexpire(key, expire_milliseconds)
+        return pipe.execute()[0]
+
+    @redis_error_wrapper
+    def multi_delete(self, keys):
+        if len(keys) == 0:
+            return []
+        pipe = self._redis.pipeline(transaction=False)
+        for key in keys:
+            pipe.delete(key)
+        return [bool(count) for count in pipe.execute()]
+
     @redis_error_wrapper
     def clear(self, pattern='*'):
-        return super(RedisCache, self).clear(pattern)
+        count = 0
+        for keys in chunks(self._redis.scan_iter(pattern, self.scan_batch), self.scan_batch):
+            # UNLINK frees the values in a background thread of the server
+            count += self._redis.unlink(*keys)
+        return count
+
+    @redis_error_wrapper
+    def _execute_pipeline(self, commands):
+        # MULTI/EXEC, the writes are sent in one round trip and applied together
+        pipe = self._redis.pipeline(transaction=True)
+        queued = queue_commands(pipe, commands)
+        if not queued:
+            return [0] * len(commands)
+        return merge_results(commands, queued, pipe.execute())
+
+
+def queue_commands(pipe, commands):
+    """
+    Queue the writes of a Pipeline to a redis pipeline
+
+    :return: the indexes of the queued writes, a delete without keys is not sent
+    :rtype: list[int]
+    """
+    queued = []
+    for index, (name, args) in enumerate(commands):
+        if name == 'set':
+            key, value, expire_seconds, only_if_new, only_if_old = args
+            expire_milliseconds = None
+            if expire_seconds is not None:
+                expire_milliseconds = int(expire_seconds * 1000)
+            pipe.set(key, value, px=expire_milliseconds, nx=only_if_new, xx=only_if_old)
+        elif name == 'delete':
+            if len(args[0]) == 0:
+                continue
+            pipe.delete(*args[0])
+        elif name == 'increase':
+            pipe.incr(*args)
+        else:
+            raise ValueError('{} can not be pipelined'.format(name))
+        queued.append(index)
+    return queued
+
+
+def merge_results(commands, queued, replies):
+    """
+    Returns the result of every write, the writes not sent deleted nothing
+    """
+    results = [0] * len(commands)
+    for index, reply in zip(queued, replies):
+        results[index] = reply
+    return results
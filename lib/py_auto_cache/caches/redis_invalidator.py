@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""
+Invalidate the L1 of TieredCache in all processes through redis pub/sub
+"""
+import json
+import threading
+from logging import getLogger
+from redis import StrictRedis, RedisError
+from .redis_cache import redis_error_wrapper
+from .tiered_cache import new_origin
+
+logger = getLogger('py_auto_cache')
+
+
+class RedisInvalidator(object):
+    """
+    Tell the TieredCache of all processes the keys changed, by publishing them to a redis channel
+
+    Every process listens to the channel in a daemon thread. Pub/sub doesn't keep the messages
+    sent while a process is disconnected, so the whole L1 is dropped when it subscribes again.
+    """
+
+    channel = 'py_auto_cache:invalidate'
+    # seconds to wait before connecting again when the connection is lost
+    retry_interval = 1.0
+
+    def __init__(self, host='localhost', port=6379, timeout=None, channel=None):
+        """
+        :param str host: the redis server, usually the one of the L2 RedisCache
+        :param int port: the redis server port
+        :param float timeout: socket timeout of publishing
+        :param str channel: all the processes sharing an L2 should use the same channel
+        """
+        super(RedisInvalidator, self).__init__()
+        self._channel = self.channel if channel is None else channel
+        self._redis = StrictRedis(host, port, socket_timeout=timeout, socket_connect_timeout=timeout)
+        self._origin = new_origin()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self, on_invalidate, on_reset):
+        self._thread = threading.Thread(target=self._listen, args=(on_invalidate, on_reset),
+                                        name='py_auto_cache-invalidator')
+        self._thread.daemon = True
+        self._thread.start()
+
+    @redis_error_wrapper
+    def publish(self, keys=None, pattern=None):
+        message = {'origin': self._origin}
+        if keys:
+            message['keys'] = keys
+        if pattern is not None:
+            message['pattern'] = pattern
+        self._redis.publish(self._channel, json.dumps(message))
+
+    def _listen(self, on_invalidate, on_reset):
+        while not self._stopped.is_set():
+            pubsub = self._redis.pubsub()
+            try:
+                pubsub.subscribe(self._channel)
+                while not self._stopped.is_set():
+                    message = pubsub.get_message(timeout=self.retry_interval)
+                    if message is None:
+                        continue
+                    if message['type'] == 'subscribe':
+                        # the messages sent before are lost
+                        on_reset()
+                    elif message['type'] == 'message':
+                        data = json.loads(message['data'].decode('utf-8'))
+                        if data.get('origin') != self._origin:
+                            on_invalidate(data.get('keys'), data.get('pattern'))
+            except RedisError:
+                logger.warning('Lost the invalidation channel %s, connecting again', self._channel, exc_info=True)
+                self._stopped.wait(self.retry_interval)
+            finally:
+                pubsub.close()
+
+    def close(self):
+        self._stopped.set()
@@ -0,0 +1,528 @@
+# -*- coding: utf-8 -*-
+"""
+A local cache in shared memory, for the processes of one host
+"""
+import fnmatch
+import hashlib
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from ..cache import Cache
+from ..error import ClientError
+from ..util import wrap_client_exception, transcode
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+class SharedMemoryClientError(ClientError):
+    """
+    Base class for all errors come from shared memory client
+    """
+
+
+class ParameterError(SharedMemoryClientError):
+    """
+    Be raised if the parameter is invalid
+    """
+
+
+shared_memory_error_wrapper = wrap_client_exception((ValueError, IOError, OSError, struct.error),
+                                                    SharedMemoryClientError)
+
+_MAGIC = b'PYACSHM1'
+
+# magic, slot count, max item size, arena size, arena used, entries, tombstones, clock hand, evictions
+_header = struct.Struct('<8sIIQQQQQQ')
+_ARENA_USED = 24
+_ENTRIES = 32
+_TOMBSTONES = 40
+_CLOCK_HAND = 48
+_EVICTIONS = 56
+# the heads of the free lists of the size classes
+_FREE_LISTS = _header.size
+_MAX_CLASSES = 64
+_SLOTS = 1024
+
+# seq, state, flags, referenced, size class, key hash, item offset, key length, value length,
+# expire at (0 means never)
+_slot = struct.Struct('<IBBBBQQIId')
+_REFERENCED = 6
+_uint32 = struct.Struct('<I')
+_uint64 = struct.Struct('<Q')
+
+_EMPTY = 0
+_USED = 1
+_TOMBSTONE = 2
+
+_FLAG_TEXT = 1
+
+_MIN_CHUNK = 64
+_CHUNK_FACTOR = 1.25
+
+
+def _default_path():
+    # /dev/shm is a memory file system on linux, nothing is written to the disk
+    if os.path.isdir('/dev/shm'):
+        return '/dev/shm/auto_cache'
+    return os.path.join(tempfile.gettempdir(), 'auto_cache.shm')
+
+
+class SharedMemoryCache(Cache):
+    """
+    Implement a local cache server in a memory mapped file shared by processes
+
+    The file holds a fixed size hash table and an arena for the keys and values.
+    The arena is cut into chunks of size classes growing by 1.25 times, like memcached does,
+    a freed chunk is reused by the next item of its class. When the arena is full,
+    an item of the same class is evicted, the expired or not recently read ones first (CLOCK).
+
+    Reads take no lock: every slot of the table has a sequence number which is odd while
+    the slot is written, a reader copies the item and retries if the number has changed.
+    Writes are serialized by an fcntl lock of the file.
+
+    Processes forked after the cache is created share it without opening it again,
+    other processes share it by opening the same path. The first one creates the file,
+    the others use the size and slots it was created with.
+
+    Items larger than max_item_size are not cached.
+    """
+
+    path = _default_path()
+    size = 64 * 1024 * 1024
+    # the table has a slot for every this many bytes of the arena
+    average_item_size = 512
+    max_item_size = 1024 * 1024
+    # the table is filled up to this ratio, then the least recently used items are evicted
+    max_load = 0.75
+    # how many times a reader retries a slot being written before taking it as a miss
+    read_retries = 100
+
+    def __init__(self, path=None, size=None, slots=None, max_item_size=None):
+        """
+        :param str path: the file, under /dev/shm by default
+        :param int size: bytes of the arena
+        :param int slots: size of the hash table, size / average_item_size by default
+        :param int max_item_size: the largest key and value to be cached, in bytes
+        """
+        super(SharedMemoryCache, self).__init__()
+        self._path = self.path if path is None else path
+        size = self.size if size is None else size
+        max_item_size = self.max_item_size if max_item_size is None else max_item_size
+        if slots is None:
+            slots = max(size // self.average_item_size, 16)
+        if size <= 0 or slots <= 0 or max_item_size <= 0:
+            raise ParameterError('size, slots and max_item_size should be positive')
+
+        self._pid = None
+        self._fd = None
+        self._lock = None
+        self._lock_depth = 0
+        self._check_pid()
+
+        with self._write_lock():
+            file_size = os.fstat(self._fd).st_size
+            if file_size == 0:
+                arena_offset = _SLOTS + slots * _slot.size
+                os.ftruncate(self._fd, arena_offset + size)
+                self._mm = mmap.mmap(self._fd, arena_offset + size)
+                _header.pack_into(self._mm, 0, _MAGIC, slots, max_item_size, size, 0, 0, 0, 0, 0)
+            else:
+                self._mm = mmap.mmap(self._fd, file_size)
+                if self._mm[:len(_MAGIC)] != _MAGIC:
+                    raise ParameterError('{} is not a shared memory cache'.format(self._path))
+
+        _, self._slot_count, self._max_item_size, self._arena_size = _header.unpack_from(self._mm)[:4]
+        self._arena_offset = _SLOTS + self._slot_count * _slot.size
+        self._max_entries = max(int(self._slot_count * self.max_load), 1)
+        # tombstones are dropped by a rehash when they fill the rest of the table up to this
+        self._rehash_limit = max(int(self._slot_count * (1 + self.max_load) / 2), self._max_entries + 1)
+        self._chunk_sizes = _chunk_sizes(self._max_item_size)
+        if len(self._chunk_sizes) > _MAX_CLASSES:
+            raise ParameterError('max_item_size is too large')
+
+    def _check_pid(self):
+        """
+        Open the file again in a forked process
+
+        The mapping is inherited, but an fcntl lock of an inherited file doesn't lock out the parent.
+        """
+        if self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._fd = os.open(self._path, os.O_RDWR | os.O_CREAT, 0o600)
+        self._lock = threading.RLock()
+        self._lock_depth = 0
+
+    @contextmanager
+    def _write_lock(self):
+        self._check_pid()
+        with self._lock:
+            if self._lock_depth == 0 and fcntl is not None:
+                fcntl.flock(self._fd, fcntl.LOCK_EX)
+            self._lock_depth += 1
+            try:
+                yield
+            finally:
+                self._lock_depth -= 1
+                if self._lock_depth == 0 and fcntl is not None:
+                    fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def _counter(self, offset, delta=None):
+        value = _uint64.unpack_from(self._mm, offset)[0]
+        if delta is not None:
+            value += delta
+            _uint64.pack_into(self._mm, offset, value)
+        return value
+
+    def _slot_pos(self, index):
+        return _SLOTS + index * _slot.size
+
+    def _read_slot(self, index):
+        """
+        Read a slot and its item without any lock
+
+        :return: (slot, item) or None if the slot keeps being written
+        """
+        mm = self._mm
+        pos = self._slot_pos(index)
+        for _ in range(self.read_retries):
+            slot = _slot.unpack_from(mm, pos)
+            if slot[0] & 1:
+                continue
+            item = None
+            if slot[1] == _USED:
+                item = mm[slot[6]:slot[6] + slot[7] + slot[8]]
+            if _uint32.unpack_from(mm, pos)[0] == slot[0]:
+                return slot, item
+        return None
+
+    def _begin(self, index):
+        """
+        Mark a slot as being written
+
+        :return: the sequence number to give to _write_slot and _end
+        """
+        pos = self._slot_pos(index)
+        seq = _uint32.unpack_from(self._mm, pos)[0]
+        # it is already odd if a writer died in the middle
+        seq = (seq + 1 if seq % 2 == 0 else seq + 2) & 0xffffffff
+        _uint32.pack_into(self._mm, pos, seq)
+        return seq
+
+    def _end(self, index, seq):
+        _uint32.pack_into(self._mm, self._slot_pos(index), (seq + 1) & 0xffffffff)
+
+    def _write_slot(self, index, seq, state, flags=0, size_class=0, key_hash=0, offset=0, key_length=0,
+                    value_length=0, expire_at=0.0):
+        _slot.pack_into(self._mm, self._slot_pos(index), seq, state, flags, 0, size_class, key_hash, offset,
+                        key_length, value_length, expire_at)
+
+    def _find(self, key_bytes, key_hash):
+        """
+        Look for a key in the table, with the write lock
+
+        :return: the index of the key or None, the first index a new key can be put at
+        """
+        free = None
+        index = key_hash % self._slot_count
+        for _ in range(self._slot_count):
+            slot = _slot.unpack_from(self._mm, self._slot_pos(index))
+            if slot[1] == _EMPTY:
+                return None, index if free is None else free
+            if slot[1] == _TOMBSTONE:
+                if free is None:
+                    free = index
+            elif slot[5] == key_hash and self._mm[slot[6]:slot[6] + slot[7]] == key_bytes:
+                return index, free
+            index = (index + 1) % self._slot_count
+        return None, free
+
+    def _lookup(self, key_bytes, key_hash):
+        """
+        Look for a key in the table without any lock
+
+        :return: (index, slot, value bytes) or None
+        """
+        index = key_hash % self._slot_count
+        for _ in range(self._slot_count):
+            result = self._read_slot(index)
+            if result is None:
+                return None
+            slot, item = result
+            if slot[1] == _EMPTY:
+                return None
+            if slot[1] == _USED and slot[5] == key_hash and item[:slot[7]] == key_bytes:
+                return index, slot, item[slot[7]:]
+            index = (index + 1) % self._slot_count
+        return None
+
+    def _size_class(self, item_size):
+        for size_class, chunk_size in enumerate(self._chunk_sizes):
+            if item_size <= chunk_size:
+                return size_class
+        return None
+
+    def _free(self, size_class, offset):
+        head = _FREE_LISTS + size_class * 8
+        _uint64.pack_into(self._mm, offset, _uint64.unpack_from(self._mm, head)[0])
+        _uint64.pack_into(self._mm, head, offset)
+
+    def _allocate(self, size_class):
+        head = _FREE_LISTS + size_class * 8
+        offset = _uint64.unpack_from(self._mm, head)[0]
+        if offset:
+            _uint64.pack_into(self._mm, head, _uint64.unpack_from(self._mm, offset)[0])
+            return offset
+
+        chunk_size = self._chunk_sizes[size_class]
+        arena_used = self._counter(_ARENA_USED)
+        if arena_used + chunk_size <= self._arena_size:
+            self._counter(_ARENA_USED, chunk_size)
+            return self._arena_offset + arena_used
+
+        index = self._clock(size_class)
+        if index is None:
+            return None
+        self._remove(index)
+        self._counter(_EVICTIONS, 1)
+        return self._allocate(size_class)
+
+    def _clock(self, size_class=None):
+        """
+        Find an item to evict, of the given size class or of any class if it is None
+
+        The hand goes round the table, an item read since the hand passed it last time is spared.
+        """
+        hand = self._counter(_CLOCK_HAND)
+        now = time.time()
+        index = None
+        for _ in range(self._slot_count * 2):
+            pos = self._slot_pos(hand)
+            slot = _slot.unpack_from(self._mm, pos)
+            hand = (hand + 1) % self._slot_count
+            if slot[1] != _USED or (size_class is not None and slot[4] != size_class):
+                continue
+            if slot[3] and not _is_expired(slot[9], now):
+                self._mm[pos + _REFERENCED:pos + _REFERENCED + 1] = b'\x00'
+                continue
+            index = (hand - 1) % self._slot_count
+            break
+        _uint64.pack_into(self._mm, _CLOCK_HAND, hand)
+        return index
+
+    def _remove(self, index):
+        slot = _slot.unpack_from(self._mm, self._slot_pos(index))
+        seq = self._begin(index)
+        self._write_slot(index, seq, _TOMBSTONE)
+        self._free(slot[4], slot[6])
+        self._end(index, seq)
+        self._counter(_ENTRIES, -1)
+        self._counter(_TOMBSTONES, 1)
+
+    def _rehash(self):
+        """
+        Put the items again into the table without the tombstones
+
+        Readers running at the same time may miss some keys.
+        """
+        now = time.time()
+        items = []
+        for index in range(self._slot_count):
+            slot = _slot.unpack_from(self._mm, self._slot_pos(index))
+            if slot[1] == _USED:
+                if _is_expired(slot[9], now):
+                    self._free(slot[4], slot[6])
+                else:
+                    items.append(slot)
+            if slot[1] != _EMPTY:
+                seq = self._begin(index)
+                self._write_slot(index, seq, _EMPTY)
+                self._end(index, seq)
+        for slot in items:
+            index = slot[5] % self._slot_count
+            while _slot.unpack_from(self._mm, self._slot_pos(index))[1] != _EMPTY:
+                index = (index + 1) % self._slot_count
+            seq = self._begin(index)
+            self._write_slot(index, seq, _USED, *slot[2:3] + slot[4:])
+            self._end(index, seq)
+        _uint64.pack_into(self._mm, _ENTRIES, len(items))
+        _uint64.pack_into(self._mm, _TOMBSTONES, 0)
+
+    @shared_memory_error_wrapper
+    def get(self, key):
+        key_bytes = transcode(key).encode('utf-8')
+        found = self._lookup(key_bytes, _hash(key_bytes))
+        if found is None:
+            return None
+        index, slot, value = found
+        if _is_expired(slot[9], time.time()):
+            return None
+        if not slot[3]:
+            pos = self._slot_pos(index) + _REFERENCED
+            self._mm[pos:pos + 1] = b'\x01'
+        if slot[2] & _FLAG_TEXT:
+            return value.decode('utf-8')
+        return value
+
+    @shared_memory_error_wrapper
+    def set(self, key, value, expire_seconds=None, only_if_new=False, only_if_old=False):
+        if only_if_new and only_if_old:
+            raise ParameterError('You can only give one of only_if_new or only_if_old')
+        key_bytes = transcode(key).encode('utf-8')
+        key_hash = _hash(key_bytes)
+        flags = 0
+        if not isinstance(value, bytes):
+            value = transcode(value).encode('utf-8')
+            flags |= _FLAG_TEXT
+        size_class = self._size_class(len(key_bytes) + len(value))
+        if size_class is None:
+            return False
+
+        with self._write_lock():
+            now = time.time()
+            index, free = self._find(key_bytes, key_hash)
+            _key_in_cache = index is not None and not _is_expired(
+                _slot.unpack_from(self._mm, self._slot_pos(index))[9], now)
+            if (only_if_new and _key_in_cache) or (only_if_old and not _key_in_cache):
+                return False
+
+            if index is not None:
+                # the old item is dropped first, its chunk may be the one we get
+                self._remove(index)
+            else:
+                if self._counter(_ENTRIES) >= self._max_entries:
+                    victim = self._clock()
+                    if victim is not None:
+                        self._remove(victim)
+                        self._counter(_EVICTIONS, 1)
+                if self._counter(_ENTRIES) + self._counter(_TOMBSTONES) >= self._rehash_limit:
+                    self._rehash()
+                    index, free = self._find(key_bytes, key_hash)
+            index = free if index is None else index
+
+            offset = self._allocate(size_class)
+            if offset is None:
+                return False
+            if _slot.unpack_from(self._mm, self._slot_pos(index))[1] == _TOMBSTONE:
+                self._counter(_TOMBSTONES, -1)
+            seq = self._begin(index)
+            self._mm[offset:offset + len(key_bytes) + len(value)] = key_bytes + value
+            expire_at = 0.0 if expire_seconds is None else now + expire_seconds
+            self._write_slot(index, seq, _USED, flags, size_class, key_hash, offset, len(key_bytes), len(value),
+                             expire_at)
+            self._end(index, seq)
+            self._counter(_ENTRIES, 1)
+            return True
+
+    @shared_memory_error_wrapper
+    def delete(self, keys):
+        count = 0
+        with self._write_lock():
+            now = time.time()
+            for key in keys:
+                key_bytes = transcode(key).encode('utf-8')
+                index, _ = self._find(key_bytes, _hash(key_bytes))
+                if index is None:
+                    continue
+                if not _is_expired(_slot.unpack_from(self._mm, self._slot_pos(index))[9], now):
+                    count += 1
+                self._remove(index)
+        return count
+
+    @shared_memory_error_wrapper
+    def get_keys(self, pattern='*'):
+        pattern = transcode(pattern)
+        now = time.time()
+        keys = []
+        for index in range(self._slot_count):
+            result = self._read_slot(index)
+            if result is None:
+                continue
+            slot, item = result
+            if slot[1] == _USED and not _is_expired(slot[9], now):
+                key = item[:slot[7]].decode('utf-8')
+                if fnmatch.fnmatch(key, pattern):
+                    keys.append(key)
+        return keys
+
+    @shared_memory_error_wrapper
+    def increase(self, key, amount=1):
+        with self._write_lock():
+            return super(SharedMemoryCache, self).increase(key, amount)
+
+    @shared_memory_error_wrapper
+    def _execute_pipeline(self, commands):
+        with self._write_lock():
+            return super(SharedMemoryCache, self)._execute_pipeline(commands)
+
+    @shared_memory_error_wrapper
+    def clear(self, pattern='*'):
+        pattern = transcode(pattern)
+        if pattern != '*':
+            return super(SharedMemoryCache, self).clear(pattern)
+        with self._write_lock():
+            count = 0
+            now = time.time()
+            for index in range(self._slot_count):
+                slot = _slot.unpack_from(self._mm, self._slot_pos(index))
+                if slot[1] == _EMPTY:
+                    continue
+                if slot[1] == _USED and not _is_expired(slot[9], now):
+                    count += 1
+                seq = self._begin(index)
+                self._write_slot(index, seq, _EMPTY)
+                self._end(index, seq)
+            # forget all the chunks, the arena is cut again from the beginning
+            self._mm[_FREE_LISTS:_FREE_LISTS + _MAX_CLASSES * 8] = b'\x00' * (_MAX_CLASSES * 8)
+            for offset in (_ARENA_USED, _ENTRIES, _TOMBSTONES, _CLOCK_HAND):
+                _uint64.pack_into(self._mm, offset, 0)
+            return count
+
+    def stats(self):
+        """
+        Returns the usage of the shared memory
+
+        - entries, slots: how many items are in the table, and the size of the table
+        - bytes, max_bytes: how much of the arena has been cut into chunks, and the size of the arena
+        - evictions: how many items have been evicted to make room for others
+
+        :rtype: dict
+        """
+        return {
+            'entries': self._counter(_ENTRIES),
+            'slots': self._slot_count,
+            'bytes': self._counter(_ARENA_USED),
+            'max_bytes': self._arena_size,
+            'evictions': self._counter(_EVICTIONS),
+        }
+
+    def close(self):
+        """
+        Unmap the shared memory of this process, the file is kept for the others
+        """
+        self._mm.close()
+        os.close(self._fd)
+
+
+def _hash(key_bytes):
+    # the built-in hash is randomized in every process
+    return _uint64.unpack(hashlib.md5(key_bytes).digest()[:8])[0]
+
+
+def _is_expired(expire_at, now):
+    return expire_at != 0 and now >= expire_at
+
+
+def _chunk_sizes(max_item_size):
+    sizes = [_MIN_CHUNK]
+    while sizes[-1] < max_item_size:
+        # aligned to 8 bytes, the free list pointer is written at the beginning of a chunk
+        sizes.append(min((int(sizes[-1] * _CHUNK_FACTOR) + 7) // 8 * 8, max_item_size))
+    return sizes
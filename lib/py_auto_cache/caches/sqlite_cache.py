@@ -0,0 +1,334 @@
+# -*- coding: utf-8 -*-
+"""
+A local cache in one SQLite database file
+"""
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import six
+from contextlib import contextmanager
+from ..cache import Cache
+from ..error import ClientError
+from ..util import wrap_client_exception, transcode
+
+
+class SqliteClientError(ClientError):
+    """
+    Base class for all errors come from sqlite client
+    """
+
+
+class ParameterError(SqliteClientError):
+    """
+    Be raised if the parameter is invalid
+    """
+
+
+sqlite_error_wrapper = wrap_client_exception((sqlite3.Error, ValueError), SqliteClientError)
+
+_schema = (
+    'CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB NOT NULL, expire_at REAL)',
+    'CREATE INDEX IF NOT EXISTS cache_expire_at ON cache (expire_at)',
+)
+
+# a row is alive if it never expires or expires later than the given time
+_alive = '(expire_at IS NULL OR expire_at > ?)'
+
+
+class SqliteCache(Cache):
+    """
+    Implement a local cache server by a SQLite database in WAL mode
+
+    All the processes of a host can share one database file:
+    readers never block each other nor the writer, and a write only changes its own row.
+    Operations that read before writing (only_if_new, only_if_old, increase) run in
+    an immediate transaction, so they are atomic between processes.
+
+    Expired rows are hidden from reads at once, and deleted through the index
+    on expire_at by purge(), which is called by set at most every purge_interval seconds.
+
+    Text values are stored as TEXT and bytes as BLOB, so both are given back as they were set.
+    """
+
+    db_path = os.path.join(tempfile.gettempdir(), 'auto_cache.sqlite')
+    # seconds to wait for the write lock held by another connection
+    timeout = 5.0
+    # how many keys are sent in one IN query, sqlite allows 999 parameters by default
+    batch_size = 500
+    purge_interval = 60
+
+    def __init__(self, db_path=None, timeout=None, batch_size=None, purge_interval=None):
+        """
+        :param str db_path: the database file, created if it doesn't exist
+        :param float timeout: seconds to wait for the write lock held by another connection
+        :param int batch_size: how many keys are sent in one IN query
+        :param float purge_interval: delete the expired rows at most every this many seconds
+        """
+        super(SqliteCache, self).__init__()
+        self._db_path = self.db_path if db_path is None else db_path
+        self._timeout = self.timeout if timeout is None else timeout
+        self._batch_size = self.batch_size if batch_size is None else batch_size
+        self._purge_interval = self.purge_interval if purge_interval is None else purge_interval
+        if self._batch_size <= 0:
+            raise ParameterError('batch_size should be positive')
+
+        # a connection can't be shared by threads, nor by processes after a fork
+        self._local = threading.local()
+        self._next_purge = time.time() + self._purge_interval
+
+        conn = self._connect()
+        with self._transaction(conn):
+            for sql in _schema:
+                conn.execute(sql)
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+        db_dir = os.path.dirname(self._db_path)
+        if db_dir and not os.path.isdir(db_dir):
+            try:
+                os.makedirs(db_dir)
+            except OSError:
+                # another process may create it at the same time
+                if not os.path.isdir(db_dir):
+                    raise
+        # autocommit, transactions are opened explicitly by _transaction
+        conn = sqlite3.connect(self._db_path, timeout=self._timeout, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        # in WAL mode a crash may lose the last commits but never corrupts the database
+        conn.execute('PRAGMA synchronous=NORMAL')
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    @contextmanager
+    def _transaction(self, conn):
+        """
+        Take the write lock at once, so nobody writes between our read and our write
+
+        Inside a transaction already open (see _execute_pipeline), the writes just join it.
+        """
+        if getattr(self._local, 'in_transaction', False):
+            yield
+            return
+        conn.execute('BEGIN IMMEDIATE')
+        self._local.in_transaction = True
+        try:
+            yield
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        else:
+            conn.execute('COMMIT')
+        finally:
+            self._local.in_transaction = False
+
+    def _batches(self, keys):
+        for i in range(0, len(keys), self._batch_size):
+            yield keys[i:i + self._batch_size]
+
+    @sqlite_error_wrapper
+    def get(self, key):
+        key = transcode(key)
+        row = self._connect().execute('SELECT value FROM cache WHERE key = ? AND ' + _alive,
+                                      (key, time.time())).fetchone()
+        if row is None:
+            return None
+        return _load_value(row[0])
+
+    @sqlite_error_wrapper
+    def set(self, key, value, expire_seconds=None, only_if_new=False, only_if_old=False):
+        key = transcode(key)
+        if only_if_new and only_if_old:
+            raise ParameterError('You can only give one of only_if_new or only_if_old')
+        value = _dump_value(value)
+        now = time.time()
+        expire_at = None if expire_seconds is None else now + expire_seconds
+
+        conn = self._connect()
+        if only_if_new:
+            with self._transaction(conn):
+                # an expired row doesn't count as existing
+                conn.execute('DELETE FROM cache WHERE key = ? AND NOT ' + _alive, (key, now))
+                cursor = conn.execute('INSERT OR IGNORE INTO cache (key, value, expire_at) VALUES (?, ?, ?)',
+                                      (key, value, expire_at))
+        elif only_if_old:
+            cursor = conn.execute('UPDATE cache SET value = ?, expire_at = ? WHERE key = ? AND ' + _alive,
+                                  (value, expire_at, key, now))
+        else:
+            cursor = conn.execute('INSERT OR REPLACE INTO cache (key, value, expire_at) VALUES (?, ?, ?)',
+                                  (key, value, expire_at))
+
+        if now >= self._next_purge:
+            self.purge()
+        return cursor.rowcount > 0
+
+    @sqlite_error_wrapper
+    def delete(self, keys):
+        keys = [transcode(key) for key in keys]
+        conn = self._connect()
+        count = 0
+        now = time.time()
+        for batch in self._batches(keys):
+            cursor = conn.execute('DELETE FROM cache WHERE key IN ({}) AND {}'.format(_placeholders(batch), _alive),
+                                  batch + [now])
+            count += cursor.rowcount
+        return count
+
+    @sqlite_error_wrapper
+    def get_keys(self, pattern='*'):
+        pattern = transcode(pattern)
+        rows = self._connect().execute('SELECT key FROM cache WHERE key GLOB ? AND ' + _alive,
+                                       (_to_glob(pattern), time.time()))
+        return [row[0] for row in rows]
+
+    @sqlite_error_wrapper
+    def iter_keys(self, pattern='*', batch=None):
+        # a page at a time in the order of the primary key, the write lock is never held
+        pattern = _to_glob(transcode(pattern))
+        batch = self.scan_batch if batch is None else batch
+        conn = self._connect()
+        # the first page starts at the empty key, the next ones after the last key given
+        last_key, operator = '', '>='
+        while True:
+            rows = conn.execute('SELECT key FROM cache WHERE key {} ? AND key GLOB ? AND {} '
+                                'ORDER BY key LIMIT ?'.format(operator, _alive),
+                                (last_key, pattern, time.time(), batch)).fetchall()
+            for row in rows:
+                yield row[0]
+            if len(rows) < batch:
+                return
+            last_key, operator = rows[-1][0], '>'
+
+    @sqlite_error_wrapper
+    def increase(self, key, amount=1):
+        key = transcode(key)
+        conn = self._connect()
+        with self._transaction(conn):
+            row = conn.execute('SELECT value, expire_at FROM cache WHERE key = ? AND ' + _alive,
+                               (key, time.time())).fetchone()
+            if row is None:
+                increased_value, expire_at = str(amount), None
+            else:
+                value = _load_value(row[0])
+                if not value.isdigit():
+                    raise ValueError('Value({}) of key({}) is not an integer'.format(repr(value), repr(key)))
+                # keep the expiry of the key, like redis does
+                increased_value, expire_at = str(int(value) + amount), row[1]
+            conn.execute('INSERT OR REPLACE INTO cache (key, value, expire_at) VALUES (?, ?, ?)',
+                         (key, increased_value, expire_at))
+        return increased_value
+
+    @sqlite_error_wrapper
+    def multi_get(self, keys):
+        keys = [transcode(key) for key in keys]
+        conn = self._connect()
+        values = {}
+        now = time.time()
+        for batch in self._batches(keys):
+            rows = conn.execute('SELECT key, value FROM cache WHERE key IN ({}) AND {}'.format(
+                _placeholders(batch), _alive), batch + [now])
+            for key, value in rows:
+                values[key] = _load_value(value)
+        return [values.get(key) for key in keys]
+
+    @sqlite_error_wrapper
+    def _execute_pipeline(self, commands):
+        # all the writes are committed together, or none of them
+        with self._transaction(self._connect()):
+            return super(SqliteCache, self)._execute_pipeline(commands)
+
+    @sqlite_error_wrapper
+    def multi_set(self, mapping, expire_seconds=None):
+        expire_at = None if expire_seconds is None else time.time() + expire_seconds
+        conn = self._connect()
+        with self._transaction(conn):
+            conn.executemany('INSERT OR REPLACE INTO cache (key, value, expire_at) VALUES (?, ?, ?)',
+                             [(transcode(key), _dump_value(value), expire_at) for key, value in mapping.items()])
+        return True
+
+    @sqlite_error_wrapper
+    def multi_delete(self, keys):
+        keys = [transcode(key) for key in keys]
+        conn = self._connect()
+        deleted = set()
+        with self._transaction(conn):
+            now = time.time()
+            for batch in self._batches(keys):
+                rows = conn.execute('SELECT key FROM cache WHERE key IN ({}) AND {}'.format(
+                    _placeholders(batch), _alive), batch + [now])
+                deleted.update(row[0] for row in rows)
+                conn.execute('DELETE FROM cache WHERE key IN ({})'.format(_placeholders(batch)), batch)
+        results = []
+        for key in keys:
+            results.append(key in deleted)
+            deleted.discard(key)
+        return results
+
+    @sqlite_error_wrapper
+    def clear(self, pattern='*'):
+        pattern = transcode(pattern)
+        cursor = self._connect().execute('DELETE FROM cache WHERE key GLOB ? AND ' + _alive,
+                                         (_to_glob(pattern), time.time()))
+        return cursor.rowcount
+
+    @sqlite_error_wrapper
+    def memory_size(self, keys):
+        keys = [transcode(key) for key in keys]
+        conn = self._connect()
+        size = 0
+        now = time.time()
+        for batch in self._batches(keys):
+            row = conn.execute('SELECT SUM(LENGTH(key) + LENGTH(value)) FROM cache WHERE key IN ({}) AND {}'.format(
+                _placeholders(batch), _alive), batch + [now]).fetchone()
+            size += row[0] or 0
+        return size
+
+    @sqlite_error_wrapper
+    def purge(self):
+        """
+        Delete all the expired rows
+
+        :return: how many rows are deleted
+        :rtype: int
+        """
+        now = time.time()
+        self._next_purge = now + self._purge_interval
+        cursor = self._connect().execute('DELETE FROM cache WHERE expire_at <= ?', (now,))
+        return cursor.rowcount
+
+    def close(self):
+        """
+        Close the connection of the current thread
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            self._local.conn = None
+            if self._local.pid == os.getpid():
+                conn.close()
+
+
+def _dump_value(value):
+    if isinstance(value, bytes):
+        return sqlite3.Binary(value)
+    return transcode(value)
+
+
+def _load_value(value):
+    if isinstance(value, six.text_type):
+        return value
+    return bytes(value)
+
+
+def _placeholders(keys):
+    return ', '.join('?' * len(keys))
+
+
+def _to_glob(pattern):
+    """
+    Translate a fnmatch pattern to a sqlite GLOB pattern, they only differ in the negated set: [!abc] or [^abc]
+    """
+    return pattern.replace('[!', '[^')
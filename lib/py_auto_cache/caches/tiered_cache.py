@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+"""
+A near cache: a local cache in front of a remote one
+"""
+import threading
+import uuid
+from ..cache import Cache
+from ..util import transcode
+from .dict_cache import DictCache
+
+
+class TieredCache(Cache):
+    """
+    Implement a two-tier cache: a bounded local L1 in front of any L2
+
+    Reads look into L1 first, and fill L1 with the values found in L2.
+    Writes go to L2 first, then to L1.
+
+    The L1 of other processes is kept up to date by an invalidator, eg: RedisInvalidator,
+    which tells all of them the keys written or deleted. Nothing is sent if there is no invalidator,
+    then the L1 of the other processes is out of date until its entries expire.
+    Either way L1 entries live at most l1_expiry seconds, in case some notifications are lost.
+
+    An invalidator has three methods:
+        start(on_invalidate, on_reset)  deliver the messages of other processes to the callbacks:
+                                        on_invalidate(keys, pattern) and on_reset() if some may be lost
+        publish(keys, pattern)          send a message to other processes
+        close()
+    """
+
+    l1_expiry = 5
+    l1_max_entries = 10000
+
+    def __init__(self, l2, l1=None, l1_expiry=None, invalidator=None):
+        """
+        :param Cache l2: the remote cache holding all the data
+        :param Cache l1: the local cache, a DictCache of l1_max_entries by default
+        :param float l1_expiry: the longest time a value lives in L1, in seconds
+        :param invalidator: tell other processes what is changed, see the class doc
+        """
+        super(TieredCache, self).__init__()
+        self._l2 = l2
+        self._l1 = DictCache(max_entries=self.l1_max_entries) if l1 is None else l1
+        self._l1_expiry = self.l1_expiry if l1_expiry is None else l1_expiry
+        self._invalidator = invalidator
+
+        self._stats_lock = threading.Lock()
+        self._l1_hits = 0
+        self._l2_hits = 0
+        self._misses = 0
+        self._invalidations = 0
+        # bumped by every invalidation, a value read from L2 before it must not fill L1
+        self._epoch = 0
+
+        if invalidator is not None:
+            invalidator.start(self._on_invalidate, self._on_reset)
+
+    def _on_invalidate(self, keys=None, pattern=None):
+        with self._stats_lock:
+            self._epoch += 1
+            self._invalidations += 1
+        if keys:
+            self._l1.delete(keys)
+        if pattern is not None:
+            self._l1.clear(pattern)
+
+    def _on_reset(self):
+        self._on_invalidate(pattern='*')
+
+    def _publish(self, keys=None, pattern=None):
+        if self._invalidator is not None:
+            self._invalidator.publish(keys, pattern)
+
+    def _l1_expire_seconds(self, expire_seconds):
+        if expire_seconds is None:
+            return self._l1_expiry
+        return min(expire_seconds, self._l1_expiry)
+
+    def _count(self, l1_hits=0, l2_hits=0, misses=0):
+        with self._stats_lock:
+            self._l1_hits += l1_hits
+            self._l2_hits += l2_hits
+            self._misses += misses
+            return self._epoch
+
+    def get(self, key):
+        key = transcode(key)
+        value = self._l1.get(key)
+        if value is not None:
+            self._count(l1_hits=1)
+            return value
+
+        epoch = self._epoch
+        value = self._l2.get(key)
+        if value is None:
+            self._count(misses=1)
+        elif self._count(l2_hits=1) == epoch:
+            self._l1.set(key, value, self._l1_expiry)
+        return value
+
+    def set(self, key, value, expire_seconds=None, only_if_new=False, only_if_old=False):
+        key = transcode(key)
+        result = self._l2.set(key, value, expire_seconds, only_if_new, only_if_old)
+        if result:
+            self._l1.set(key, value, self._l1_expire_seconds(expire_seconds))
+            self._publish([key])
+        else:
+            # the key may have been changed by another process
+            self._l1.delete([key])
+        return result
+
+    def delete(self, keys):
+        keys = [transcode(key) for key in keys]
+        self._l1.delete(keys)
+        count = self._l2.delete(keys)
+        self._publish(keys)
+        return count
+
+    def get_keys(self, pattern='*'):
+        return self._l2.get_keys(pattern)
+
+    def iter_keys(self, pattern='*', batch=None):
+        return self._l2.iter_keys(pattern, batch)
+
+    def increase(self, key, amount=1):
+        key = transcode(key)
+        value = self._l2.increase(key, amount)
+        self._l1.delete([key])
+        self._publish([key])
+        return value
+
+    def multi_get(self, keys):
+        keys = [transcode(key) for key in keys]
+        values = self._l1.multi_get(keys)
+        missing = [i for i, value in enumerate(values) if value is None]
+        l1_hits = len(keys) - len(missing)
+        if not missing:
+            self._count(l1_hits=l1_hits)
+            return values
+
+        epoch = self._epoch
+        l2_values = self._l2.multi_get([keys[i] for i in missing])
+        l2_hits = sum(1 for value in l2_values if value is not None)
+        fill = self._count(l1_hits, l2_hits, len(missing) - l2_hits) == epoch
+        for i, value in zip(missing, l2_values):
+            values[i] = value
+            if fill and value is not None:
+                self._l1.set(keys[i], value, self._l1_expiry)
+        return values
+
+    def clear(self, pattern='*'):
+        pattern = transcode(pattern)
+        self._l1.clear(pattern)
+        count = self._l2.clear(pattern)
+        self._publish(pattern=pattern)
+        return count
+
+    def memory_size(self, keys):
+        return self._l2.memory_size(keys)
+
+    def _execute_pipeline(self, commands):
+        # one pipeline of L2, then L1 and the other processes are told in one go
+        results = self._l2._execute_pipeline(commands)
+        changed = []
+        for (name, args), result in zip(commands, results):
+            if name == 'set':
+                key = transcode(args[0])
+                if result:
+                    self._l1.set(key, args[1], self._l1_expire_seconds(args[2]))
+                    changed.append(key)
+                else:
+                    self._l1.delete([key])
+            else:
+                keys = [transcode(key) for key in (args[0] if name == 'delete' else [args[0]])]
+                self._l1.delete(keys)
+                changed.extend(keys)
+        if changed:
+            self._publish(changed)
+        return results
+
+    def stats(self):
+        """
+        Returns how the reads are served
+
+        - l1_hits, l2_hits, misses: reads served by L1, by L2, and found nowhere
+        - l1_hit_ratio: l1_hits of all the reads
+        - l2_hit_ratio: l2_hits of the reads missing L1
+        - invalidations: how many messages of other processes have been received
+
+        :rtype: dict
+        """
+        with self._stats_lock:
+            l1_hits, l2_hits, misses, invalidations = self._l1_hits, self._l2_hits, self._misses, self._invalidations
+        l1_misses = l2_hits + misses
+        return {
+            'l1_hits': l1_hits,
+            'l2_hits': l2_hits,
+            'misses': misses,
+            'l1_hit_ratio': float(l1_hits) / (l1_hits + l1_misses) if l1_hits + l1_misses else 0,
+            'l2_hit_ratio': float(l2_hits) / l1_misses if l1_misses else 0,
+            'invalidations': invalidations,
+        }
+
+    def close(self):
+        """
+        Stop receiving the messages of other processes
+        """
+        if self._invalidator is not None:
+            self._invalidator.close()
+
+
+def new_origin():
+    """
+    Returns an id telling the messages of an invalidator from those of the others
+    """
+    return uuid.uuid4().hex
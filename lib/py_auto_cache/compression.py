@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+"""
+Compress the serialized results cached by AutoCache
+
+Like serializers, every compressor has a one byte tag stored in the header of the entry (see Entry),
+the tag 0 means the payload is not compressed.
+"""
+import zlib
+
+from .entry import NO_COMPRESSION
+
+try:
+    import lz4.frame as lz4_frame
+except ImportError:
+    lz4_frame = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+__all__ = [
+    'Compressor',
+    'ZlibCompressor',
+    'Lz4Compressor',
+    'ZstdCompressor',
+    'register_compressor',
+    'get_compressor',
+    'decompress',
+]
+
+
+class Compressor(object):
+    """
+    Compress payloads and back
+
+    Subclass it and call register_compressor to add a compressor, its tag must be unique and not 0.
+    """
+    tag = None
+    name = None
+
+    def compress(self, data):
+        """
+        :param bytes data: a serialized result
+        :rtype: bytes
+        """
+        raise NotImplementedError
+
+    def decompress(self, data):
+        """
+        :param bytes data: what compress returned
+        :rtype: bytes
+        """
+        raise NotImplementedError
+
+
+class ZlibCompressor(Compressor):
+    """
+    Always available
+    """
+    tag = 1
+    name = 'zlib'
+    level = 6
+
+    def compress(self, data):
+        return zlib.compress(data, self.level)
+
+    def decompress(self, data):
+        return zlib.decompress(data)
+
+
+class Lz4Compressor(Compressor):
+    """
+    Much faster than zlib, with a lower ratio. Needs the lz4 package
+    """
+    tag = 2
+    name = 'lz4'
+
+    def compress(self, data):
+        return lz4_frame.compress(data)
+
+    def decompress(self, data):
+        return lz4_frame.decompress(data)
+
+
+class ZstdCompressor(Compressor):
+    """
+    Faster than zlib, with a better ratio. Needs the zstandard package
+    """
+    tag = 3
+    name = 'zstd'
+    level = 3
+
+    def compress(self, data):
+        # the (de)compressor objects are not thread safe, they are cheap to create
+        return zstandard.ZstdCompressor(level=self.level).compress(data)
+
+    def decompress(self, data):
+        return zstandard.ZstdDecompressor().decompress(data)
+
+
+_by_tag = {}
+_by_name = {}
+
+
+def register_compressor(compressor):
+    """
+    Make a compressor available by its name and its tag
+
+    :param Compressor compressor: an instance of a Compressor subclass
+    """
+    if not 0 < compressor.tag <= 255:
+        raise ValueError('The tag of a compressor is one byte but 0: {}'.format(compressor.tag))
+    registered = _by_tag.get(compressor.tag)
+    if registered is not None and registered.name != compressor.name:
+        raise ValueError('Tag {} is already used by {}'.format(compressor.tag, registered.name))
+    _by_tag[compressor.tag] = compressor
+    _by_name[compressor.name] = compressor
+
+
+def get_compressor(compressor):
+    """
+    Returns a registered compressor
+
+    :param compressor: its name like 'zlib', its tag, or a Compressor which is registered if it is not yet
+    :rtype: Compressor
+    """
+    if isinstance(compressor, Compressor):
+        if _by_tag.get(compressor.tag) is not compressor:
+            register_compressor(compressor)
+        return compressor
+    found = (_by_tag if isinstance(compressor, int) else _by_name).get(compressor)
+    if found is None:
+        raise ValueError('Unknown compressor: {!r}'.format(compressor))
+    return found
+
+
+def decompress(tag, data):
+    """
+    Decompress data compressed by the compressor of the given tag
+
+    :param int tag: the compression of the entry, NO_COMPRESSION returns data as is
+    :param bytes data: the payload of the entry
+    :rtype: bytes
+    """
+    if tag == NO_COMPRESSION:
+        return data
+    return get_compressor(tag).decompress(data)
+
+
+register_compressor(ZlibCompressor())
+if lz4_frame is not None:
+    register_compressor(Lz4Compressor())
+if zstandard is not None:
+    register_compressor(ZstdCompressor())
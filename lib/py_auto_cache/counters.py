@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""
+Counters kept in memory and written to the cache in batches
+"""
+import atexit
+import os
+import threading
+import time
+import weakref
+
+
+class BufferedCounters(object):
+    """
+    Count in memory, so counting costs no round trip to the cache
+
+    add() tells when the counts are due to be flushed: when flush_threshold adds are pending
+    or flush_interval seconds have passed since the last flush. The owner then takes them
+    and increases the counters of the cache by the amounts. Counts of an idle process wait
+    for the next add, or for the exit of the process.
+    """
+
+    def __init__(self, flush_interval=1.0, flush_threshold=100):
+        """
+        :param float flush_interval: the longest time (in seconds) a count waits for a flush
+        :param int flush_threshold: flush once this many adds are pending,
+                                    whatever their amounts (a byte count is one add)
+        """
+        super(BufferedCounters, self).__init__()
+        self._flush_interval = flush_interval
+        self._flush_threshold = flush_threshold
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._counts = {}
+        self._pending = 0
+        self._next_flush = time.time() + self._flush_interval
+
+    def _check_pid(self):
+        if self._pid != os.getpid():
+            # the counts copied from the parent process are flushed by the parent
+            self._reset()
+
+    def add(self, key, amount=1):
+        """
+        Count in memory
+
+        :param str key: the counter key in the cache
+        :param int amount: increase step
+        :return: True if the counts should be flushed now
+        :rtype: bool
+        """
+        with self._lock:
+            self._check_pid()
+            self._counts[key] = self._counts.get(key, 0) + amount
+            self._pending += 1
+            return self._pending >= self._flush_threshold or time.time() >= self._next_flush
+
+    def pending(self, key):
+        """
+        Returns the count of key not flushed yet
+
+        :rtype: int
+        """
+        with self._lock:
+            self._check_pid()
+            return self._counts.get(key, 0)
+
+    def take(self):
+        """
+        Returns all the pending counts and forget them, the caller is going to flush them
+
+        :return: the amount to increase of every counter key
+        :rtype: dict
+        """
+        with self._lock:
+            self._check_pid()
+            counts = self._counts
+            self._counts = {}
+            self._pending = 0
+            self._next_flush = time.time() + self._flush_interval
+            return counts
+
+    def restore(self, counts):
+        """
+        Give back the counts which failed to be flushed, they are flushed again next time
+
+        :param dict counts: what was returned by take
+        """
+        with self._lock:
+            self._check_pid()
+            for key, amount in counts.items():
+                self._counts[key] = self._counts.get(key, 0) + amount
+                self._pending += 1
+
+
+# the owners of counters to flush when the interpreter exits, they are forgotten when they are collected
+_owners = weakref.WeakSet()
+
+
+def flush_at_exit(obj):
+    """
+    Call obj.flush_counters() when the interpreter exits, unless obj has been garbage collected
+
+    All the owners are flushed by one exit handler, so short-lived owners leave nothing behind.
+
+    :param obj: the object owning the counters
+    """
+    _owners.add(obj)
+
+
+@atexit.register
+def _flush_owners():
+    for obj in list(_owners):
+        try:
+            obj.flush_counters()
+        except Exception:
+            # the cache may be gone at exit, the counts are lost
+            pass
@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+"""
+The format of values written by AutoCache
+
+A value is a small binary header followed by the serialized result:
+
+    magic(1) version(1) codec(1) compression(1) created_at(8) soft_expire_at(8) hard_expire_at(8) time_cost(8) payload
+
+codec is the tag of the serializer of the payload, see serializers, and compression the tag
+of its compressor, 0 if it is not compressed, see compression.
+Times are unix timestamps, a zero means "never". Values without the magic byte
+were written by older versions (a bare pickle) and are read as a payload without metadata.
+A value of another version cannot be read, it is a miss.
+
+AutoCache keeps the entries under a prefix holding VERSION (see AutoCache.cache_prefix),
+so workers reading another format never share a key with this one during a rolling deploy.
+
+A cache storing live objects (see DictCache objects) keeps the Entry itself, with the result
+as payload and OBJECT_CODEC as codec, nothing is serialized.
+"""
+import math
+import random
+import struct
+import time
+
+MAGIC = b'\xa5'
+VERSION = 3
+
+# the codec of the payloads written before codecs existed
+PICKLE_CODEC = 0
+# the compression of the payloads which are not compressed
+NO_COMPRESSION = 0
+# the payload is the result itself, the entry is stored as it is
+OBJECT_CODEC = 255
+
+_header = struct.Struct('>cBBBdddd')
+
+
+class Entry(object):
+    """
+    A cached result with the metadata stored beside it
+    """
+    __slots__ = ('payload', 'created_at', 'soft_expire_at', 'hard_expire_at', 'time_cost', 'codec',
+                 'compression')
+
+    def __init__(self, payload, created_at=None, soft_expire_at=None, hard_expire_at=None, time_cost=None,
+                 codec=PICKLE_CODEC, compression=NO_COMPRESSION):
+        self.payload = payload
+        self.created_at = created_at
+        self.soft_expire_at = soft_expire_at
+        self.hard_expire_at = hard_expire_at
+        self.time_cost = time_cost
+        self.codec = codec
+        self.compression = compression
+
+    @classmethod
+    def create(cls, payload, soft_expiry=None, hard_expiry=None, time_cost=0, now=None, codec=PICKLE_CODEC,
+               compression=NO_COMPRESSION):
+        """
+        Create an entry from relative expiry times
+
+        :param bytes payload: the serialized result
+        :param float soft_expiry: the entry becomes stale after this many seconds
+        :param float hard_expiry: the entry is gone from the cache after this many seconds
+        :param float time_cost: how long it took to compute the result
+        :param float now: creation time, default is time.time()
+        :param int codec: the tag of the serializer of the payload
+        :param int compression: the tag of the compressor of the payload
+        :rtype: Entry
+        """
+        now = time.time() if now is None else now
+        return cls(payload, now,
+                   None if soft_expiry is None else now + soft_expiry,
+                   None if hard_expiry is None else now + hard_expiry,
+                   time_cost, codec, compression)
+
+    def is_stale(self, now=None):
+        """
+        Returns True if the entry is past its soft expiry time
+
+        :rtype: bool
+        """
+        if self.soft_expire_at is None:
+            return False
+        return (time.time() if now is None else now) >= self.soft_expire_at
+
+    def should_recompute(self, beta=1.0, now=None):
+        """
+        Returns True if a reader should recompute the entry before it expires
+
+        It is the probabilistic early expiration of XFetch: the closer the entry is to
+        its hard expiry time and the longer it took to compute, the more likely it returns True.
+        So expensive entries are usually recomputed by one reader before they expire,
+        instead of by all the readers after they expire.
+
+        :param float beta: bigger than 1.0 favors earlier recomputation, less than 1.0 favors later
+        :param float now: current time, default is time.time()
+        :rtype: bool
+        """
+        if self.hard_expire_at is None or not self.time_cost:
+            return False
+        now = time.time() if now is None else now
+        # 1.0 - random() is in (0.0, 1.0], so its log is never infinite
+        return now - self.time_cost * beta * math.log(1.0 - random.random()) >= self.hard_expire_at
+
+    def etag(self):
+        """
+        Returns what tells this entry from the other entries written to the same key
+
+        Every write stamps its own creation time, so two reads giving the same etag
+        read the same write and their payloads deserialize to equal results.
+
+        :return: None for the entries without metadata
+        :rtype: tuple
+        """
+        if self.created_at is None:
+            return None
+        return self.created_at, self.time_cost, self.codec, self.compression, len(self.payload)
+
+    def dumps(self):
+        """
+        Serialize the entry to the stored value
+
+        :return: the entry itself if its payload is a live object, see OBJECT_CODEC
+        :rtype: bytes
+        """
+        if self.codec == OBJECT_CODEC:
+            return self
+        return _header.pack(MAGIC, VERSION, self.codec, self.compression, self.created_at or 0,
+                            self.soft_expire_at or 0, self.hard_expire_at or 0, self.time_cost or 0) + self.payload
+
+    @classmethod
+    def loads(cls, value):
+        """
+        Deserialize the stored value to an entry
+
+        :param bytes value: value read from the cache
+        :return: None if the value was written in another version, see VERSION
+        :rtype: Entry
+        """
+        if isinstance(value, Entry):
+            return value
+        if value[:1] != MAGIC or len(value) < _header.size:
+            return cls(value)
+        if bytearray(value[1:2])[0] != VERSION:
+            return None
+        _, _, codec, compression, created_at, soft_expire_at, hard_expire_at, time_cost = _header.unpack_from(value)
+        return cls(value[_header.size:], created_at or None, soft_expire_at or None,
+                   hard_expire_at or None, time_cost, codec, compression)
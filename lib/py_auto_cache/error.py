@@ -27,12 +27,14 @@ class CacheMiss(AutoCacheError):
     Raised whenever we tried to find a key that's not in the cache.
     """
 
-    def __init__(self, func, args, kwargs):
+    def __init__(self, func, args, kwargs, built_key=None):
         super(CacheMiss, self).__init__()
 
         self.func = func
         self.args = args
         self.kwargs = kwargs
+        # the cache key of the call if it has been built already, see AutoCache._build_cache_key
+        self.built_key = built_key
 
 
 class DoNotCacheException(AutoCacheError):
@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+"""
+Build the argument part of cache keys: bind the arguments to the signature and encode them canonically
+"""
+import binascii
+import inspect
+import marshal
+import six
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+__all__ = ['KeyBuilder', 'encode']
+
+# a parameter without default
+_REQUIRED = object()
+
+# calls with arguments of these types only are encoded by marshal, which is canonical for them
+_SCALARS = frozenset((type(None), bool, float, six.text_type, six.binary_type) + six.integer_types)
+
+
+class KeyBuilder(object):
+    """
+    Encode the arguments of calls to a function, so that calls meaning the same have the same key
+
+    The arguments are bound to the signature of the function with the defaults applied,
+    so f(1, b=2), f(1, 2) and f(1) (if b defaults to 2) give the same key.
+    Plain signatures (no *args, **kwargs, keyword-only or positional-only parameters) are bound
+    by a fast path, the others by inspect.Signature.bind.
+    The values are encoded by marshal if all of them are scalars (None, bool, numbers, strings),
+    by encode otherwise.
+    """
+
+    def __init__(self, func):
+        """
+        :param func: the function whose calls are encoded
+        """
+        super(KeyBuilder, self).__init__()
+        self._signature = None
+        self._names = ()
+        self._defaults = ()
+        self._required = 0
+        self._plain = False
+        try:
+            self._signature = inspect.signature(func)
+        except (AttributeError, TypeError, ValueError):
+            # no signature in this python, or for this callable: the arguments are encoded as they are given
+            return
+
+        parameters = list(self._signature.parameters.values())
+        self._plain = all(p.kind == p.POSITIONAL_OR_KEYWORD for p in parameters)
+        if self._plain:
+            self._names = tuple(p.name for p in parameters)
+            self._defaults = tuple(_REQUIRED if p.default is p.empty else p.default for p in parameters)
+            self._required = sum(1 for default in self._defaults if default is _REQUIRED)
+
+    def build(self, args, kwargs):
+        """
+        Returns the canonical encoding of a call
+
+        :param tuple args: positional arguments of the call
+        :param dict kwargs: keyword arguments of the call
+        :rtype: str
+        """
+        count = len(args)
+        if self._plain and not kwargs and self._required <= count <= len(self._names):
+            # the most common call, inlined
+            values = tuple(args) + self._defaults[count:]
+        else:
+            values = self._bind(args, kwargs)
+        if values is None:
+            # a call the function would refuse, keep it apart from the valid ones
+            return 'x' + encode([args, kwargs])
+        if _SCALARS.issuperset(map(type, values)):
+            # version 2 has no references, equal values always give equal bytes
+            return 'm' + _hex(marshal.dumps(values, 2))
+        return encode(values)
+
+    def _bind(self, args, kwargs):
+        if self._plain:
+            return self._bind_plain(args, kwargs)
+        if self._signature is None:
+            return None
+        try:
+            bound = self._signature.bind(*args, **kwargs)
+        except TypeError:
+            return None
+        bound.apply_defaults()
+        return tuple(bound.arguments.values())
+
+    def _bind_plain(self, args, kwargs):
+        count = len(args)
+        if count > len(self._names):
+            return None
+        if not kwargs:
+            if count < self._required:
+                return None
+            return tuple(args) + self._defaults[count:]
+
+        values = list(args)
+        used = 0
+        for name, default in zip(self._names[count:], self._defaults[count:]):
+            if name in kwargs:
+                values.append(kwargs[name])
+                used += 1
+            elif default is _REQUIRED:
+                return None
+            else:
+                values.append(default)
+        if used != len(kwargs):
+            # an unknown keyword, or a keyword given positionally as well
+            return None
+        return tuple(values)
+
+
+def encode(value):
+    """
+    Encode a value canonically: equal values of the common types give equal strings
+
+    None, bool, int, float, text, bytes, tuple, list, dict, set and frozenset are encoded directly,
+    with a type tag so 1, 1.0, True and '1' differ. Dicts and sets are sorted, so their order doesn't matter.
+    Other objects are pickled.
+
+    :rtype: str
+    """
+    parts = []
+    _encode(value, parts.append)
+    return ''.join(parts)
+
+
+def _encode(value, write):
+    encoder = _encoders.get(type(value))
+    if encoder is None:
+        data = pickle.dumps(value, 2)
+        write('p{}:{}'.format(len(data), _hex(data)))
+    else:
+        encoder(value, write)
+
+
+def _hex(data):
+    return binascii.hexlify(data).decode('ascii')
+
+
+def _encode_text(value, write):
+    write('s{}:'.format(len(value)))
+    write(value)
+
+
+def _encode_bytes(value, write):
+    write('b{}:{}'.format(len(value), _hex(value)))
+
+
+def _encode_sequence(tag):
+    def encode_sequence(value, write):
+        write('{}{}:'.format(tag, len(value)))
+        for item in value:
+            _encode(item, write)
+
+    return encode_sequence
+
+
+def _encode_dict(value, write):
+    write('d{}:'.format(len(value)))
+    for key, item in sorted((encode(key), encode(item)) for key, item in value.items()):
+        write(key)
+        write(item)
+
+
+def _encode_set(tag):
+    def encode_set(value, write):
+        write('{}{}:'.format(tag, len(value)))
+        for item in sorted(encode(item) for item in value):
+            write(item)
+
+    return encode_set
+
+
+_encoders = {
+    type(None): lambda value, write: write('N'),
+    bool: lambda value, write: write('T' if value else 'F'),
+    float: lambda value, write: write('f{!r};'.format(value)),
+    six.text_type: _encode_text,
+    six.binary_type: _encode_bytes,
+    tuple: _encode_sequence('t'),
+    list: _encode_sequence('l'),
+    dict: _encode_dict,
+    set: _encode_set('e'),
+    frozenset: _encode_set('z'),
+}
+for _int_type in six.integer_types:
+    _encoders[_int_type] = lambda value, write: write('i{};'.format(value))
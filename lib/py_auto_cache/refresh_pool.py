@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""
+A bounded thread pool refreshing stale cache entries in the background
+"""
+import os
+import threading
+from logging import getLogger
+
+from six.moves import queue
+
+logger = getLogger('py_auto_cache')
+
+
+class RefreshPool(object):
+    """
+    Run refresh tasks on a fixed number of daemon threads.
+
+    Tasks are identified by a key, a key which is already queued or running
+    is not queued again. If the queue is full, the task is dropped: the stale
+    entry will just be refreshed by a later read.
+    """
+
+    def __init__(self, max_workers=4, max_queue_size=1000):
+        """
+        :param int max_workers: how many threads run the tasks
+        :param int max_queue_size: how many tasks can wait for a thread
+        """
+        super(RefreshPool, self).__init__()
+        self._max_workers = max_workers
+        self._max_queue_size = max_queue_size
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._queue = queue.Queue(self._max_queue_size)
+        self._pending = set()
+        self._threads = []
+        self._stats = {'submitted': 0, 'deduplicated': 0, 'dropped': 0, 'succeeded': 0, 'failed': 0}
+
+    def _start(self):
+        if self._pid != os.getpid():
+            # threads don't survive a fork, start our own ones in the child process
+            self._reset()
+        while len(self._threads) < self._max_workers:
+            thread = threading.Thread(target=self._work, name='py_auto_cache-refresh')
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, key, func):
+        """
+        Queue func to be executed in background
+
+        :param key: any hashable object identifying the task
+        :param callable func: function without arguments to execute
+        :return: True if queued, False if the key is already pending or the queue is full
+        :rtype: bool
+        """
+        with self._lock:
+            self._start()
+            if key in self._pending:
+                self._stats['deduplicated'] += 1
+                return False
+            try:
+                self._queue.put_nowait((key, func))
+            except queue.Full:
+                self._stats['dropped'] += 1
+                return False
+            self._pending.add(key)
+            self._stats['submitted'] += 1
+            return True
+
+    def stats(self):
+        """
+        Returns the counters of the pool
+
+        - queued: tasks waiting for a thread
+        - pending: tasks queued or running
+        - submitted, deduplicated, dropped: what happened to the submitted tasks
+        - succeeded, failed: how the executed tasks finished
+
+        :rtype: dict
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats['queued'] = self._queue.qsize()
+            stats['pending'] = len(self._pending)
+        stats['max_workers'] = self._max_workers
+        stats['max_queue_size'] = self._max_queue_size
+        return stats
+
+    def _work(self):
+        task_queue = self._queue
+        while True:
+            key, func = task_queue.get()
+            try:
+                func()
+            except Exception:
+                logger.exception('Failed to refresh %r', key)
+                result = 'failed'
+            else:
+                result = 'succeeded'
+            with self._lock:
+                self._pending.discard(key)
+                self._stats[result] += 1
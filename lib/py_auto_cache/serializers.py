@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+"""
+Serialize the results cached by AutoCache
+
+Every serializer has a one byte tag, stored in the header of the entry (see Entry),
+so an entry is always read by the serializer which wrote it, whatever is configured now.
+"""
+import json
+import marshal
+
+from .entry import OBJECT_CODEC
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+__all__ = [
+    'Serializer',
+    'PickleSerializer',
+    'MarshalSerializer',
+    'JsonSerializer',
+    'MsgpackSerializer',
+    'register_serializer',
+    'get_serializer',
+    'loads',
+]
+
+
+class Serializer(object):
+    """
+    Turn results into bytes and back
+
+    Subclass it and call register_serializer to add a serializer, its tag must be unique
+    and less than 255, which stands for live objects (see Entry).
+    """
+    tag = None
+    name = None
+
+    def dumps(self, value):
+        """
+        :rtype: bytes
+        """
+        raise NotImplementedError
+
+    def loads(self, data):
+        """
+        :param bytes data: what dumps returned
+        """
+        raise NotImplementedError
+
+
+class PickleSerializer(Serializer):
+    """
+    Any picklable result, at the highest protocol. Its tag 0 is the one of entries written before tags existed
+    """
+    tag = 0
+    name = 'pickle'
+
+    def dumps(self, value):
+        return pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+    def loads(self, data):
+        return pickle.loads(data)
+
+
+class MarshalSerializer(Serializer):
+    """
+    Builtin types only (numbers, strings, tuples, lists, dicts, sets), faster than pickle.
+    The format may change between python versions, don't share a cache between them
+    """
+    tag = 1
+    name = 'marshal'
+
+    def dumps(self, value):
+        return marshal.dumps(value)
+
+    def loads(self, data):
+        return marshal.loads(data)
+
+
+class JsonSerializer(Serializer):
+    """
+    JSON types only, tuples are read back as lists and dict keys as strings
+    """
+    tag = 2
+    name = 'json'
+
+    def dumps(self, value):
+        return json.dumps(value, separators=(',', ':')).encode('utf-8')
+
+    def loads(self, data):
+        return json.loads(data.decode('utf-8'))
+
+
+class MsgpackSerializer(Serializer):
+    """
+    msgpack types only, tuples are read back as lists. Needs the msgpack package
+    """
+    tag = 3
+    name = 'msgpack'
+
+    def dumps(self, value):
+        return msgpack.packb(value, use_bin_type=True)
+
+    def loads(self, data):
+        return msgpack.unpackb(data, raw=False)
+
+
+_by_tag = {}
+_by_name = {}
+
+
+def register_serializer(serializer):
+    """
+    Make a serializer available by its name and its tag
+
+    :param Serializer serializer: an instance of a Serializer subclass
+    """
+    if not 0 <= serializer.tag < OBJECT_CODEC:
+        raise ValueError('The tag of a serializer is one byte but 255: {}'.format(serializer.tag))
+    registered = _by_tag.get(serializer.tag)
+    if registered is not None and registered.name != serializer.name:
+        raise ValueError('Tag {} is already used by {}'.format(serializer.tag, registered.name))
+    _by_tag[serializer.tag] = serializer
+    _by_name[serializer.name] = serializer
+
+
+def get_serializer(serializer):
+    """
+    Returns a registered serializer
+
+    :param serializer: its name like 'json', its tag, or a Serializer which is registered if it is not yet
+    :rtype: Serializer
+    """
+    if isinstance(serializer, Serializer):
+        if _by_tag.get(serializer.tag) is not serializer:
+            register_serializer(serializer)
+        return serializer
+    found = (_by_tag if isinstance(serializer, int) else _by_name).get(serializer)
+    if found is None:
+        raise ValueError('Unknown serializer: {!r}'.format(serializer))
+    return found
+
+
+def loads(tag, data):
+    """
+    Deserialize data written by the serializer of the given tag
+
+    :param int tag: the codec of the entry
+    :param bytes data: the payload of the entry
+    """
+    return get_serializer(tag).loads(data)
+
+
+register_serializer(PickleSerializer())
+register_serializer(MarshalSerializer())
+register_serializer(JsonSerializer())
+if msgpack is not None:
+    register_serializer(MsgpackSerializer())
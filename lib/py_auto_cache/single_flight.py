@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""
+Coalesce concurrent calls of the same key into a single execution
+"""
+import sys
+import threading
+
+import six
+
+
+class _Call(object):
+    """
+    An in-flight call, shared by the leader and all of its waiters
+    """
+    __slots__ = ('event', 'value', 'exc_info')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.exc_info = None
+
+
+class SingleFlight(object):
+    """
+    Make sure only one thread executes a function for a given key at a time.
+
+    The first caller of a key becomes the leader and executes the function,
+    the callers arriving while it is running wait for the leader and share
+    its result (or its exception) instead of executing the function again.
+    """
+
+    def __init__(self):
+        super(SingleFlight, self).__init__()
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, func, timeout=None):
+        """
+        Execute func once for all the concurrent callers of key
+
+        :param key: any hashable object identifying the call
+        :param callable func: function without arguments to execute
+        :param float timeout: how long (in seconds) a waiter waits for the leader.
+                              None means wait forever. If the leader doesn't finish in time,
+                              the waiter gives up waiting and executes func by itself.
+        :return: a tuple of (value, shared), shared is True if the value came from another caller
+        :rtype: tuple
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if leader:
+            try:
+                call.value = func()
+            except BaseException:
+                call.exc_info = sys.exc_info()
+                raise
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call.event.set()
+            return call.value, False
+
+        if not call.event.wait(timeout):
+            return func(), False
+        if call.exc_info is not None:
+            six.reraise(*call.exc_info)
+        return call.value, True
+
+    def in_flight(self):
+        """
+        Returns how many keys are being executed right now
+
+        :rtype: int
+        """
+        return len(self._calls)
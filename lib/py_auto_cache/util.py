@@ -2,6 +2,9 @@
 """
 Created by yanghg at 20-6-17 下午9:31
 """
+import inspect
+import time
+from itertools import islice
 from .error import ClientError
 
 try:
@@ -43,25 +46,60 @@ def wrap_client_exception(src_exception_cls, dst_exception_cls=ClientError):
     This is useful so that client code can generally catch exceptions of type dst_exception_class
     to catch arbitrary exceptions that aren't explicitly defined in the cache interface.
 
+    A generator function is wrapped as well, the exceptions raised while iterating it are re-raised.
+
     :param tuple|Exception src_exception_cls: The exceptions which you want to catch
     :param Exception dst_exception_cls: Base exception class which you want to inherit from
     :return: wrapper
     """
     exception_classes = {}
 
+    def convert(e):
+        r_cls = e.__class__
+        inherit_from = (r_cls, dst_exception_cls,)
+        if inherit_from not in exception_classes:
+            # create a class named r_cls.name
+            # that multiply inherits from dst_exception_cls AND src_exception_cls.
+            exception_classes[inherit_from] = type(r_cls.__name__, inherit_from, {})
+        return exception_classes[inherit_from](e)
+
     def wrapper(func):
+        if inspect.isgeneratorfunction(func):
+            def new_generator(*args, **kwargs):
+                try:
+                    for item in func(*args, **kwargs):
+                        yield item
+                except src_exception_cls as e:
+                    raise convert(e)
+
+            return new_generator
+
         def new_func(*args, **kwargs):
             try:
                 return func(*args, **kwargs)
             except src_exception_cls as e:
-                r_cls = e.__class__
-                inherit_from = (r_cls, dst_exception_cls,)
-                if inherit_from not in exception_classes:
-                    # create a class named r_cls.name
-                    # that multiply inherits from dst_exception_cls AND src_exception_cls.
-                    exception_classes[inherit_from] = type(r_cls.__name__, inherit_from, {})
-                raise exception_classes[inherit_from](e)
+                raise convert(e)
 
         return new_func
 
     return wrapper
+
+
+def chunks(iterable, size):
+    """
+    Split an iterable into lists of size items, the last one may be shorter
+
+    :param iterable: anything iterable, it is consumed lazily
+    :param int size: how many items in a list
+    :rtype: iterator of list
+    """
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+# the CPU time of the current thread, so the time spent by other threads is not counted. Python 2 has no such clock
+cpu_clock = getattr(time, 'thread_time', time.time)
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+from unittest import TestCase
+
+from py_auto_cache.async_cache import ThreadedCache
+from py_auto_cache.auto_cache import AutoCache
+from py_auto_cache.caches import DictCache
+from py_auto_cache.error import DoNotCacheException
+
+auto_cache = AutoCache('unittest_async', 3600, DictCache())
+
+run_times = 0
+
+
+@auto_cache.decorator
+async def slow(*args):
+    global run_times
+    run_times += 1
+    await asyncio.sleep(0.1)
+    return args
+
+
+@auto_cache.decorator
+async def not_cached(value):
+    global run_times
+    run_times += 1
+    raise DoNotCacheException(value)
+
+
+def run(coroutine):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(loop.create_task(coroutine))
+    finally:
+        loop.close()
+
+
+class TestAsyncAutoCache(TestCase):
+    def setUp(self):
+        global run_times
+        run_times = 0
+        auto_cache.clear()
+
+    def test_cache(self):
+        self.assertEqual(run(slow(1)), (1,))
+        self.assertEqual(run(slow(1)), (1,))
+        self.assertEqual(run_times, 1)
+        self.assertEqual(run(slow(1, update_auto_cache=True)), (1,))
+        self.assertEqual(run_times, 2)
+        self.assertEqual(len(auto_cache.get_keys()), 1)
+
+    def test_coalesce_misses(self):
+        async def main():
+            return await asyncio.gather(*[slow(2) for _ in range(10)])
+
+        self.assertEqual(run(main()), [(2,)] * 10)
+        self.assertEqual(run_times, 1)
+        self.assertEqual(auto_cache.coalesced(), 9)
+
+    def test_do_not_cache(self):
+        self.assertEqual(run(not_cached(1)), 1)
+        self.assertEqual(run(not_cached(1)), 1)
+        self.assertEqual(run_times, 2)
+
+    def test_threaded_cache(self):
+        async def main():
+            cache = ThreadedCache(DictCache())
+            await cache.set('key', 'value')
+            await cache.increase('counter', 2)
+            return await cache.multi_get(['key', 'counter', 'missing'])
+
+        self.assertEqual(run(main()), ['value', '2', None])
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import os
+import pickle
+import zlib
+from unittest import TestCase, skipIf
+
+from py_auto_cache.auto_cache import AutoCache
+from py_auto_cache.caches import DictCache
+from py_auto_cache.compression import Compressor, get_compressor, lz4_frame, register_compressor, zstandard
+from py_auto_cache.entry import NO_COMPRESSION, Entry
+
+wrapped_cache = DictCache()
+auto_cache = AutoCache('unittest_compression', 3600, wrapped_cache, compression='zlib', compression_threshold=100)
+
+calls = []
+
+
+@auto_cache.decorator
+def text(size):
+    calls.append(size)
+    return 'x' * size
+
+
+@auto_cache.decorator
+def noise(size):
+    calls.append(size)
+    return os.urandom(size)
+
+
+@auto_cache.decorator
+async def async_text(size):
+    calls.append(size)
+    return 'y' * size
+
+
+class ReverseCompressor(Compressor):
+    tag = 200
+    name = 'reverse'
+
+    def compress(self, data):
+        return data[:-1][::-1]
+
+    def decompress(self, data):
+        return data[::-1] + b'x'
+
+
+class TestCompression(TestCase):
+    def setUp(self):
+        del calls[:]
+        auto_cache.clear()
+
+    def _entry(self, func, *args):
+        key = auto_cache._get_cache_key(func.__source_func__, args, {})
+        return Entry.loads(wrapped_cache.get(auto_cache._add_cache_namespace_to_key(key)))
+
+    def _check(self, name):
+        compressor = get_compressor(name)
+        self.assertIs(get_compressor(compressor.tag), compressor)
+        data = b'abc' * 1000
+        self.assertEqual(compressor.decompress(compressor.compress(data)), data)
+
+    def test_threshold(self):
+        self.assertEqual(text(10000), text(10000))
+        self.assertEqual(text(10), text(10))
+        self.assertEqual(calls, [10000, 10])
+        large = self._entry(text, 10000)
+        self.assertEqual(large.compression, get_compressor('zlib').tag)
+        self.assertLess(len(large.payload), 1000)
+        self.assertEqual(self._entry(text, 10).compression, NO_COMPRESSION)
+
+    def test_incompressible(self):
+        self.assertEqual(noise(1000), noise(1000))
+        self.assertEqual(self._entry(noise, 1000).compression, NO_COMPRESSION)
+
+    def test_stats(self):
+        before = auto_cache.compression_stats()
+        text(10000)
+        text(10000)
+        stats = auto_cache.compression_stats()
+        self.assertGreater(stats['raw_bytes'] - before['raw_bytes'], 10000)
+        self.assertLess(stats['stored_bytes'] - before['stored_bytes'], 1000)
+        self.assertGreater(stats['ratio'], 1)
+        self.assertGreaterEqual(stats['compress_seconds'], before['compress_seconds'])
+        self.assertGreaterEqual(stats['decompress_seconds'], before['decompress_seconds'])
+        self.assertEqual(AutoCache('unittest_compression_off', 3600, DictCache()).compression_stats()['ratio'], 0)
+
+    def test_turned_off(self):
+        text(10000)
+        auto_cache._compressor = None
+        try:
+            # the entry written compressed is still read
+            self.assertEqual(text(10000), 'x' * 10000)
+            text(20000)
+        finally:
+            auto_cache._compressor = get_compressor('zlib')
+        self.assertEqual(calls, [10000, 20000])
+        self.assertEqual(self._entry(text, 20000).compression, NO_COMPRESSION)
+
+    def test_custom(self):
+        compressor = get_compressor(ReverseCompressor())
+        self.assertEqual(compressor.decompress(compressor.compress(b'abcx')), b'abcx')
+        self.assertRaises(ValueError, get_compressor, 'brotli')
+        self.assertRaises(ValueError, register_compressor,
+                          type('Clash', (ReverseCompressor,), {'name': 'clash', 'tag': 1})())
+        self.assertRaises(ValueError, register_compressor,
+                          type('Zero', (ReverseCompressor,), {'name': 'zero', 'tag': 0})())
+
+    def test_codecs(self):
+        self._check('zlib')
+
+    @skipIf(lz4_frame is None, 'lz4 is not installed')
+    def test_lz4(self):
+        self._check('lz4')
+
+    @skipIf(zstandard is None, 'zstandard is not installed')
+    def test_zstd(self):
+        self._check('zstd')
+
+    def test_entry_compression(self):
+        entry = Entry.loads(pickle.dumps([1, 2]))
+        self.assertEqual((entry.codec, entry.compression), (0, NO_COMPRESSION))
+        entry = Entry.loads(Entry.create(zlib.compress(b'data'), codec=3, compression=1).dumps())
+        self.assertEqual((entry.codec, entry.compression, zlib.decompress(entry.payload)), (3, 1, b'data'))
+
+    def test_async(self):
+        loop = asyncio.new_event_loop()
+        try:
+            self.assertEqual(loop.run_until_complete(async_text(1000)), 'y' * 1000)
+            self.assertEqual(loop.run_until_complete(async_text(1000)), 'y' * 1000)
+        finally:
+            loop.close()
+        self.assertEqual(calls, [1000])
+        self.assertEqual(self._entry(async_text, 1000).compression, get_compressor('zlib').tag)
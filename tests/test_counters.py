@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+
+import gc
+import time
+from unittest import TestCase
+
+from py_auto_cache.cache_wrapper import CacheWrapper
+from py_auto_cache.caches import DictCache
+from py_auto_cache.counters import BufferedCounters, _flush_owners, _owners
+
+
+class CountingCache(DictCache):
+    def __init__(self):
+        super(CountingCache, self).__init__()
+        self.increases = 0
+
+    def increase(self, key, amount=1):
+        self.increases += 1
+        return super(CountingCache, self).increase(key, amount)
+
+
+class TestBufferedCounters(TestCase):
+    def test_threshold_and_interval(self):
+        counters = BufferedCounters(flush_interval=0.05, flush_threshold=3)
+        self.assertFalse(counters.add('a'))
+        self.assertFalse(counters.add('b'))
+        self.assertTrue(counters.add('a'))
+        self.assertEqual(counters.take(), {'a': 2, 'b': 1})
+        self.assertFalse(counters.add('a'))
+        time.sleep(0.06)
+        self.assertTrue(counters.add('a'))
+
+    def test_restore(self):
+        counters = BufferedCounters()
+        counters.add('a', 2)
+        counts = counters.take()
+        counters.add('a')
+        counters.restore(counts)
+        self.assertEqual(counters.pending('a'), 3)
+
+
+class TestCacheWrapperCounters(TestCase):
+    def setUp(self):
+        self.cache = CountingCache()
+        self.wrapper = CacheWrapper('unittest_counters', wrapped_cache=self.cache)
+
+    def test_no_round_trip_per_get(self):
+        self.wrapper.set('key', 'value')
+        for _ in range(10):
+            self.wrapper.get('key')
+        self.wrapper.get('missing')
+        self.assertEqual(self.cache.increases, 0)
+        self.assertEqual((self.wrapper.hits(), self.wrapper.misses()), (10, 1))
+
+    def test_merge_flushed_and_pending(self):
+        self.wrapper.set('key', 'value')
+        for _ in range(CacheWrapper.counter_flush_threshold + 5):
+            self.wrapper.get('key')
+        self.assertEqual(self.cache.increases, 1)
+        self.assertEqual(self.wrapper.hits(), CacheWrapper.counter_flush_threshold + 5)
+        self.wrapper.flush_counters()
+        self.assertEqual(self.wrapper._counters.pending(self.wrapper._hits_key), 0)
+        self.assertEqual(self.wrapper.hits(), CacheWrapper.counter_flush_threshold + 5)
+
+    def test_flush_at_exit(self):
+        self.wrapper.get('missing')
+        count = len(_owners)
+        for _ in range(10):
+            CacheWrapper('unittest_counters_short_lived', wrapped_cache=self.cache)
+        gc.collect()
+        # the short-lived wrappers are forgotten, and no handler is registered for them
+        self.assertLessEqual(len(_owners), count)
+        _flush_owners()
+        self.assertEqual(self.wrapper._counters.pending(self.wrapper._misses_key), 0)
+        self.assertEqual(self.wrapper.misses(), 1)
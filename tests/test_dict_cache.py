@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+
+import random
+import threading
+import time
+from unittest import TestCase
+
+from py_auto_cache.caches import DictCache
+from py_auto_cache.caches.dict_cache import ParameterError
+from py_auto_cache.caches.eviction import LFUPolicy
+
+
+class TestBoundedDictCache(TestCase):
+    def test_lru(self):
+        cache = DictCache(max_entries=2)
+        cache.set('a', '1')
+        cache.set('b', '2')
+        cache.get('a')
+        cache.set('c', '3')
+        self.assertEqual(sorted(cache.get_keys()), ['a', 'c'])
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+    def test_lfu(self):
+        cache = DictCache(max_entries=2, eviction='lfu')
+        cache.set('a', '1')
+        cache.set('b', '2')
+        cache.get('a')
+        cache.get('a')
+        cache.get('b')
+        cache.set('c', '3')
+        self.assertEqual(sorted(cache.get_keys()), ['a', 'c'])
+        cache.set('d', '4')
+        self.assertEqual(sorted(cache.get_keys()), ['a', 'd'])
+        cache.delete(['a'])
+        cache.set('e', '5')
+        cache.set('f', '6')
+        self.assertEqual(sorted(cache.get_keys()), ['e', 'f'])
+
+    def test_lfu_policy(self):
+        policy = LFUPolicy()
+        frequencies = {}
+        order = []
+        rand = random.Random(0)
+        for _ in range(2000):
+            key = rand.randrange(20)
+            action = rand.random()
+            if action < 0.4:
+                policy.add(key)
+            elif action < 0.8:
+                policy.touch(key)
+            else:
+                policy.remove(key)
+            # a brute force LFU: the least frequent key, the least recently used among them
+            if action < 0.8 and (key in frequencies or action < 0.4):
+                frequencies[key] = frequencies.get(key, 0) + 1
+                if key in order:
+                    order.remove(key)
+                order.append(key)
+            elif action >= 0.8 and key in frequencies:
+                del frequencies[key]
+                order.remove(key)
+            self.assertEqual(len(policy), len(frequencies))
+            if frequencies:
+                least = min(frequencies.values())
+                self.assertEqual(policy.victim(), next(k for k in order if frequencies[k] == least))
+
+    def test_max_bytes(self):
+        cache = DictCache(max_bytes=10)
+        cache.set('a', '1234')
+        cache.set('b', '1234')
+        self.assertEqual(cache.stats()['bytes'], 10)
+        cache.set('a', '12345')
+        self.assertEqual(cache.get_keys(), ['a'])
+        self.assertEqual(cache.stats(), {'entries': 1, 'bytes': 6, 'max_entries': None, 'max_bytes': 10,
+                                         'evictions': 1, 'expirations': 0})
+        cache.delete(['a'])
+        self.assertEqual(cache.stats()['bytes'], 0)
+
+    def test_unbounded(self):
+        cache = DictCache()
+        for i in range(100):
+            cache.set(str(i), str(i))
+        self.assertEqual(cache.stats()['entries'], 100)
+        self.assertEqual(cache.stats()['evictions'], 0)
+
+
+class TestDictCacheExpiry(TestCase):
+    def test_sweep_on_set(self):
+        # a set sweeps its own shard
+        cache = DictCache(shards=1)
+        for i in range(10):
+            cache.set('dead{}'.format(i), 'x', 0.01)
+        cache.set('alive', 'x', 60)
+        time.sleep(0.02)
+        self.assertEqual(cache.get_keys(), ['alive'])
+        cache.set('other', 'x')
+        self.assertEqual(len(cache._shards[0].dict), 2)
+        self.assertEqual(cache.stats()['expirations'], 10)
+
+    def test_overwrite(self):
+        cache = DictCache(shards=1)
+        cache.set('key', 'old', 0.01)
+        cache.set('key', 'new', 60)
+        time.sleep(0.02)
+        self.assertEqual(cache.sweep(), 0)
+        self.assertEqual(cache.get('key'), 'new')
+        for _ in range(100):
+            cache.set('key', 'new', 60)
+        self.assertLess(len(cache._shards[0]._expiry_heap), 100)
+
+    def test_sweeper_thread(self):
+        cache = DictCache(sweep_interval=0.01, shards=1)
+        cache.set('key', 'x', 0.01)
+        time.sleep(0.05)
+        self.assertEqual(len(cache._shards[0].dict), 0)
+
+
+class TestConcurrentDictCache(TestCase):
+    def _run_threads(self, target, count=16):
+        threads = [threading.Thread(target=target) for _ in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def test_atomic_increase(self):
+        cache = DictCache(shards=8)
+
+        def target():
+            for _ in range(200):
+                cache.increase('counter')
+
+        self._run_threads(target)
+        self.assertEqual(cache.get('counter'), str(16 * 200))
+
+    def test_atomic_only_if_new(self):
+        cache = DictCache(shards=8)
+        results = []
+
+        def target():
+            results.append(cache.set('lease', 'token', 60, only_if_new=True))
+
+        self._run_threads(target)
+        self.assertEqual(results.count(True), 1)
+
+    def test_bounds_split_between_shards(self):
+        cache = DictCache(max_entries=66, shards=4)
+        self.assertEqual([shard._max_entries for shard in cache._shards], [17, 17, 16, 16])
+        for i in range(1000):
+            cache.set(str(i), str(i))
+        self.assertEqual(cache.stats()['entries'], 66)
+        self.assertEqual(cache.stats()['evictions'], 1000 - 66)
+
+    def test_default_shards(self):
+        self.assertEqual(len(DictCache()._shards), DictCache.default_shards)
+        # the eviction order of a bounded cache is exact over all its entries
+        self.assertEqual(len(DictCache(max_entries=100)._shards), 1)
+        self.assertEqual(len(DictCache(max_bytes=100)._shards), 1)
+        self.assertEqual([shard._max_entries for shard in DictCache(max_entries=3, shards=8)._shards], [1, 1, 1])
+
+
+class TestObjectDictCache(TestCase):
+    def test_shared(self):
+        cache = DictCache(max_entries=2, objects=True)
+        value = {'a': [1, 2]}
+        cache.set('key', value)
+        self.assertIs(cache.get('key'), value)
+        cache.multi_set({'number': 1.5})
+        self.assertEqual(cache.get('number'), 1.5)
+        self.assertEqual(cache.increase('count', 2), '2')
+        self.assertEqual(cache.stats()['entries'], 2)
+
+    def test_copies(self):
+        cache = DictCache(objects=True, copy_objects=True)
+        value = {'a': [1, 2]}
+        cache.set('key', value)
+        value['a'].append(3)
+        read = cache.get('key')
+        self.assertEqual(read, {'a': [1, 2]})
+        read['a'].append(4)
+        self.assertEqual(cache.get('key'), {'a': [1, 2]})
+
+    def test_max_bytes(self):
+        self.assertRaises(ParameterError, DictCache, max_bytes=10, objects=True)
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+
+from unittest import TestCase
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+from py_auto_cache.auto_cache import AutoCache
+from py_auto_cache.caches import DictCache
+from py_auto_cache.entry import Entry
+
+auto_cache = AutoCache('unittest_early_recompute', 60, DictCache())
+
+run_times = 0
+
+
+@auto_cache.decorator(early_recompute=1.0)
+def counter():
+    global run_times
+    run_times += 1
+    return run_times
+
+
+class TestEarlyRecompute(TestCase):
+    def setUp(self):
+        global run_times
+        run_times = 0
+        auto_cache.clear()
+
+    def test_should_recompute(self):
+        entry = Entry.create(b'payload', hard_expiry=60, time_cost=1, now=0)
+        with mock.patch('random.random', return_value=1 - 0.5):
+            # -log(0.5) is about 0.69 seconds before the expiry for a one second computation
+            self.assertFalse(entry.should_recompute(1.0, now=59))
+            self.assertTrue(entry.should_recompute(1.0, now=59.5))
+            # bigger beta, earlier recomputation
+            self.assertTrue(entry.should_recompute(10.0, now=55))
+        self.assertFalse(Entry.create(b'payload', hard_expiry=60, time_cost=0, now=0).should_recompute(now=59.9))
+        self.assertFalse(Entry.create(b'payload', time_cost=1, now=0).should_recompute(now=1e10))
+
+    def test_recompute_before_expiry(self):
+        self.assertEqual(counter(), 1)
+        with mock.patch('py_auto_cache.entry.Entry.should_recompute', return_value=False):
+            self.assertEqual(counter(), 1)
+        with mock.patch('py_auto_cache.entry.Entry.should_recompute', return_value=True):
+            self.assertEqual(counter(), 2)
+        self.assertEqual(counter(), 2)
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+from unittest import TestCase
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+from py_auto_cache.caches import FileCache
+from py_auto_cache.caches.file_cache import get_md5
+
+
+class TestFileCacheIndex(TestCase):
+    def setUp(self):
+        self.cache_root = tempfile.mkdtemp()
+        self.cache = FileCache(self.cache_root)
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_root)
+
+    def test_get_keys_without_reading_buckets(self):
+        self.cache.set('a:1', 'value')
+        self.cache.set('a:2', 'value', 0.01)
+        self.cache.set('b:1', 'value')
+        self.cache.delete(['b:1'])
+        time.sleep(0.02)
+        with mock.patch.object(FileCache, '_read', side_effect=AssertionError('bucket read')):
+            self.assertEqual(self.cache.get_keys('a:*'), ['a:1'])
+            self.assertEqual(self.cache.memory_size(['a:1', 'b:1']), len('a:1') + len('value'))
+
+    def test_shared_between_processes(self):
+        other = FileCache(self.cache_root)
+        self.assertEqual(other.get_keys(), [])
+        self.cache.set('key', 'value')
+        self.assertEqual(other.get_keys(), ['key'])
+        other.delete(['key'])
+        self.assertEqual(self.cache.get_keys(), [])
+
+    def test_build_index_of_old_cache_root(self):
+        self.cache.set('key', 'value')
+        os.remove(os.path.join(self.cache_root, FileCache.index_name))
+        self.assertEqual(FileCache(self.cache_root).get_keys(), ['key'])
+
+    def test_compact_index(self):
+        self.cache.index_slack = 10
+        for i in range(30):
+            self.cache.set('key', str(i))
+        # the journal has been rewritten by the writes
+        with open(os.path.join(self.cache_root, FileCache.index_name)) as f:
+            lines = [json.loads(line) for line in f]
+        self.assertLess(len(lines), 30)
+        self.assertEqual(FileCache(self.cache_root).get_keys(), ['key'])
+        self.assertEqual(self.cache.get('key'), '29')
+
+
+def _increase(cache_root, count):
+    cache = FileCache(cache_root)
+    for _ in range(count):
+        cache.increase('counter')
+
+
+class TestFileCacheLayout(TestCase):
+    def setUp(self):
+        self.cache_root = tempfile.mkdtemp()
+        self.cache = FileCache(self.cache_root)
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_root)
+
+    def test_fan_out(self):
+        self.cache.set('key', 'value')
+        md5 = get_md5('key')
+        bucket_dir = os.path.join(self.cache_root, md5[:2], md5[2:4])
+        self.assertEqual(os.listdir(bucket_dir), [md5])
+        # one lock for all the buckets of the directory
+        self.assertTrue(os.path.isfile(bucket_dir + FileCache.lock_suffix))
+        self.assertEqual(self.cache.get('key'), 'value')
+
+    def test_migrate_flat_layout(self):
+        def flatten(key):
+            md5 = get_md5(key)
+            flat_fp = os.path.join(self.cache_root, md5)
+            os.rename(os.path.join(self.cache_root, md5[:2], md5[2:4], md5), flat_fp)
+            open(flat_fp + FileCache.lock_suffix, 'a').close()
+            return flat_fp
+
+        for key in ('a', 'b', 'c'):
+            self.cache.set(key, 'old')
+        flat_fps = [flatten(key) for key in ('a', 'b')]
+        self.cache.set('b', 'new')
+        self.cache.set('d', 'new')
+        flat_fps.append(flatten('d'))
+        os.remove(os.path.join(self.cache_root, FileCache.index_name))
+
+        cache = FileCache(self.cache_root)
+        self.assertEqual(sorted(fn for fn in os.listdir(self.cache_root) if not fn.startswith('.')),
+                         sorted(set(get_md5(key)[:2] for key in 'abcd')))
+        self.assertEqual([cache.get(key) for key in 'abcd'], ['old', 'new', 'old', 'new'])
+        self.assertEqual(sorted(cache.get_keys()), ['a', 'b', 'c', 'd'])
+        cache.clear()
+        self.assertEqual(cache.get_keys(), [])
+        self.assertEqual([cache.get(key) for key in 'abcd'], [None] * 4)
+
+    def test_atomic_increase_between_processes(self):
+        processes = [multiprocessing.Process(target=_increase, args=(self.cache_root, 50)) for _ in range(4)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        self.assertEqual(self.cache.get('counter'), '200')
+        self.assertEqual(self.cache.get_keys(), ['counter'])
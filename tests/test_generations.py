@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+from unittest import TestCase
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+from py_auto_cache.auto_cache import AutoCache
+from py_auto_cache.caches import DictCache
+
+wrapped_cache = DictCache()
+auto_cache = AutoCache('unittest_generations', 3600, wrapped_cache)
+
+calls = []
+
+
+@auto_cache.decorator
+def double(value):
+    calls.append(('double', value))
+    return value * 2
+
+
+@auto_cache.decorator
+def triple(value):
+    calls.append(('triple', value))
+    return value * 3
+
+
+@auto_cache.decorator
+async def async_double(value):
+    calls.append(('async_double', value))
+    return value * 2
+
+
+class TestGenerations(TestCase):
+    def setUp(self):
+        del calls[:]
+        auto_cache.clear()
+
+    def test_invalidate_namespace(self):
+        auto_cache.set('key', 'value')
+        double(1)
+        raw_keys = wrapped_cache.get_keys(auto_cache._add_cache_namespace_to_key('*'))
+        generation = auto_cache.invalidate()
+        self.assertEqual(auto_cache.invalidate(), generation + 1)
+
+        self.assertIsNone(auto_cache.get('key'))
+        self.assertEqual(auto_cache.get_keys(), [])
+        self.assertEqual(double(1), 2)
+        self.assertEqual(calls, [('double', 1), ('double', 1)])
+        # the former keys are still there, until they expire
+        self.assertEqual(wrapped_cache.multi_get(raw_keys).count(None), 0)
+
+        auto_cache.clear()
+        self.assertEqual(wrapped_cache.multi_get(raw_keys), [None] * len(raw_keys))
+
+    def test_invalidate_function(self):
+        double(1)
+        triple(1)
+        self.assertEqual(double.invalidate(), 1)
+        self.assertEqual(auto_cache.invalidate_function(double), 2)
+        double(1)
+        triple(1)
+        self.assertEqual(calls, [('double', 1), ('triple', 1), ('double', 1)])
+        self.assertEqual(double.many([1, 2]), [2, 4])
+        self.assertEqual(calls[-1], ('double', 2))
+
+    def test_other_process(self):
+        other = AutoCache('unittest_generations', 3600, wrapped_cache)
+        auto_cache.set('key', 'value')
+        self.assertEqual(other.get('key'), 'value')
+        auto_cache.invalidate()
+        # other reads the generation again after generation_ttl
+        self.assertEqual(other.get('key'), 'value')
+        with mock.patch('time.time', return_value=other._generations[other._generation_key][1]):
+            self.assertIsNone(other.get('key'))
+
+    def test_one_read(self):
+        double(1)
+        with mock.patch.object(wrapped_cache, 'multi_get', wraps=wrapped_cache.multi_get) as multi_get:
+            double(1)
+            double(2)
+            self.assertEqual(multi_get.call_count, 0)
+            auto_cache._generations.clear()
+            double(1)
+            self.assertEqual(multi_get.call_count, 1)
+
+    def test_async(self):
+        loop = asyncio.new_event_loop()
+        try:
+            self.assertEqual(loop.run_until_complete(async_double(1)), 2)
+            async_double.invalidate()
+            auto_cache._generations.clear()
+            self.assertEqual(loop.run_until_complete(async_double(1)), 2)
+            self.assertEqual(loop.run_until_complete(async_double(1)), 2)
+        finally:
+            loop.close()
+        self.assertEqual(calls, [('async_double', 1), ('async_double', 1)])
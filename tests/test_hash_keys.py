@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+from unittest import TestCase
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+from py_auto_cache.auto_cache import AutoCache
+from py_auto_cache.caches import DictCache
+
+auto_cache = AutoCache('unittest_hash_keys', 3600, DictCache(), hash_keys=True, keep_key_args=True)
+plain_cache = AutoCache('unittest_plain_keys', 3600, DictCache())
+
+calls = []
+
+
+@auto_cache.decorator
+def join(*args, **kwargs):
+    calls.append(args)
+    return '-'.join(args) + repr(sorted(kwargs.items()))
+
+
+@auto_cache.decorator
+async def async_join(*args):
+    calls.append(args)
+    return '-'.join(args)
+
+
+@plain_cache.decorator
+def plain_join(*args):
+    return '-'.join(args)
+
+
+normalized_cache = AutoCache('unittest_short_keys', 3600, DictCache(), hash_keys=True, normalize_keys=True)
+
+
+@normalized_cache.decorator
+def short_join(*args):
+    return '-'.join(args)
+
+
+class CustomKeyCache(AutoCache):
+    def _get_cache_key(self, func, args, kwargs):
+        return 'custom-{}'.format(len(args))
+
+
+custom_cache = CustomKeyCache('unittest_custom_keys', 3600, DictCache(), hash_keys=True)
+
+
+@custom_cache.decorator
+def custom_join(*args):
+    calls.append(args)
+    return '-'.join(args)
+
+
+class TestHashKeys(TestCase):
+    def setUp(self):
+        del calls[:]
+        auto_cache.clear()
+
+    def test_key_size(self):
+        large = 'x' * 10000
+        self.assertEqual(join(large, 'a', c=1), join(large, 'a', c=1))
+        self.assertEqual(calls, [(large, 'a')])
+        key, = auto_cache.get_keys()
+        self.assertEqual(len(key), len(join.__source_func__.__full_cache_prefix__) + 32)
+        self.assertNotEqual(auto_cache._get_cache_key(join.__source_func__, (large, 'b'), {}), key)
+
+        plain_join(large)
+        plain_key, = plain_cache.get_keys()
+        self.assertGreater(len(plain_key), 10000)
+
+    def test_key_args(self):
+        join('a', 'b', c=1)
+        key, = auto_cache.get_keys()
+        self.assertEqual(auto_cache.key_args(key), repr([('a', 'b'), {'c': 1}]))
+        self.assertIsNone(plain_cache.key_args(key))
+
+    def test_bytes_saved(self):
+        saved = auto_cache.key_bytes_saved()
+        join('y' * 1000)
+        join.many([('z' * 1000,)])
+        self.assertGreater(auto_cache.key_bytes_saved() - saved, 2 * (1000 - 32))
+        self.assertEqual(len(auto_cache.get_keys()), 2)
+        self.assertEqual(sorted(filter(None, map(auto_cache.key_args, auto_cache.get_keys()))),
+                         [repr([('y' * 1000,), {}]), repr([('z' * 1000,), {}])])
+
+    def test_short_args(self):
+        normalized_cache.clear()
+        saved = normalized_cache.key_bytes_saved()
+        short_join('a')
+        key, = normalized_cache.get_keys()
+        self.assertTrue(key.endswith(normalized_cache._encode_key_params(short_join.__source_func__, ('a',), {})))
+        self.assertEqual(normalized_cache.key_bytes_saved(), saved)
+        short_join('a' * 100)
+        self.assertGreater(normalized_cache.key_bytes_saved(), saved)
+
+    def test_overridden_key(self):
+        custom_cache.clear()
+        self.assertEqual(custom_join('a', 'b'), 'a-b')
+        self.assertEqual(custom_join('c', 'd'), 'a-b')
+        custom_join.many([('e',)])
+        self.assertEqual(calls, [('a', 'b'), ('e',)])
+        self.assertEqual(sorted(custom_cache.get_keys()), ['custom-1', 'custom-2'])
+        self.assertEqual(custom_cache.key_bytes_saved(), 0)
+
+    def test_encoded_once(self):
+        encode = auto_cache._encode_key_params
+        with mock.patch.object(auto_cache, '_encode_key_params', side_effect=encode) as encoded:
+            join('a', 'b')
+            self.assertEqual(encoded.call_count, 1)
+            join('a', 'b')
+            self.assertEqual(encoded.call_count, 2)
+            join.many(['c', 'd'])
+            self.assertEqual(encoded.call_count, 4)
+            loop = asyncio.new_event_loop()
+            try:
+                loop.run_until_complete(async_join('e'))
+            finally:
+                loop.close()
+            self.assertEqual(encoded.call_count, 5)
+        self.assertEqual(calls, [('a', 'b'), ('c',), ('d',), ('e',)])
+
+    def test_async(self):
+        loop = asyncio.new_event_loop()
+        try:
+            self.assertEqual(loop.run_until_complete(async_join('a', 'b')), 'a-b')
+            self.assertEqual(loop.run_until_complete(async_join('a', 'b')), 'a-b')
+        finally:
+            loop.close()
+        self.assertEqual(calls, [('a', 'b')])
+        key, = auto_cache.get_keys()
+        self.assertEqual(auto_cache.key_args(key), repr([('a', 'b'), {}]))
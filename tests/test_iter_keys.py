@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import shutil
+import tempfile
+import types
+from unittest import TestCase
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+from py_auto_cache.async_cache import AsyncCache, ThreadedCache, wrap_async_client_exception
+from py_auto_cache.auto_cache import AutoCache
+from py_auto_cache.caches import DictCache, FileCache, RedisCache, SqliteCache
+from py_auto_cache.error import ClientError
+from py_auto_cache.util import chunks, wrap_client_exception
+
+
+class ScanningCache(AsyncCache):
+    """
+    An AsyncCache over a dict which can only be scanned
+    """
+
+    def __init__(self, values):
+        self.values = values
+        self.deleted = []
+
+    async def get(self, key):
+        return self.values.get(key)
+
+    async def set(self, key, value, expire_seconds=None, only_if_new=False, only_if_old=False):
+        self.values[key] = value
+
+    async def delete(self, keys):
+        self.deleted.append(list(keys))
+        return sum(1 for key in keys if self.values.pop(key, None) is not None)
+
+    async def get_keys(self, pattern='*'):
+        raise AssertionError('the whole keyspace must not be loaded')
+
+    async def iter_keys(self, pattern='*', batch=None):
+        for key in sorted(self.values):
+            if key.startswith(pattern.rstrip('*')):
+                yield key
+
+
+class TestIterKeys(TestCase):
+    def setUp(self):
+        self.cache_root = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_root)
+
+    def _check(self, cache):
+        cache.multi_set(dict(('key{}'.format(i), str(i)) for i in range(25)))
+        cache.set('other', '1')
+        keys = cache.iter_keys('key*', batch=4)
+        self.assertIsInstance(keys, types.GeneratorType)
+        self.assertEqual(sorted(keys), sorted('key{}'.format(i) for i in range(25)))
+        self.assertEqual(len(cache.get_keys()), 26)
+
+        cache.scan_batch = 3
+        self.assertEqual(cache.clear('key*'), 25)
+        self.assertEqual(cache.get_keys(), ['other'])
+
+    def test_caches(self):
+        self._check(DictCache(shards=4))
+        self._check(FileCache('{}/file'.format(self.cache_root)))
+        sqlite_cache = SqliteCache('{}/sqlite'.format(self.cache_root))
+        self._check(sqlite_cache)
+        sqlite_cache.close()
+
+    def test_sqlite_pages(self):
+        cache = SqliteCache('{}/sqlite'.format(self.cache_root))
+        cache.multi_set({'': 'empty', 'a': '1', 'b': '2', 'c': '3'})
+        self.assertEqual(list(cache.iter_keys(batch=2)), ['', 'a', 'b', 'c'])
+        self.assertEqual(list(cache.iter_keys('[!a]', batch=1)), ['b', 'c'])
+        cache.close()
+
+    def test_cache_wrapper(self):
+        auto_cache = AutoCache('unittest_iter_keys', 3600, DictCache())
+        auto_cache.clear()
+        for i in range(10):
+            auto_cache.set('key{}'.format(i), 'x', time_cost=i)
+        self.assertEqual(sorted(auto_cache.iter_keys('key[0-4]', batch=2)), ['key0', 'key1', 'key2', 'key3', 'key4'])
+        auto_cache._wrapped_cache.scan_batch = 3
+        self.assertEqual(auto_cache.time_cost_average(), 4.5)
+        self.assertEqual(auto_cache.memory_size(), sum(
+            len(auto_cache._add_cache_namespace_to_key(key)) + 1 for key in auto_cache.get_keys()))
+        auto_cache.clear()
+        self.assertEqual(auto_cache.get_keys(), [])
+
+    def test_redis_scans(self):
+        cache = RedisCache()
+        keys = [b'key1', b'key2', b'key3']
+        with mock.patch.object(cache._redis, 'scan_iter', return_value=iter(keys)) as scan_iter, \
+                mock.patch.object(cache._redis, 'keys') as redis_keys:
+            self.assertEqual(list(cache.iter_keys('key*', batch=2)), keys)
+            scan_iter.assert_called_once_with('key*', 2)
+            self.assertFalse(redis_keys.called)
+
+        cache.scan_batch = 2
+        with mock.patch.object(cache._redis, 'scan_iter', return_value=iter(keys)), \
+                mock.patch.object(cache._redis, 'unlink', side_effect=lambda *keys: len(keys)) as unlink:
+            self.assertEqual(cache.clear('key*'), 3)
+            self.assertEqual(unlink.call_args_list, [mock.call(b'key1', b'key2'), mock.call(b'key3')])
+
+    def test_generator_errors(self):
+        @wrap_client_exception(ValueError)
+        def generate():
+            yield 1
+            raise ValueError('broken')
+
+        iterator = generate()
+        self.assertEqual(next(iterator), 1)
+        self.assertRaises(ClientError, next, iterator)
+
+    def test_chunks(self):
+        self.assertEqual(list(chunks(range(5), 2)), [[0, 1], [2, 3], [4]])
+        self.assertEqual(list(chunks([], 2)), [])
+
+    def test_async(self):
+        loop = asyncio.new_event_loop()
+
+        async def collect(keys):
+            return [key async for key in keys]
+
+        try:
+            cache = ThreadedCache(DictCache(shards=4))
+            loop.run_until_complete(cache.multi_set(dict(('key{}'.format(i), str(i)) for i in range(25))))
+            self.assertEqual(sorted(loop.run_until_complete(collect(cache.iter_keys('key*', batch=4)))),
+                             sorted('key{}'.format(i) for i in range(25)))
+
+            scanning_cache = ScanningCache(dict(('key{}'.format(i), str(i)) for i in range(5)))
+            scanning_cache.values['other'] = '1'
+            scanning_cache.scan_batch = 2
+            self.assertEqual(loop.run_until_complete(scanning_cache.clear('key*')), 5)
+            self.assertEqual(scanning_cache.deleted, [['key0', 'key1'], ['key2', 'key3'], ['key4']])
+            self.assertEqual(list(scanning_cache.values), ['other'])
+
+            @wrap_async_client_exception(ValueError)
+            async def generate():
+                yield 1
+                raise ValueError('broken')
+
+            self.assertRaises(ClientError, loop.run_until_complete, collect(generate()))
+        finally:
+            loop.close()
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+
+from collections import namedtuple
+from unittest import TestCase
+
+from py_auto_cache.auto_cache import AutoCache
+from py_auto_cache.caches import DictCache
+from py_auto_cache.keys import KeyBuilder, encode
+
+auto_cache = AutoCache('unittest_keys', 3600, DictCache(), normalize_keys=True)
+
+Point = namedtuple('Point', 'x y')
+
+calls = []
+
+
+@auto_cache.decorator
+def area(width, height=1, unit='m'):
+    calls.append((width, height, unit))
+    return '{}{}2'.format(width * height, unit)
+
+
+@auto_cache.decorator(key=lambda user_id, verbose=False: user_id)
+def profile(user_id, verbose=False):
+    calls.append(user_id)
+    return user_id
+
+
+class TestEncode(TestCase):
+    def test_types(self):
+        values = [None, True, False, 1, 1.0, '1', b'1', (1,), [1], {1: 1}, {1}, frozenset([1]), 0, '', ()]
+        self.assertEqual(len(set(encode(value) for value in values)), len(values))
+
+    def test_canonical(self):
+        self.assertEqual(encode({'a': 1, 'b': [2, 3]}), encode({'b': [2, 3], 'a': 1}))
+        self.assertEqual(encode({3, 1, 2}), encode({2, 3, 1}))
+        self.assertNotEqual(encode(('ab', 'c')), encode(('a', 'bc')))
+        self.assertNotEqual(encode([1, [2]]), encode([[1], 2]))
+
+    def test_pickle_fallback(self):
+        self.assertEqual(encode(Point(1, 2)), encode(Point(1, 2)))
+        self.assertNotEqual(encode(Point(1, 2)), encode((1, 2)))
+        self.assertTrue(encode(Point(1, 2)).startswith('p'))
+
+
+class TestKeyBuilder(TestCase):
+    def test_plain(self):
+        def func(a, b=2, c=None):
+            pass
+
+        builder = KeyBuilder(func)
+        key = builder.build((1,), {})
+        self.assertEqual(builder.build((1, 2), {}), key)
+        self.assertEqual(builder.build((1,), {'b': 2}), key)
+        self.assertEqual(builder.build((), {'c': None, 'a': 1}), key)
+        self.assertNotEqual(builder.build((1, 3), {}), key)
+
+    def test_refused_calls(self):
+        def func(a, b=2):
+            pass
+
+        builder = KeyBuilder(func)
+        refused = [builder.build((), {}), builder.build((1, 2, 3), {}), builder.build((1,), {'d': 4}),
+                   builder.build((1,), {'a': 1})]
+        self.assertEqual(len(set(refused)), 4)
+        self.assertNotIn(builder.build((1,), {}), refused)
+
+    def test_signature(self):
+        def func(a, *args, b=2, **kwargs):
+            pass
+
+        builder = KeyBuilder(func)
+        self.assertEqual(builder.build((1,), {}), builder.build((), {'a': 1, 'b': 2}))
+        self.assertEqual(builder.build((1,), {'x': 1, 'y': 2}), builder.build((1,), {'y': 2, 'x': 1}))
+        self.assertNotEqual(builder.build((1, 2), {}), builder.build((1,), {}))
+
+    def test_no_signature(self):
+        builder = KeyBuilder(dict.fromkeys)
+        self.assertEqual(builder.build((1,), {}), builder.build((1,), {}))
+
+
+class TestNormalizedKeys(TestCase):
+    def setUp(self):
+        del calls[:]
+        auto_cache.clear()
+
+    def test_hits(self):
+        self.assertEqual(area(2), '2m2')
+        self.assertEqual(area(2, 1), '2m2')
+        self.assertEqual(area(2, height=1, unit='m'), '2m2')
+        self.assertEqual(area(width=2), '2m2')
+        self.assertEqual(area(2, 3), '6m2')
+        self.assertEqual(calls, [(2, 1, 'm'), (2, 3, 'm')])
+        self.assertEqual(len(auto_cache.get_keys()), 2)
+
+    def test_bind_key(self):
+        profile(1)
+        profile(1, verbose=True)
+        self.assertEqual(calls, [1])
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+
+import multiprocessing
+import shutil
+import tempfile
+import threading
+import time
+from unittest import TestCase
+
+from py_auto_cache.auto_cache import AutoCache
+from py_auto_cache.caches import DictCache
+from py_auto_cache.caches.file_cache import FileCache
+
+shared_cache = DictCache()
+# two AutoCache objects over one cache act like two processes sharing a redis server
+workers = [AutoCache('unittest_lease', 3600, shared_cache) for _ in range(2)]
+
+run_times = 0
+
+
+def slow(*args):
+    global run_times
+    run_times += 1
+    time.sleep(0.2)
+    return args
+
+
+def failing(*args):
+    global run_times
+    run_times += 1
+    time.sleep(0.1)
+    raise RuntimeError('failing')
+
+
+def _set_only_if_new(cache_root, results):
+    results.put(FileCache(cache_root).set('lease', 'token', 10, only_if_new=True))
+
+
+class TestLease(TestCase):
+    def setUp(self):
+        global run_times
+        run_times = 0
+        workers[0].clear()
+
+    def _run_workers(self, func, lease_timeout):
+        decorated = [worker.decorator(func, lease_timeout=lease_timeout) for worker in workers]
+        results = []
+        errors = []
+
+        def target(f):
+            try:
+                results.append(f(1))
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=target, args=(decorated[i % 2],)) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results, errors
+
+    def test_lease_holder_computes(self):
+        results, errors = self._run_workers(slow, 5)
+        self.assertEqual(errors, [])
+        self.assertEqual(results, [(1,)] * 8)
+        self.assertEqual(run_times, 1)
+        self.assertEqual(shared_cache.get_keys('*:lease'), [])
+
+    def test_lease_released_on_failure(self):
+        results, errors = self._run_workers(failing, 5)
+        self.assertEqual(len(errors), 8)
+        # every worker retries after the holder fails, but never two of them at the same time
+        self.assertEqual(run_times, 2)
+        self.assertEqual(shared_cache.get_keys('*:lease'), [])
+
+    def test_file_cache_only_if_new(self):
+        cache_root = tempfile.mkdtemp()
+        try:
+            results = multiprocessing.Queue()
+            processes = [multiprocessing.Process(target=_set_only_if_new, args=(cache_root, results))
+                         for _ in range(8)]
+            for process in processes:
+                process.start()
+            for process in processes:
+                process.join()
+            self.assertEqual(sorted(results.get() for _ in processes), [False] * 7 + [True])
+            self.assertEqual(FileCache(cache_root).get_keys(), ['lease'])
+        finally:
+            shutil.rmtree(cache_root)
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+from unittest import TestCase
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+from py_auto_cache.auto_cache import AutoCache
+from py_auto_cache.caches import DictCache
+from py_auto_cache.serializers import get_serializer
+
+auto_cache = AutoCache('unittest_local_objects', 3600, DictCache(), local_objects=2)
+object_cache = AutoCache('unittest_objects', 3600, DictCache(objects=True))
+copy_cache = AutoCache('unittest_object_copies', 3600, DictCache(objects=True, copy_objects=True))
+
+calls = []
+
+
+@auto_cache.decorator
+def rows(count):
+    calls.append(count)
+    return [{'id': i} for i in range(count)]
+
+
+@copy_cache.decorator
+def copied_rows(count):
+    calls.append(count)
+    return [{'id': i} for i in range(count)]
+
+
+@object_cache.decorator
+def live_rows(count):
+    calls.append(count)
+    return [{'id': i} for i in range(count)]
+
+
+@auto_cache.decorator
+async def async_rows(count):
+    calls.append(count)
+    return [{'id': i} for i in range(count)]
+
+
+class TestLocalObjects(TestCase):
+    def setUp(self):
+        del calls[:]
+        for cache in (auto_cache, copy_cache, object_cache):
+            cache.clear()
+
+    def _loads(self):
+        return mock.patch.object(get_serializer('pickle'), 'loads', wraps=get_serializer('pickle').loads)
+
+    def test_shared(self):
+        rows(3)
+        with self._loads() as loads:
+            first = rows(3)
+            self.assertIs(rows(3), first)
+            self.assertEqual(rows.many([3, 3]), [first, first])
+            self.assertEqual(loads.call_count, 1)
+        self.assertEqual(first, [{'id': 0}, {'id': 1}, {'id': 2}])
+        self.assertEqual(calls, [3])
+
+    def test_rewritten(self):
+        first = rows(2)
+        rows(2)
+        # a new entry has a new etag, its result is read again
+        rows(2, update_auto_cache=True)
+        with self._loads() as loads:
+            self.assertIsNot(rows(2), first)
+            self.assertEqual(loads.call_count, 1)
+
+    def test_bounded(self):
+        for count in (1, 2, 3):
+            rows(count)
+            rows(count)
+        self.assertEqual(auto_cache._local_objects.stats()['entries'], 2)
+
+    def test_copies(self):
+        first = copied_rows(2)
+        first.append('changed')
+        second = copied_rows(2)
+        self.assertEqual(second, [{'id': 0}, {'id': 1}])
+        second.append('changed')
+        self.assertEqual(copied_rows(2), [{'id': 0}, {'id': 1}])
+        self.assertEqual(calls, [2])
+
+    def test_object_mode(self):
+        with mock.patch.object(get_serializer('pickle'), 'dumps') as dumps:
+            first = live_rows(2)
+            self.assertIs(live_rows(2), first)
+            self.assertEqual(live_rows.many([2, 3]), [first, [{'id': 0}, {'id': 1}, {'id': 2}]])
+            self.assertEqual(dumps.call_count, 0)
+        self.assertEqual(calls, [2, 3])
+        self.assertIsNone(object_cache._local_objects)
+        self.assertGreaterEqual(object_cache.time_cost_average(), 0)
+        live_rows.invalidate()
+        live_rows(2)
+        self.assertEqual(calls, [2, 3, 2])
+
+    def test_async(self):
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(async_rows(2))
+            first = loop.run_until_complete(async_rows(2))
+            self.assertIs(loop.run_until_complete(async_rows(2)), first)
+        finally:
+            loop.close()
+        self.assertEqual(calls, [2])
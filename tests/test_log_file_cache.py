@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+import time
+from unittest import TestCase
+
+from py_auto_cache.auto_cache import AutoCache
+from py_auto_cache.caches import LogFileCache
+from py_auto_cache.caches.log_file_cache import _FLAG_DELETED, LockedError, _scan
+
+
+class TestLogFileCache(TestCase):
+    def setUp(self):
+        self.cache_root = tempfile.mkdtemp()
+        self.cache = LogFileCache(self.cache_root, segment_size=1024)
+
+    def tearDown(self):
+        self.cache.close()
+        shutil.rmtree(self.cache_root)
+
+    def reopen(self):
+        self.cache.close()
+        self.cache = LogFileCache(self.cache_root, segment_size=1024)
+
+    def test_binary_and_text(self):
+        self.cache.set('binary', b'\x80\x00\xff')
+        self.cache.set('text', u'中文')
+        self.assertEqual(self.cache.get('binary'), b'\x80\x00\xff')
+        self.assertEqual(self.cache.get('text'), u'中文')
+        self.assertEqual(self.cache.increase('counter', 2), '2')
+        self.assertEqual(self.cache.increase('counter', 2), '4')
+
+    def test_rebuild_index(self):
+        self.cache.set('a', 'old')
+        self.cache.set('a', 'new')
+        self.cache.set('b', 'deleted')
+        self.cache.delete(['b'])
+        self.cache.set('c', 'expired', 0.01)
+        time.sleep(0.02)
+        self.reopen()
+        self.assertEqual(sorted(self.cache.get_keys()), ['a'])
+        self.assertEqual(self.cache.get('a'), 'new')
+        self.assertIsNone(self.cache.get('b'))
+
+    def test_truncate_broken_record(self):
+        self.cache.set('a', 'value')
+        self.cache.close()
+        path = os.path.join(self.cache_root, '0000000001.log')
+        with open(path, 'ab') as f:
+            f.write(b'half written record')
+        self.cache = LogFileCache(self.cache_root, segment_size=1024)
+        self.assertEqual(self.cache.get('a'), 'value')
+        self.cache.set('b', 'value')
+        self.reopen()
+        self.assertEqual(sorted(self.cache.get_keys()), ['a', 'b'])
+
+    def test_compaction(self):
+        for i in range(50):
+            self.cache.set('deleted{}'.format(i), 'x' * 50)
+        self.cache.set('kept', 'value')
+        # the background compactor may start as soon as keys are deleted
+        before = self.cache.stats()
+        self.assertGreater(before['segments'], 2)
+        self.cache.delete(['deleted{}'.format(i) for i in range(50)])
+        self.cache.compact()
+        after = self.cache.stats()
+        self.assertLess(after['bytes'], before['bytes'])
+        self.assertEqual(self.cache.get('kept'), 'value')
+        self.reopen()
+        self.assertEqual(self.cache.get_keys(), ['kept'])
+
+    def _tombstones(self):
+        count = 0
+        for name in os.listdir(self.cache_root):
+            if name.endswith('.log'):
+                with open(os.path.join(self.cache_root, name), 'rb') as f:
+                    count += sum(1 for record in _scan(f) if record[4] & _FLAG_DELETED)
+        return count
+
+    def test_tombstones_collected(self):
+        # an older segment of live keys only, never compacted
+        kept = 0
+        while self.cache.stats()['segments'] == 1:
+            self.cache.set('kept{}'.format(kept), 'x' * 50)
+            kept += 1
+        for i in range(24):
+            self.cache.set('deleted{}'.format(i), 'x' * 50)
+        self.cache.delete(['deleted{}'.format(i) for i in range(24)])
+        self.cache.compact()
+        self.assertGreater(self._tombstones(), 0)
+        # seal the segments of the tombstones, their deleted records are gone already
+        for i in range(24):
+            self.cache.set('new{}'.format(i), 'x' * 50)
+        self.cache.compact()
+        self.assertEqual(self._tombstones(), 0)
+        self.reopen()
+        self.assertEqual(len(self.cache.get_keys('deleted*')), 0)
+        self.assertEqual(len(self.cache.get_keys()), kept + 24)
+
+    def test_tombstones_kept(self):
+        # the first segment keeps a record of the deleted key, and is never compacted
+        self.cache.set('shadowed', 'x' * 50)
+        kept = 0
+        while self.cache.stats()['segments'] == 1:
+            self.cache.set('kept{}'.format(kept), 'x' * 50)
+            kept += 1
+        self.cache.delete(['shadowed'])
+        # the segment of the tombstone is full of garbage, and compacted
+        for i in range(24):
+            self.cache.set('deleted{}'.format(i), 'x' * 50)
+        self.cache.delete(['deleted{}'.format(i) for i in range(24)])
+        self.cache.compact()
+        self.assertTrue(os.path.isfile(os.path.join(self.cache_root, '0000000001.log')))
+        self.reopen()
+        self.assertIsNone(self.cache.get('shadowed'))
+        self.assertEqual(len(self.cache.get_keys()), kept)
+
+    def test_one_process_per_root(self):
+        self.assertRaises(LockedError, LogFileCache, self.cache_root)
+
+    def test_auto_cache(self):
+        auto_cache = AutoCache('unittest_log_file', 3600, self.cache)
+
+        @auto_cache.decorator
+        def run(*args):
+            return args
+
+        self.assertEqual(run(1, 2), (1, 2))
+        self.assertEqual(run(1, 2), (1, 2))
+        self.assertEqual(auto_cache.hits(), 1)
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from unittest import TestCase
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+from py_auto_cache.auto_cache import AutoCache
+from py_auto_cache.caches import DictCache
+from py_auto_cache.error import DoNotCacheException
+
+auto_cache = AutoCache('unittest_many', 3600, DictCache())
+
+calls = []
+
+
+@auto_cache.decorator
+def square(value):
+    calls.append(value)
+    if value < 0:
+        raise DoNotCacheException(None)
+    if value == 13:
+        raise ValueError('unlucky')
+    return value * value
+
+
+@auto_cache.decorator
+def add(a, b):
+    calls.append((a, b))
+    return a + b
+
+
+@auto_cache.decorator
+async def async_square(value):
+    calls.append(value)
+    await asyncio.sleep(0.01)
+    return value * value
+
+
+class TestMany(TestCase):
+    def setUp(self):
+        del calls[:]
+        auto_cache.clear()
+
+    def test_many(self):
+        self.assertEqual(square(2), 4)
+        with mock.patch.object(DictCache, 'multi_get', wraps=auto_cache._wrapped_cache.multi_get) as multi_get:
+            self.assertEqual(square.many([3, 2, 1, 3]), [9, 4, 1, 9])
+            self.assertEqual(multi_get.call_count, 1)
+        # 2 was cached, 3 is computed once
+        self.assertEqual(calls, [2, 3, 1])
+        self.assertEqual(square.many([1, 2, 3]), [1, 4, 9])
+        self.assertEqual(calls, [2, 3, 1])
+        self.assertEqual(square(3), 9)
+        self.assertEqual(len(calls), 3)
+
+    def test_positional_args(self):
+        self.assertEqual(add.many([(1, 2), (3, 4)]), [3, 7])
+        self.assertEqual(add(1, 2), 3)
+        self.assertEqual(calls, [(1, 2), (3, 4)])
+
+    def test_update_auto_cache(self):
+        square.many([1, 2])
+        self.assertEqual(square.many([1, 2], update_auto_cache=True), [1, 4])
+        self.assertEqual(calls, [1, 2, 1, 2])
+
+    def test_executor(self):
+        with ThreadPoolExecutor(4) as executor:
+            self.assertEqual(square.many(range(10), executor=executor), [i * i for i in range(10)])
+        self.assertEqual(sorted(calls), list(range(10)))
+        self.assertEqual(square.many(range(10)), [i * i for i in range(10)])
+        self.assertEqual(len(calls), 10)
+
+    def test_process_pool(self):
+        with ProcessPoolExecutor(2) as executor:
+            self.assertEqual(add.many([(1, 2), (3, 4)], executor=executor), [3, 7])
+        # the calls happened in the workers, and their results are cached here
+        self.assertEqual(calls, [])
+        self.assertEqual(add.many([(1, 2), (3, 4)]), [3, 7])
+        self.assertEqual(calls, [])
+
+    def test_process_pool_locals(self):
+        @auto_cache.decorator
+        def local_add(a, b):
+            return a + b
+
+        with ProcessPoolExecutor(1) as executor:
+            with self.assertRaises(ValueError) as raised:
+                local_add.many([(1, 2)], executor=executor)
+        self.assertIn('<locals>', str(raised.exception))
+        with ThreadPoolExecutor(1) as executor:
+            self.assertEqual(local_add.many([(1, 2)], executor=executor), [3])
+
+    def test_do_not_cache(self):
+        self.assertEqual(square.many([-1, 1]), [None, 1])
+        self.assertEqual(square.many([-1, 1]), [None, 1])
+        self.assertEqual(calls, [-1, 1, -1])
+
+    def test_errors(self):
+        with self.assertRaises(ValueError):
+            square.many([1, 13, 2])
+        # the other results are cached anyway
+        self.assertEqual(square.many([1, 2]), [1, 4])
+        self.assertEqual(calls, [1, 13, 2])
+
+    def test_counters(self):
+        hits, misses = auto_cache.hits(), auto_cache.misses()
+        square.many([1, 2])
+        square.many([1, 2, 3])
+        self.assertEqual(auto_cache.hits() - hits, 2)
+        self.assertEqual(auto_cache.misses() - misses, 3)
+
+    def test_async(self):
+        loop = asyncio.new_event_loop()
+        try:
+            self.assertEqual(loop.run_until_complete(async_square.many([1, 2, 1])), [1, 4, 1])
+            self.assertEqual(loop.run_until_complete(async_square.many([2, 3], concurrency=1)), [4, 9])
+        finally:
+            loop.close()
+        self.assertEqual(calls, [1, 2, 3])
+
+    def test_keyword_options(self):
+        with ThreadPoolExecutor(1) as executor:
+            self.assertRaises(TypeError, square.many, [1], executor)
+        self.assertRaises(TypeError, square.many, [1], True)
+        self.assertRaises(TypeError, square.many, [1], concurrency=1)
+        loop = asyncio.new_event_loop()
+        try:
+            self.assertRaises(TypeError, async_square.many, [1], True)
+            self.assertEqual(loop.run_until_complete(async_square.many([1], update_auto_cache=True)), [1])
+        finally:
+            loop.close()
+        self.assertEqual(square.many([1], update_auto_cache=True), [1])
+        self.assertEqual(calls, [1, 1])
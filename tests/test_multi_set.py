@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+
+import shutil
+import tempfile
+import time
+from unittest import TestCase
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+from py_auto_cache.auto_cache import AutoCache
+from py_auto_cache.caches import DictCache, FileCache, LogFileCache, SharedMemoryCache, SqliteCache
+
+
+class TestMultiSet(TestCase):
+    def setUp(self):
+        self.cache_root = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_root)
+
+    def _check(self, cache):
+        mapping = dict(('key{}'.format(i), str(i)) for i in range(20))
+        self.assertTrue(cache.multi_set(mapping))
+        self.assertTrue(cache.multi_set({'short': 'x'}, 0.01))
+        self.assertEqual(cache.multi_get(sorted(mapping)), [mapping[key] for key in sorted(mapping)])
+        time.sleep(0.02)
+        self.assertIsNone(cache.get('short'))
+        self.assertEqual(cache.multi_delete(['key1', 'missing', 'key2', 'key1']), [True, False, True, False])
+        self.assertEqual(len(cache.get_keys('key*')), 18)
+
+    def test_caches(self):
+        self._check(DictCache(shards=4))
+        self._check(FileCache('{}/file'.format(self.cache_root)))
+        sqlite_cache = SqliteCache('{}/sqlite'.format(self.cache_root), batch_size=3)
+        self._check(sqlite_cache)
+        sqlite_cache.close()
+        log_file_cache = LogFileCache('{}/log'.format(self.cache_root))
+        self._check(log_file_cache)
+        log_file_cache.close()
+        shared_memory_cache = SharedMemoryCache('{}/shm'.format(self.cache_root), size=64 * 1024)
+        self._check(shared_memory_cache)
+        shared_memory_cache.close()
+
+    def test_file_cache_writes_a_bucket_once(self):
+        cache = FileCache(self.cache_root)
+        keys = ['key{}'.format(i) for i in range(50)]
+        # all the keys in one bucket
+        with mock.patch.object(FileCache, '_get_fp', lambda self, key: '{}/bucket'.format(self._cache_root)):
+            with mock.patch.object(FileCache, '_write_many', wraps=cache._write_many) as write_many:
+                cache.multi_set(dict((key, 'value') for key in keys))
+                self.assertEqual(write_many.call_count, 1)
+                self.assertEqual(cache.multi_delete(keys), [True] * 50)
+                self.assertEqual(write_many.call_count, 2)
+
+    def test_auto_cache(self):
+        auto_cache = AutoCache('unittest_multi_set', 3600, DictCache())
+        auto_cache.multi_set({'a': '1', 'b': '2'}, time_costs={'a': 0.5})
+        self.assertEqual(sorted(auto_cache.get_keys()), ['a', 'b'])
+        self.assertEqual(auto_cache.time_cost_average(), 0.25)
+        self.assertEqual(auto_cache.multi_delete(['a', 'c']), [True, False])
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import shutil
+import tempfile
+from unittest import TestCase
+
+from py_auto_cache.async_cache import ThreadedCache
+from py_auto_cache.auto_cache import AutoCache
+from py_auto_cache.caches import DictCache, FileCache, LogFileCache, SharedMemoryCache, SqliteCache
+
+
+class RecordingCache(DictCache):
+    def __init__(self):
+        super(RecordingCache, self).__init__()
+        self.pipelines = []
+
+    def _execute_pipeline(self, commands):
+        self.pipelines.append([name for name, _ in commands])
+        return super(RecordingCache, self)._execute_pipeline(commands)
+
+
+class TestPipeline(TestCase):
+    def setUp(self):
+        self.cache_root = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_root)
+
+    def _check(self, cache):
+        cache.set('deleted', 'x')
+        with cache.pipeline() as pipe:
+            pipe.set('a', '1')
+            pipe.set('a', '2', only_if_new=True)
+            pipe.increase('counter', 3)
+            pipe.delete(['deleted'])
+            pipe.delete([])
+        self.assertEqual(list(pipe.results), [True, False, '3', 1, 0])
+        self.assertEqual(cache.multi_get(['a', 'counter', 'deleted']), ['1', '3', None])
+
+    def test_caches(self):
+        self._check(DictCache(shards=4))
+        self._check(FileCache('{}/file'.format(self.cache_root)))
+        sqlite_cache = SqliteCache('{}/sqlite'.format(self.cache_root))
+        self._check(sqlite_cache)
+        sqlite_cache.close()
+        log_file_cache = LogFileCache('{}/log'.format(self.cache_root))
+        self._check(log_file_cache)
+        log_file_cache.close()
+        shared_memory_cache = SharedMemoryCache('{}/shm'.format(self.cache_root), size=64 * 1024)
+        self._check(shared_memory_cache)
+        shared_memory_cache.close()
+
+    def test_not_executed_on_error(self):
+        cache = DictCache()
+        try:
+            with cache.pipeline() as pipe:
+                pipe.set('a', '1')
+                raise KeyError('a')
+        except KeyError:
+            pass
+        self.assertIsNone(cache.get('a'))
+
+    def test_auto_cache_set(self):
+        cache = RecordingCache()
+        auto_cache = AutoCache('unittest_pipeline', 3600, cache)
+
+        @auto_cache.decorator
+        def run(*args):
+            return args
+
+        run(1)
+        self.assertEqual(cache.pipelines, [['set', 'set']])
+
+    def test_async(self):
+        async def main():
+            cache = ThreadedCache(DictCache())
+            pipe = cache.pipeline()
+            pipe.set('a', '1')
+            pipe.increase('a')
+            return await pipe.execute()
+
+        loop = asyncio.new_event_loop()
+        try:
+            self.assertEqual(loop.run_until_complete(main()), [True, '2'])
+        finally:
+            loop.close()
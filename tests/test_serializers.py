@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+
+import pickle
+from unittest import TestCase, skipIf
+
+from py_auto_cache.auto_cache import AutoCache
+from py_auto_cache.caches import DictCache
+from py_auto_cache.entry import Entry
+from py_auto_cache.serializers import Serializer, get_serializer, msgpack, register_serializer
+
+auto_cache = AutoCache('unittest_serializers', 3600, DictCache(), serializer='marshal')
+
+calls = []
+
+
+@auto_cache.decorator
+def rows(count):
+    calls.append(count)
+    return [{'id': i, 'name': 'row{}'.format(i)} for i in range(count)]
+
+
+@auto_cache.decorator(serializer='json')
+def json_rows(count):
+    calls.append(count)
+    return [{'id': i} for i in range(count)]
+
+
+class ReprSerializer(Serializer):
+    tag = 200
+    name = 'repr'
+
+    def dumps(self, value):
+        return repr(value).encode('utf-8')
+
+    def loads(self, data):
+        return eval(data.decode('utf-8'))
+
+
+class TestSerializers(TestCase):
+    def setUp(self):
+        del calls[:]
+        auto_cache.clear()
+
+    def _check(self, name, value):
+        serializer = get_serializer(name)
+        self.assertIs(get_serializer(serializer.tag), serializer)
+        self.assertEqual(serializer.loads(serializer.dumps(value)), value)
+
+    def test_round_trip(self):
+        value = [{'id': 1, 'name': u'caf\xe9', 'score': 1.5, 'tags': ['a', 'b'], 'parent': None}]
+        for name in ('pickle', 'marshal', 'json'):
+            self._check(name, value)
+
+    @skipIf(msgpack is None, 'msgpack is not installed')
+    def test_msgpack(self):
+        self._check('msgpack', {'id': 1, 'data': b'\x00\x01', 'tags': ['a']})
+
+    def test_unknown(self):
+        self.assertRaises(ValueError, get_serializer, 'yaml')
+        self.assertRaises(ValueError, register_serializer, type('Clash', (ReprSerializer,), {'name': 'clash', 'tag': 0})())
+
+    def test_codec_tag(self):
+        self.assertEqual(rows(2), rows(2))
+        self.assertEqual(json_rows(2), json_rows(2))
+        self.assertEqual(calls, [2, 2])
+        raw_values = auto_cache._wrapped_cache.multi_get(
+            [auto_cache._add_cache_namespace_to_key(key) for key in sorted(auto_cache.get_keys())])
+        self.assertEqual(sorted(Entry.loads(value).codec for value in raw_values),
+                         [get_serializer('marshal').tag, get_serializer('json').tag])
+
+    def test_change_without_flush(self):
+        rows(3)
+        func = rows.__source_func__
+        func.__serializer__ = get_serializer(ReprSerializer())
+        # the entry written by marshal is still read
+        self.assertEqual(rows(3), [{'id': i, 'name': 'row{}'.format(i)} for i in range(3)])
+        rows(4)
+        self.assertEqual(rows(4), [{'id': i, 'name': 'row{}'.format(i)} for i in range(4)])
+        self.assertEqual(calls, [3, 4])
+        func.__serializer__ = get_serializer('marshal')
+
+    def test_entry_codec(self):
+        self.assertEqual(Entry.loads(Entry.create(b'data', codec=3).dumps()).codec, 3)
+        # a bare pickle written before entries existed
+        self.assertEqual(Entry.loads(pickle.dumps([1, 2])).codec, 0)
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import time
+from unittest import TestCase
+
+from py_auto_cache.auto_cache import AutoCache
+from py_auto_cache.caches import SharedMemoryCache
+
+
+def _increase(cache, count):
+    for _ in range(count):
+        cache.increase('counter')
+
+
+class TestSharedMemoryCache(TestCase):
+    def setUp(self):
+        self.cache_root = tempfile.mkdtemp()
+        self.path = os.path.join(self.cache_root, 'shm')
+        self.cache = SharedMemoryCache(self.path, size=64 * 1024, slots=64, max_item_size=4096)
+
+    def tearDown(self):
+        self.cache.close()
+        shutil.rmtree(self.cache_root)
+
+    def test_binary_and_text(self):
+        self.cache.set('binary', b'\x80\x00\xff')
+        self.cache.set('text', u'中文')
+        self.assertEqual(self.cache.get('binary'), b'\x80\x00\xff')
+        self.assertEqual(self.cache.get('text'), u'中文')
+        self.assertIsNone(self.cache.get('missing'))
+        self.assertFalse(self.cache.set('large', 'x' * 5000))
+
+    def test_only_if_and_expiry(self):
+        self.assertFalse(self.cache.set('key', 'old', only_if_old=True))
+        self.assertTrue(self.cache.set('key', 'new', 0.01, only_if_new=True))
+        self.assertFalse(self.cache.set('key', 'other', only_if_new=True))
+        time.sleep(0.02)
+        self.assertIsNone(self.cache.get('key'))
+        self.assertEqual(self.cache.get_keys(), [])
+        self.assertTrue(self.cache.set('key', 'again', only_if_new=True))
+
+    def test_reuse_slots_and_chunks(self):
+        for i in range(1000):
+            self.cache.set('key{}'.format(i % 10), 'x' * (i % 300))
+            if i % 3 == 0:
+                self.cache.delete(['key{}'.format(i % 10)])
+        self.assertLessEqual(self.cache.stats()['entries'], 10)
+        self.assertEqual(self.cache.stats()['evictions'], 0)
+        self.assertEqual(self.cache.get('key8'), 'x' * 98)
+        self.assertIsNone(self.cache.get('key9'))
+
+    def test_evict_by_entries_and_bytes(self):
+        for i in range(100):
+            self.cache.get('hot')
+            self.cache.set('hot' if i == 0 else 'key{}'.format(i), 'x')
+        self.assertEqual(len(self.cache.get_keys()), 48)
+        self.assertEqual(self.cache.get('hot'), 'x')
+
+        for i in range(100):
+            self.assertTrue(self.cache.set('large{}'.format(i), 'x' * 4000))
+        self.assertLessEqual(self.cache.stats()['bytes'], 64 * 1024)
+        self.assertEqual(self.cache.get('large99'), 'x' * 4000)
+
+    def test_clear(self):
+        for key in ('a:1', 'a:2', 'b:1'):
+            self.cache.set(key, 'value')
+        self.assertEqual(self.cache.clear('a:*'), 2)
+        self.assertEqual(self.cache.get_keys(), ['b:1'])
+        self.assertEqual(self.cache.clear(), 1)
+        self.assertEqual(self.cache.stats()['bytes'], 0)
+
+    def test_consistent_reads(self):
+        errors = []
+        stop = threading.Event()
+
+        def read():
+            while not stop.is_set():
+                value = self.cache.get('key')
+                if value is not None and len(set(value)) != 1:
+                    errors.append(value)
+
+        readers = [threading.Thread(target=read) for _ in range(4)]
+        for reader in readers:
+            reader.start()
+        for i in range(2000):
+            self.cache.set('key', ('a' if i % 2 else 'b') * (i % 500 + 1))
+        stop.set()
+        for reader in readers:
+            reader.join()
+        self.assertEqual(errors, [])
+
+    def test_shared_between_processes(self):
+        processes = [multiprocessing.Process(target=_increase, args=(self.cache, 50)) for _ in range(4)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        self.assertEqual(self.cache.get('counter'), '200')
+        other = SharedMemoryCache(self.path)
+        self.assertEqual(other.get('counter'), '200')
+        other.close()
+
+    def test_auto_cache(self):
+        auto_cache = AutoCache('unittest_shared_memory', 3600, self.cache)
+
+        @auto_cache.decorator
+        def run(*args):
+            return args
+
+        self.assertEqual(run(1, 2), (1, 2))
+        self.assertEqual(run(1, 2), (1, 2))
+        self.assertEqual(auto_cache.hits(), 1)
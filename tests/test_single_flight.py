@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+
+import threading
+import time
+from unittest import TestCase
+
+from py_auto_cache.auto_cache import AutoCache
+from py_auto_cache.caches import DictCache
+from py_auto_cache.single_flight import SingleFlight
+
+auto_cache = AutoCache('unittest_single_flight', 3600, DictCache())
+
+run_times = 0
+
+
+@auto_cache.decorator
+def slow(*args):
+    global run_times
+    run_times += 1
+    time.sleep(0.2)
+    return args
+
+
+@auto_cache.decorator(wait_timeout=0.01)
+def slow_with_timeout(*args):
+    global run_times
+    run_times += 1
+    time.sleep(0.2)
+    return args
+
+
+@auto_cache.decorator
+def broken():
+    time.sleep(0.2)
+    raise RuntimeError('broken')
+
+
+def _call_concurrently(func, count, *args):
+    results = []
+    errors = []
+
+    def target():
+        try:
+            results.append(func(*args))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=target) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, errors
+
+
+class TestSingleFlight(TestCase):
+    def setUp(self):
+        global run_times
+        run_times = 0
+        auto_cache.clear()
+
+    def test_coalesce_misses(self):
+        results, errors = _call_concurrently(slow, 20, 1)
+        self.assertEqual(errors, [])
+        self.assertEqual(results, [(1,)] * 20)
+        self.assertEqual(run_times, 1)
+        self.assertGreater(auto_cache.coalesced(), 0)
+
+    def test_wait_timeout(self):
+        results, errors = _call_concurrently(slow_with_timeout, 5, 2)
+        self.assertEqual(errors, [])
+        self.assertEqual(results, [(2,)] * 5)
+        self.assertGreater(run_times, 1)
+
+    def test_share_exception(self):
+        results, errors = _call_concurrently(broken, 5)
+        self.assertEqual(results, [])
+        self.assertEqual(len(errors), 5)
+        self.assertTrue(all(isinstance(error, RuntimeError) for error in errors))
+
+    def test_in_flight(self):
+        single_flight = SingleFlight()
+        self.assertEqual(single_flight.do('key', lambda: 1), (1, False))
+        self.assertEqual(single_flight.in_flight(), 0)
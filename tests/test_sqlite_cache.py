@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+from unittest import TestCase
+
+from py_auto_cache.auto_cache import AutoCache
+from py_auto_cache.caches import SqliteCache
+from py_auto_cache.caches.sqlite_cache import SqliteClientError
+
+
+def _increase(db_path, count):
+    cache = SqliteCache(db_path)
+    for _ in range(count):
+        cache.increase('counter')
+
+
+class TestSqliteCache(TestCase):
+    def setUp(self):
+        self.cache_root = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.cache_root, 'cache.sqlite')
+        self.cache = SqliteCache(self.db_path, batch_size=2)
+
+    def tearDown(self):
+        self.cache.close()
+        shutil.rmtree(self.cache_root)
+
+    def test_binary_and_text(self):
+        self.cache.set('binary', b'\x80\x00\xff')
+        self.cache.set('text', u'中文')
+        self.assertEqual(self.cache.get('binary'), b'\x80\x00\xff')
+        self.assertEqual(self.cache.get('text'), u'中文')
+        self.assertIsNone(self.cache.get('missing'))
+
+    def test_only_if(self):
+        self.assertFalse(self.cache.set('key', 'old', only_if_old=True))
+        self.assertTrue(self.cache.set('key', 'new', 0.01, only_if_new=True))
+        self.assertFalse(self.cache.set('key', 'other', only_if_new=True))
+        time.sleep(0.02)
+        self.assertTrue(self.cache.set('key', 'again', only_if_new=True))
+        self.assertTrue(self.cache.set('key', 'old', only_if_old=True))
+        self.assertEqual(self.cache.get('key'), 'old')
+
+    def test_expiry(self):
+        self.cache.set('dead', 'x', 0.01)
+        self.cache.set('alive', 'x')
+        time.sleep(0.02)
+        self.assertIsNone(self.cache.get('dead'))
+        self.assertEqual(self.cache.get_keys(), ['alive'])
+        self.assertEqual(self.cache.purge(), 1)
+
+    def test_batched_keys(self):
+        for i in range(5):
+            self.cache.set('key{}'.format(i), str(i))
+        keys = ['key4', 'missing', 'key0', 'key2', 'key3']
+        self.assertEqual(self.cache.multi_get(keys), ['4', None, '0', '2', '3'])
+        self.assertEqual(self.cache.memory_size(['key1', 'key2']), 10)
+        self.assertEqual(self.cache.delete(keys), 4)
+        self.assertEqual(self.cache.get_keys(), ['key1'])
+
+    def test_patterns(self):
+        for key in ('a:1', 'a:2', 'a:x', 'b:1'):
+            self.cache.set(key, 'value')
+        self.assertEqual(sorted(self.cache.get_keys('a:*')), ['a:1', 'a:2', 'a:x'])
+        self.assertEqual(sorted(self.cache.get_keys('?:1')), ['a:1', 'b:1'])
+        self.assertEqual(sorted(self.cache.get_keys('a:[!0-9]')), ['a:x'])
+        self.assertEqual(self.cache.clear('a:*'), 3)
+        self.assertEqual(self.cache.get_keys(), ['b:1'])
+
+    def test_increase(self):
+        self.assertEqual(self.cache.increase('counter', 2), '2')
+        self.cache.set('ttl', '1', 60)
+        self.assertEqual(self.cache.increase('ttl'), '2')
+        self.assertEqual(self.cache.get_keys('ttl'), ['ttl'])
+        self.cache.set('text', 'abc')
+        self.assertRaises(SqliteClientError, self.cache.increase, 'text')
+
+    def test_pipeline(self):
+        with self.cache.pipeline() as pipe:
+            pipe.set('value', 'v', 60)
+            pipe.set('lease', 'l', 60, True)
+            pipe.increase('counter')
+        self.assertEqual(pipe.results, [True, True, '1'])
+        self.assertEqual(self.cache.get('value'), 'v')
+
+        # a failed write rolls back the ones before it
+        self.cache.set('text', 'abc')
+        with self.assertRaises(SqliteClientError):
+            with self.cache.pipeline() as pipe:
+                pipe.set('value', 'new')
+                pipe.increase('text')
+        self.assertEqual(self.cache.get('value'), 'v')
+        self.assertEqual(self.cache.increase('counter'), '2')
+
+    def test_atomic_increase_between_processes(self):
+        processes = [multiprocessing.Process(target=_increase, args=(self.db_path, 50)) for _ in range(4)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        self.assertEqual(self.cache.get('counter'), '200')
+
+    def test_auto_cache(self):
+        auto_cache = AutoCache('unittest_sqlite', 3600, self.cache)
+
+        @auto_cache.decorator
+        def run(*args):
+            return args
+
+        self.assertEqual(run(1, 2), (1, 2))
+        self.assertEqual(run(1, 2), (1, 2))
+        self.assertEqual(auto_cache.hits(), 1)
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+
+import pickle
+import threading
+import time
+from unittest import TestCase
+
+from py_auto_cache.auto_cache import AutoCache
+from py_auto_cache.caches import DictCache
+from py_auto_cache.entry import MAGIC, VERSION, Entry
+from py_auto_cache.refresh_pool import RefreshPool
+
+auto_cache = AutoCache('unittest_swr', 3600, DictCache())
+
+run_times = 0
+
+
+@auto_cache.decorator(soft_expiry=0.3)
+def counter():
+    global run_times
+    run_times += 1
+    time.sleep(0.05)
+    return run_times
+
+
+class TestStaleWhileRevalidate(TestCase):
+    def setUp(self):
+        global run_times
+        run_times = 0
+        auto_cache.clear()
+
+    def test_return_stale_and_refresh(self):
+        self.assertEqual(counter(), 1)
+        self.assertEqual(counter(), 1)
+        time.sleep(0.35)
+        # stale result is returned at once, only one refresh is queued
+        self.assertEqual(counter(), 1)
+        self.assertEqual(counter(), 1)
+        time.sleep(0.15)
+        self.assertEqual(counter(), 2)
+        self.assertEqual(run_times, 2)
+        stats = auto_cache.refresh_stats()
+        self.assertEqual(stats['succeeded'], 1)
+        self.assertEqual(stats['pending'], 0)
+
+    def test_entry_format(self):
+        entry = Entry.create(b'payload', 10, 60, 0.5, now=100)
+        loaded = Entry.loads(entry.dumps())
+        self.assertEqual(loaded.payload, b'payload')
+        self.assertEqual((loaded.soft_expire_at, loaded.hard_expire_at, loaded.time_cost), (110, 160, 0.5))
+        self.assertTrue(loaded.is_stale(110))
+        self.assertFalse(loaded.is_stale(109))
+
+        legacy = Entry.loads(b'\x80legacy pickle')
+        self.assertEqual(legacy.payload, b'\x80legacy pickle')
+        self.assertFalse(legacy.is_stale())
+
+        self.assertIsNone(Entry.loads(entry.dumps().replace(MAGIC + bytearray([VERSION]), MAGIC + b'\x09', 1)))
+
+    def test_other_formats(self):
+        wrapped_cache = auto_cache._wrapped_cache
+        key = auto_cache._get_cache_key(counter.__source_func__, (), {})
+        # a worker of the version before entries keeps reading and writing bare pickles
+        baseline_key = auto_cache._add_namespace_to_key(key, 'cache')
+        wrapped_cache.set(baseline_key, pickle.dumps(42))
+        self.assertEqual(counter(), 1)
+        self.assertEqual(pickle.loads(wrapped_cache.get(baseline_key)), 42)
+        self.assertEqual(pickle.loads(Entry.loads(wrapped_cache.get(baseline_key)).payload), 42)
+
+        # a value of an unknown version is a miss, and is replaced
+        raw_key = auto_cache._add_cache_namespace_to_key(key)
+        wrapped_cache.set(raw_key, MAGIC + b'\x09' + b'\x00' * 40)
+        self.assertEqual(counter(), 2)
+        self.assertEqual(counter(), 2)
+        self.assertEqual(Entry.loads(wrapped_cache.get(raw_key)).codec, 0)
+        wrapped_cache.delete([baseline_key])
+
+
+class TestRefreshPool(TestCase):
+    def test_deduplicate_and_drop(self):
+        pool = RefreshPool(max_workers=1, max_queue_size=1)
+        blocker = threading.Event()
+        self.assertTrue(pool.submit('running', blocker.wait))
+        time.sleep(0.05)
+        self.assertTrue(pool.submit('queued', lambda: None))
+        self.assertFalse(pool.submit('queued', lambda: None))
+        self.assertFalse(pool.submit('dropped', lambda: None))
+        stats = pool.stats()
+        self.assertEqual((stats['queued'], stats['pending']), (1, 2))
+        self.assertEqual((stats['deduplicated'], stats['dropped']), (1, 1))
+        blocker.set()
+        time.sleep(0.05)
+        self.assertEqual(pool.stats()['succeeded'], 2)
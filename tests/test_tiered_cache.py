@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+
+import time
+from unittest import TestCase, skipIf
+
+from py_auto_cache.caches import DictCache, RedisCache, RedisInvalidator, TieredCache
+
+
+def _redis_server_missing():
+    try:
+        RedisCache(timeout=0.1).get('ping')
+    except Exception:
+        return True
+    return False
+
+
+class LocalInvalidator(object):
+    """
+    Deliver the messages to the other invalidators of a list, like a pub/sub channel does
+    """
+
+    def __init__(self, channel):
+        self._channel = channel
+        self._on_invalidate = None
+        channel.append(self)
+
+    def start(self, on_invalidate, on_reset):
+        self._on_invalidate = on_invalidate
+        on_reset()
+
+    def publish(self, keys=None, pattern=None):
+        for invalidator in self._channel:
+            if invalidator is not self:
+                invalidator._on_invalidate(keys, pattern)
+
+    def close(self):
+        self._channel.remove(self)
+
+
+class TestTieredCache(TestCase):
+    def setUp(self):
+        self.l2 = DictCache()
+        channel = []
+        self.cache = TieredCache(self.l2, invalidator=LocalInvalidator(channel))
+        self.other = TieredCache(self.l2, invalidator=LocalInvalidator(channel))
+
+    def test_read_through(self):
+        self.l2.set('key', 'value')
+        self.assertEqual(self.cache.get('key'), 'value')
+        self.assertEqual(self.cache.get('key'), 'value')
+        self.assertIsNone(self.cache.get('missing'))
+        self.assertEqual(self.cache.multi_get(['key', 'missing', 'other']), ['value', None, None])
+        stats = self.cache.stats()
+        self.assertEqual((stats['l1_hits'], stats['l2_hits'], stats['misses']), (2, 1, 3))
+        self.assertEqual(stats['l1_hit_ratio'], 2.0 / 6)
+        self.assertEqual(stats['l2_hit_ratio'], 1.0 / 4)
+
+    def test_invalidate_other_processes(self):
+        self.cache.set('key', 'old')
+        self.assertEqual(self.other.get('key'), 'old')
+        self.cache.set('key', 'new')
+        self.assertEqual(self.other.get('key'), 'new')
+        self.cache.increase('counter')
+        self.assertEqual(self.other.get('counter'), '1')
+        self.cache.increase('counter')
+        self.assertEqual(self.other.get('counter'), '2')
+        self.cache.delete(['key'])
+        self.assertIsNone(self.other.get('key'))
+        self.other.set('a:1', 'value')
+        self.assertEqual(self.cache.get('a:1'), 'value')
+        self.other.clear('a:*')
+        self.assertIsNone(self.cache.get('a:1'))
+        self.assertEqual(self.other.stats()['invalidations'], 6)
+
+    def test_short_expiry_without_invalidator(self):
+        cache = TieredCache(self.l2, l1_expiry=0.01)
+        self.l2.set('key', 'old')
+        self.assertEqual(cache.get('key'), 'old')
+        self.l2.set('key', 'new')
+        self.assertEqual(cache.get('key'), 'old')
+        time.sleep(0.02)
+        self.assertEqual(cache.get('key'), 'new')
+
+    def test_failed_write(self):
+        self.cache.set('lease', 'mine')
+        self.other.get('lease')
+        self.assertFalse(self.other.set('lease', 'theirs', only_if_new=True))
+        self.assertEqual(self.other.get('lease'), 'mine')
+
+
+@skipIf(_redis_server_missing(), 'needs a redis server on localhost')
+class TestRedisInvalidator(TestCase):
+    def test_invalidate(self):
+        l2 = RedisCache()
+        cache = TieredCache(l2, invalidator=RedisInvalidator(channel='unittest_invalidate'))
+        other = TieredCache(l2, invalidator=RedisInvalidator(channel='unittest_invalidate'))
+        try:
+            cache.set('unittest_tiered', 'old')
+            self.assertEqual(other.get('unittest_tiered'), b'old')
+            cache.set('unittest_tiered', 'new')
+            time.sleep(0.1)
+            self.assertEqual(other.get('unittest_tiered'), b'new')
+        finally:
+            cache.delete(['unittest_tiered'])
+            cache.close()
+            other.close()